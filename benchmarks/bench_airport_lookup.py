@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for city -> IATA resolution.
+
+Compares the original per-call CSV scan with the in-memory airport index,
+and the k-d tree nearest-airport query with a brute-force distance scan.
+Run from the repository root:
+
+    python benchmarks/bench_airport_lookup.py
+"""
+
+import csv
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.airport_index import DEFAULT_CSV_PATH, EARTH_RADIUS_KM, AirportIndex  # noqa: E402
+from utils.flight_api import city_to_iata  # noqa: E402
+
+CITIES = ["New York", "London", "Tokyo", "Goroka", "Paris", "Nowhereville", "Sydney", "Chicago"]
+# (lat, lon) of places that aren't airport cities themselves
+POINTS = [(40.68, -73.94), (51.51, -0.13), (-6.73, 146.99), (35.69, 139.69), (-33.87, 151.21), (64.13, -21.9)]
+
+
+def scan_city_to_iata(city: str, csv_path: str = DEFAULT_CSV_PATH) -> str:
+    """The pre-index implementation: walk the whole CSV on every call."""
+    city = city.strip().lower()
+    with open(csv_path, newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if row['city'].strip().lower() == city and row['iata']:
+                return row['iata']
+    return None
+
+
+def scan_nearest(index: AirportIndex, lat: float, lon: float, radius_km: float = 100):
+    """Brute force: haversine distance to every IATA airport."""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    best = None
+    for airport in index.by_iata.values():
+        lat2, lon2 = math.radians(airport.latitude), math.radians(airport.longitude)
+        h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        distance = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+        if distance <= radius_km and (best is None or distance < best[1]):
+            best = (airport, distance)
+    return best
+
+
+def lookups_per_second(func, args=CITIES, min_seconds: float = 1.0) -> float:
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_seconds:
+        for arg in args:
+            func(arg)
+        calls += len(args)
+        elapsed = time.perf_counter() - start
+    return calls / elapsed
+
+
+def main():
+    for city in CITIES:
+        assert scan_city_to_iata(city) == city_to_iata(city), city
+
+    start = time.perf_counter()
+    index = AirportIndex.from_csv(DEFAULT_CSV_PATH)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    before = lookups_per_second(scan_city_to_iata)
+    after = lookups_per_second(city_to_iata)
+
+    print(f"Index build:        {build_ms:10.1f} ms ({len(index)} airports)")
+    print(f"CSV scan:           {before:10.0f} lookups/s")
+    print(f"Airport index:      {after:10.0f} lookups/s")
+    print(f"Speedup:            {after / before:10.0f}x")
+
+    for lat, lon in POINTS:
+        expected = scan_nearest(index, lat, lon)
+        found = index.nearest_airports(lat, lon, 1, 100)
+        assert (expected[0] if expected else None) == (found[0][0] if found else None), (lat, lon)
+
+    scan = lookups_per_second(lambda p: scan_nearest(index, *p), POINTS)
+    tree = lookups_per_second(lambda p: index.nearest_airports(p[0], p[1], 1, 100), POINTS)
+    print(f"Nearest (scan):     {scan:10.0f} lookups/s")
+    print(f"Nearest (k-d tree): {tree:10.0f} lookups/s")
+    print(f"Speedup:            {tree / scan:10.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Compare cache hit latency across the memory, SQLite and Redis-protocol backends.
+
+The Redis backend talks to the in-process RESP stand-in unless --redis-url
+points at a real server. Run from the repository root:
+
+    python benchmarks/bench_cache_backends.py
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.cache_backends import MISSING, MemoryBackend, RedisBackend, SQLiteBackend, encode_value  # noqa: E402
+import resp_server  # noqa: E402
+
+# Roughly the shape and size of a cached WeatherAPI response
+PAYLOAD = {
+    "location": {"name": "London", "region": "City of London, Greater London", "country": "United Kingdom",
+                 "lat": 51.52, "lon": -0.11, "tz_id": "Europe/London", "localtime": "2024-01-15 10:30"},
+    "current": {"temp_f": 48.2, "temp_c": 9.0, "condition": {"text": "Partly cloudy", "code": 1003},
+                "wind_mph": 11.9, "humidity": 76, "cloud": 50, "feelslike_f": 43.9, "uv": 2.0,
+                "pressure_mb": 1012.0, "precip_mm": 0.0, "vis_km": 10.0, "gust_mph": 16.4},
+    "weather_score": 55,
+    "error": None,
+    "status": "success",
+}
+
+
+def bench_hits(backend, keys, rounds):
+    for key in keys:
+        backend.set(key, PAYLOAD, 3600)
+    samples = []
+    for _ in range(rounds):
+        for key in keys:
+            start = time.perf_counter()
+            value = backend.get(key)
+            samples.append(time.perf_counter() - start)
+            assert value is not MISSING
+    samples.sort()
+    return {
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p99_us": samples[int(len(samples) * 0.99)] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--redis-url", default=None)
+    args = parser.parse_args()
+
+    redis_url = args.redis_url or f"redis://127.0.0.1:{resp_server.start_in_thread()}/0"
+    keys = [f"weather:city-{i}" for i in range(args.keys)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [
+            MemoryBackend(maxsize=args.keys),
+            SQLiteBackend(os.path.join(tmp, "cache.sqlite3"), maxsize=args.keys),
+            RedisBackend(redis_url),
+        ]
+        print(f"Serialized payload: {len(encode_value(PAYLOAD))} bytes")
+        print(f"{'backend':<10}{'mean':>12}{'p50':>12}{'p99':>12}")
+        for backend in backends:
+            result = bench_hits(backend, keys, args.rounds)
+            print(f"{backend.name:<10}{result['mean_us']:>10.1f}us{result['p50_us']:>10.1f}us{result['p99_us']:>10.1f}us")
+            backend.close()
+
+
+if __name__ == "__main__":
+    main()
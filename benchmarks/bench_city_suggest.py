@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark for city autocomplete and name resolution.
+
+Replays a deterministic mix of prefixes and one-typo misspellings of the
+cities in airports.csv and reports p50/p99 per call, plus how long the
+index takes to build from the CSV versus mapping it from airports.bin.
+Run from the repository root:
+
+    python benchmarks/bench_city_suggest.py
+"""
+
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.airport_index import DEFAULT_CSV_PATH, AirportIndex  # noqa: E402
+from utils.airport_store import compile_airports, open_store  # noqa: E402
+from utils.city_search import CitySearch  # noqa: E402
+
+QUERIES = 5000
+TYPO_RATE = 0.3
+
+
+def make_queries(search: CitySearch, count: int = QUERIES, seed: int = 7):
+    rng = random.Random(seed)
+    cities = [entry.city for entry in search.entries]
+    queries = []
+    for _ in range(count):
+        city = rng.choice(cities)
+        query = city[:rng.randint(1, len(city))]
+        if len(query) > 3 and rng.random() < TYPO_RATE:
+            i = rng.randrange(len(query))
+            query = query[:i] + rng.choice(string.ascii_lowercase) + query[i + 1:]
+        queries.append(query)
+    return queries
+
+
+def percentiles(func, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e6, timings[int(len(timings) * 0.99)] * 1e6
+
+
+def main():
+    index = AirportIndex.from_csv(DEFAULT_CSV_PATH)
+    start = time.perf_counter()
+    search = CitySearch.build(index)
+    build_ms = (time.perf_counter() - start) * 1000
+    queries = make_queries(search)
+
+    print(f"Index build:  {build_ms:8.1f} ms ({len(search.terms)} terms, {len(search.entries)} cities)")
+
+    if open_store(DEFAULT_CSV_PATH) is None:
+        compile_airports(DEFAULT_CSV_PATH)
+    start = time.perf_counter()
+    store = open_store(DEFAULT_CSV_PATH)
+    AirportIndex.from_store(DEFAULT_CSV_PATH, store)
+    CitySearch.from_store(store)
+    print(f"Compiled load:{(time.perf_counter() - start) * 1000:8.1f} ms (airport index and search, from {store.path})")
+    for name, func in (("suggest", lambda q: search.suggest(q, 10)), ("resolve", search.resolve)):
+        p50, p99 = percentiles(func, queries)
+        print(f"{name + ':':13} p50 {p50:7.1f} us   p99 {p99:7.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark the vectorized scoring engine against the scalar scoring functions.
+
+Generates random observations, checks that both paths produce identical
+scores and reports rows per second. Run from the repository root:
+
+    python benchmarks/bench_scoring.py --rows 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import calculate_composite_score  # noqa: E402
+from utils import scoring  # noqa: E402
+from utils.flight_api import calculate_availability_score  # noqa: E402
+from utils.safety_api import calculate_safety_score  # noqa: E402
+from utils.weather_api import calculate_weather_score  # noqa: E402
+
+CONDITIONS = [
+    "Sunny", "Clear", "Partly cloudy", "Cloudy", "Overcast", "Mist", "Fog",
+    "Patchy rain possible", "Light drizzle", "Heavy snow", "Light sleet",
+    "Thundery outbreaks possible", "Moderate or heavy rain with thunder", "Blizzard",
+]
+
+
+def make_rows(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    return [
+        {
+            "temp_f": round(rng.uniform(-10, 110), 1),
+            "humidity": rng.randint(0, 100),
+            "condition": rng.choice(CONDITIONS),
+            "articles": rng.randint(0, 500),
+            "flights": rng.randint(0, 400),
+            "airlines": rng.randint(0, 20),
+        }
+        for _ in range(n)
+    ]
+
+
+def scalar_path(rows):
+    out = []
+    for row in rows:
+        weather = {"weather_score": calculate_weather_score({"current": {
+            "temp_f": row["temp_f"], "humidity": row["humidity"], "condition": {"text": row["condition"]},
+        }})}
+        safety = {"safety_score": calculate_safety_score(row["articles"])}
+        flights = {"availability_score": calculate_availability_score(row["flights"], row["airlines"])}
+        composite, _, _ = calculate_composite_score(weather, safety, flights, "")
+        out.append((weather["weather_score"], safety["safety_score"], flights["availability_score"], composite))
+    return out
+
+
+def vector_path(columns):
+    return scoring.score_batch(
+        columns["temp_f"], columns["humidity"], scoring.encode_conditions(columns["condition"]),
+        columns["articles"], columns["flights"], columns["airlines"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    columns = {key: [row[key] for row in rows] for key in rows[0]}
+    columns.update({key: np.array(columns[key]) for key in ("temp_f", "humidity", "articles", "flights", "airlines")})
+
+    start = time.perf_counter()
+    expected = scalar_path(rows)
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = vector_path(columns)
+    vector_seconds = time.perf_counter() - start
+
+    got = list(zip(*(result[k].tolist() for k in ("weather", "safety", "availability", "composite"))))
+    mismatches = sum(1 for a, b in zip(expected, got) if a != b)
+
+    print(f"Rows:        {args.rows}")
+    print(f"Scalar:      {args.rows / scalar_seconds:12.0f} rows/s ({scalar_seconds * 1000:.1f} ms)")
+    print(f"Vectorized:  {args.rows / vector_seconds:12.0f} rows/s ({vector_seconds * 1000:.1f} ms)")
+    print(f"Speedup:     {scalar_seconds / vector_seconds:12.1f}x")
+    print(f"Mismatches:  {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
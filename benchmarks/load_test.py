@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Offline load test: replay recorded traffic against the API with every
+upstream answered by benchmarks/upstream_sim.py.
+
+Starts the simulator and the API (uvicorn) as subprocesses, replays a
+traffic file at a fixed concurrency and reports throughput and p50/p95/p99
+latency per endpoint. Results are saved to benchmarks/results/ (ignored by
+git; copy a baseline elsewhere to keep it) and can be checked against an
+earlier run to catch regressions:
+
+    python benchmarks/load_test.py --concurrency 32 --latency-ms 80
+    python benchmarks/load_test.py --compare benchmarks/results/baseline.json
+
+The traffic file is JSON Lines, one request per line:
+
+    {"path": "/recommend", "params": {"city": "London"}}
+    {"method": "POST", "path": "/recommend/batch", "json": {"cities": ["Paris", "Rome"]}}
+
+Use --target to drive an already running server instead (its upstreams
+are then whatever it is configured with).
+
+--record saves every upstream response the API receives to an archive;
+--replay serves them from it with no simulator and no network, so runs
+are deterministic and independent of upstream latency:
+
+    python benchmarks/load_test.py --record benchmarks/results/upstream.archive
+    python benchmarks/load_test.py --replay benchmarks/results/upstream.archive
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import upstream_sim  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+DEFAULT_TRAFFIC = os.path.join(BENCH_DIR, "traffic.jsonl")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+PERCENTILES = (50, 95, 99)
+
+
+def load_traffic(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{' '.join(proc.args)} exited with status {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} not ready after {timeout:g}s")
+
+
+def start_simulator(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    cmd = [sys.executable, os.path.join(BENCH_DIR, "upstream_sim.py"), "--port", str(port),
+           "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+           "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+           "--flights", str(args.flights), "--articles", str(args.articles), "--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    _wait_ready(f"{url}/_stats", proc)
+    return proc, url
+
+
+def start_api(args: argparse.Namespace, upstream_url: str) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = {
+        **os.environ,
+        **upstream_sim.upstream_env(upstream_url),
+        "PREWARM_ENABLED": "false",
+        # The simulator has no rate limits; keep the budgets out of the way
+        "WEATHERAPI_RATE_PER_MINUTE": "1000000",
+        "AERODATABOX_RATE_PER_MINUTE": "1000000",
+        "NEWSAPI_RATE_PER_MINUTE": "1000000",
+    }
+    if args.record or args.replay:
+        env["UPSTREAM_ARCHIVE_MODE"] = "record" if args.record else "replay"
+        env["UPSTREAM_ARCHIVE_PATH"] = os.path.abspath(args.record or args.replay)
+    if args.cache_ttl is not None:
+        for source in ("WEATHER", "FLIGHTS", "SAFETY", "FORECAST", "SCORES"):
+            env[f"{source}_CACHE_TTL"] = str(args.cache_ttl)
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"]
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    _wait_ready(f"{url}/", proc)
+    return proc, url
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def run_load(target: str, traffic: List[Dict[str, Any]], total: int, concurrency: int,
+                   duration: Optional[float]) -> Tuple[List[Tuple[str, int, float]], float]:
+    """Send requests from traffic (cycled) until total are done or duration passes."""
+    samples: List[Tuple[str, int, float]] = []
+    next_index = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=target, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        deadline = start + duration if duration else None
+
+        async def worker():
+            nonlocal next_index
+            while next_index < total and (deadline is None or time.perf_counter() < deadline):
+                item = traffic[next_index % len(traffic)]
+                next_index += 1
+                sent = time.perf_counter()
+                try:
+                    response = await client.request(item.get("method", "GET"), item["path"],
+                                                    params=item.get("params"), json=item.get("json"))
+                    await response.aread()
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+                samples.append((item["path"], status, time.perf_counter() - sent))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return samples, elapsed
+
+
+def summarize(samples: List[Tuple[str, int, float]], elapsed: float) -> Dict[str, Dict[str, Any]]:
+    groups: Dict[str, List[Tuple[int, float]]] = {"all": []}
+    for path, status, seconds in samples:
+        groups.setdefault(path, []).append((status, seconds))
+        groups["all"].append((status, seconds))
+    report = {}
+    for path, rows in sorted(groups.items(), key=lambda kv: (kv[0] != "all", kv[0])):
+        latencies = sorted(seconds * 1000 for _, seconds in rows)
+        statuses: Dict[str, int] = {}
+        for status, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report[path] = {
+            "requests": len(rows),
+            "errors": sum(1 for status, _ in rows if status == 0 or status >= 500),
+            "statuses": statuses,
+            "throughput_rps": round(len(rows) / elapsed, 1) if elapsed else 0.0,
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            **{f"p{p}_ms": round(percentile(latencies, p), 2) for p in PERCENTILES},
+        }
+    return report
+
+
+def print_report(report: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'endpoint':<20}{'requests':>9}{'errors':>8}{'rps':>9}{'mean ms':>10}"
+          + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+    for path, row in report.items():
+        print(f"{path:<20}{row['requests']:>9}{row['errors']:>8}{row['throughput_rps']:>9.1f}{row['mean_ms']:>10.2f}"
+              + "".join(f"{row[f'p{p}_ms']:>10.2f}" for p in PERCENTILES))
+
+
+def compare(report: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Regressions of more than tolerance (a fraction) in p95 latency or throughput."""
+    regressions = []
+    for path, row in report.items():
+        base = baseline.get(path)
+        if not base:
+            continue
+        if base["p95_ms"] and row["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{path}: p95 {base['p95_ms']:.2f} -> {row['p95_ms']:.2f} ms")
+        if base["throughput_rps"] and row["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{path}: throughput {base['throughput_rps']:.1f} -> {row['throughput_rps']:.1f} rps")
+    return regressions
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traffic", default=DEFAULT_TRAFFIC, help="JSON Lines traffic file (default: %(default)s)")
+    parser.add_argument("--requests", type=int, default=None, help="Requests to send (default: one pass of the file)")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=0, help="Unrecorded requests sent first")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="Override every cache TTL (0 = always miss)")
+    parser.add_argument("--target", default=None, help="Drive this running server instead of starting one")
+    archive = parser.add_mutually_exclusive_group()
+    archive.add_argument("--record", default=None, metavar="ARCHIVE", help="Record upstream responses to this file")
+    archive.add_argument("--replay", default=None, metavar="ARCHIVE",
+                         help="Serve upstream responses from this file instead of the simulator")
+    parser.add_argument("--save", default=None, help="Result file (default: benchmarks/results/<time>-<rev>.json)")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", default=None, help="Earlier result file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression, as a fraction")
+    upstream_sim.add_arguments(parser)
+    args = parser.parse_args()
+
+    traffic = load_traffic(args.traffic)
+    total = args.requests or len(traffic)
+    processes = []
+    try:
+        target = args.target
+        if target is None:
+            if args.replay:
+                # Nothing listens here, so any call missing from the archive fails
+                upstream_url = "http://127.0.0.1:9"
+            else:
+                sim, upstream_url = start_simulator(args)
+                processes.append(sim)
+            api, target = start_api(args, upstream_url)
+            processes.append(api)
+        if args.warmup:
+            asyncio.run(run_load(target, traffic, args.warmup, args.concurrency, None))
+        print(f"[INFO] Sending {total} requests from {args.traffic} at concurrency {args.concurrency}")
+        samples, elapsed = asyncio.run(run_load(target, traffic, total, args.concurrency, args.duration))
+        upstream_calls = None
+        if args.target is None and not args.replay:
+            upstream_calls = httpx.get(f"{upstream_url}/_stats").json()
+    finally:
+        for proc in reversed(processes):
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    report = summarize(samples, elapsed)
+    print_report(report)
+    if upstream_calls:
+        print(f"[INFO] Upstream calls: {upstream_calls}")
+
+    result = {
+        "timestamp": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "revision": _git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("save", "no_save", "compare")},
+        "elapsed_seconds": round(elapsed, 3),
+        "upstream_calls": upstream_calls,
+        "endpoints": report,
+    }
+    if not args.no_save:
+        path = args.save
+        if path is None:
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+            path = os.path.join(RESULTS_DIR, f"{stamp}-{result['revision'] or 'unknown'}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"[INFO] Saved {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["endpoints"]
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"[ERROR] Regression {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"[INFO] No regressions beyond {args.tolerance:.0%} of {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
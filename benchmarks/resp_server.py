@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Tiny in-memory stand-in for a Redis server.
+
+Speaks enough of RESP2 (PING, GET, SET with EX/PX, DEL, SCAN, DBSIZE,
+FLUSHDB, SELECT, AUTH) for utils.cache_backends.RedisBackend, so the
+shared-cache path can be exercised without installing Redis:
+
+    python benchmarks/resp_server.py --port 6399
+    CACHE_BACKEND=redis CACHE_REDIS_URL=redis://127.0.0.1:6399/0 python main.py
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class RespStore:
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[Optional[float], bytes]] = {}
+
+    def _live(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: List[bytes]) -> Any:
+        command = args[0].upper()
+        if command == b"PING":
+            return "PONG"
+        if command in (b"SELECT", b"AUTH"):
+            return "OK"
+        if command == b"GET":
+            return self._live(args[1])
+        if command == b"SET":
+            expires_at = None
+            options = [a.upper() for a in args[3:]]
+            if b"PX" in options:
+                expires_at = time.time() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires_at = time.time() + int(args[3 + options.index(b"EX") + 1])
+            self.data[args[1]] = (expires_at, args[2])
+            return "OK"
+        if command == b"DEL":
+            removed = 0
+            for key in args[1:]:
+                if self._live(key) is not None:
+                    del self.data[key]
+                    removed += 1
+            return removed
+        if command == b"SCAN":
+            pattern = b"*"
+            options = [a.upper() for a in args[2:]]
+            if b"MATCH" in options:
+                pattern = args[2 + options.index(b"MATCH") + 1]
+            keys = [k for k in list(self.data) if self._live(k) is not None
+                    and fnmatch.fnmatchcase(k.decode("utf-8"), pattern.decode("utf-8"))]
+            return [b"0", keys]
+        if command == b"DBSIZE":
+            return sum(1 for k in list(self.data) if self._live(k) is not None)
+        if command == b"FLUSHDB":
+            self.data.clear()
+            return "OK"
+        return RuntimeError(f"ERR unknown command '{command.decode()}'")
+
+
+def encode_reply(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Exception):
+        return b"-" + str(value).encode("utf-8") + b"\r\n"
+    if isinstance(value, str):
+        return b"+" + value.encode("utf-8") + b"\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(v) for v in value)
+    raise TypeError(f"Cannot encode {type(value)!r}")
+
+
+async def _handle(store: RespStore, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            count = int(line[1:-2])
+            args = []
+            for _ in range(count):
+                length = int((await reader.readline())[1:-2])
+                args.append((await reader.readexactly(length + 2))[:-2])
+            writer.write(encode_reply(store.execute(args)))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 6399) -> asyncio.AbstractServer:
+    store = RespStore()
+    return await asyncio.start_server(lambda r, w: _handle(store, r, w), host, port)
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 0) -> int:
+    """Run the stand-in on a daemon thread and return the port it listens on."""
+    ready = threading.Event()
+    bound: List[int] = []
+
+    def run():
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(serve(host, port))
+        bound.append(server.sockets[0].getsockname()[1])
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return bound[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+
+    async def run():
+        server = await serve(args.host, args.port)
+        print(f"[INFO] RESP stand-in listening on {args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the WeatherAPI, AeroDataBox and NewsAPI endpoints.
+
+Answers the upstream calls the API makes with synthetic but
+realistically shaped payloads, after a configurable delay, and fails a
+configurable share of them, so the API can be load-tested offline:
+
+    python benchmarks/upstream_sim.py --port 8900 --latency-ms 80 --error-rate 0.02
+    WEATHER_API_URL=http://127.0.0.1:8900/v1/current.json \\
+    WEATHER_FORECAST_URL=http://127.0.0.1:8900/v1/forecast.json \\
+    NEWS_API_URL=http://127.0.0.1:8900/v2/everything \\
+    AERODATABOX_BASE_URL=http://127.0.0.1:8900 python main.py
+
+benchmarks/load_test.py starts it (and the API) in subprocesses automatically.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+AIRLINES = ["British Airways", "Lufthansa", "Air France", "KLM", "Delta", "United", "Emirates",
+            "Qatar Airways", "Ryanair", "easyJet", "Iberia", "Turkish Airlines"]
+CONDITIONS = ["Sunny", "Partly cloudy", "Overcast", "Light rain", "Clear", "Mist", "Moderate snow"]
+
+
+@dataclass
+class SimConfig:
+    latency_ms: float = 50.0
+    jitter_ms: float = 20.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    flights: int = 150       # per direction, so responses are ~2x this many records
+    articles: int = 20
+    seed: int = 0
+
+
+def _stable_random(*parts: str) -> random.Random:
+    # Same city, same payload: runs stay comparable and caches behave as in production
+    digest = hashlib.sha256("|".join(parts).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def weather_payload(city: str) -> Dict[str, Any]:
+    rng = _stable_random("weather", city)
+    return {
+        "location": {"name": city.title(), "region": "", "country": "Simland",
+                     "lat": round(rng.uniform(-60, 70), 2), "lon": round(rng.uniform(-180, 180), 2),
+                     "tz_id": "UTC", "localtime": time.strftime("%Y-%m-%d %H:%M")},
+        "current": {"temp_f": round(rng.uniform(20, 100), 1), "temp_c": 0.0,
+                    "condition": {"text": rng.choice(CONDITIONS), "code": 1000},
+                    "wind_mph": round(rng.uniform(0, 30), 1), "humidity": rng.randint(10, 100),
+                    "cloud": rng.randint(0, 100), "feelslike_f": 0.0, "uv": 3.0, "pressure_mb": 1012.0,
+                    "precip_mm": 0.0, "vis_km": 10.0, "gust_mph": 10.0},
+    }
+
+
+def forecast_payload(city: str, day: str) -> Dict[str, Any]:
+    rng = _stable_random("forecast", city, day)
+    low = rng.uniform(20, 85)
+    summary = {"maxtemp_f": round(low + rng.uniform(5, 20), 1), "mintemp_f": round(low, 1),
+               "avgtemp_f": round(low + 7, 1), "maxwind_mph": round(rng.uniform(0, 30), 1),
+               "avghumidity": rng.randint(10, 100), "daily_chance_of_rain": rng.randint(0, 100),
+               "condition": {"text": rng.choice(CONDITIONS), "code": 1000}}
+    payload = weather_payload(city)
+    payload["forecast"] = {"forecastday": [{"date": day, "day": summary, "hour": []}]}
+    return payload
+
+
+def _flight(rng: random.Random, iata: str, direction: str, i: int) -> Dict[str, Any]:
+    other = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(3))
+    here = {"airport": {"iata": iata, "name": f"{iata} International"},
+            "scheduledTime": {"local": f"2024-01-15 {i % 24:02d}:{i % 60:02d}+00:00"}}
+    there = {"airport": {"iata": other, "name": f"{other} Airport"},
+             "scheduledTime": {"local": f"2024-01-15 {(i + 3) % 24:02d}:{i % 60:02d}+00:00"}}
+    airline = rng.choice(AIRLINES)
+    return {
+        "number": f"{airline[:2].upper()} {100 + i}",
+        "status": "Expected",
+        "codeshareStatus": "IsOperator",
+        "isCargo": False,
+        "aircraft": {"model": "Airbus A320"},
+        "airline": {"name": airline, "iata": airline[:2].upper()},
+        "departure": here if direction == "departures" else there,
+        "arrival": there if direction == "departures" else here,
+    }
+
+
+def flights_payload(iata: str, count: int) -> Dict[str, Any]:
+    rng = _stable_random("flights", iata)
+    return {direction: [_flight(rng, iata, direction, i) for i in range(count)]
+            for direction in ("departures", "arrivals")}
+
+
+def news_payload(query: str, count: int) -> Dict[str, Any]:
+    rng = _stable_random("news", query)
+    count = rng.randint(0, count) if count else 0
+    return {
+        "status": "ok",
+        "totalResults": count,
+        "articles": [{"source": {"id": None, "name": "Sim News"}, "author": "Reporter",
+                      "title": f"Story {i} about {query.split(' ')[0]}",
+                      "description": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 3,
+                      "url": f"https://news.example/{i}", "publishedAt": "2024-01-15T08:00:00Z"}
+                     for i in range(count)],
+    }
+
+
+def create_app(config: SimConfig) -> Starlette:
+    rng = random.Random(config.seed)
+    counts: Dict[str, int] = {"weather": 0, "forecast": 0, "flights": 0, "news": 0, "errors": 0}
+    # Flight payloads are the expensive ones to build; reuse them per airport
+    flights_cache: Dict[Tuple[str, int], bytes] = {}
+
+    async def respond(kind: str, build) -> Response:
+        counts[kind] += 1
+        delay = max(0.0, config.latency_ms + rng.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+        if rng.random() < config.error_rate:
+            counts["errors"] += 1
+            return JSONResponse({"message": "simulated upstream failure"}, status_code=config.error_status)
+        body = build()
+        return Response(body if isinstance(body, bytes) else json.dumps(body), media_type="application/json")
+
+    async def weather(request: Request) -> Response:
+        return await respond("weather", lambda: weather_payload(request.query_params.get("q", "")))
+
+    async def forecast(request: Request) -> Response:
+        params = request.query_params
+        return await respond("forecast", lambda: forecast_payload(params.get("q", ""), params.get("dt", "")))
+
+    async def flights(request: Request) -> Response:
+        iata = request.path_params["iata"].upper()
+
+        def build() -> bytes:
+            key = (iata, config.flights)
+            if key not in flights_cache:
+                flights_cache[key] = json.dumps(flights_payload(iata, config.flights)).encode("utf-8")
+            return flights_cache[key]
+
+        return await respond("flights", build)
+
+    async def news(request: Request) -> Response:
+        return await respond("news", lambda: news_payload(request.query_params.get("q", ""), config.articles))
+
+    async def stats(request: Request) -> Response:
+        return JSONResponse(counts)
+
+    return Starlette(routes=[
+        Route("/v1/current.json", weather),
+        Route("/v1/forecast.json", forecast),
+        Route("/flights/airports/iata/{iata}/{start}/{end}", flights),
+        Route("/v2/everything", news),
+        Route("/_stats", stats),
+    ])
+
+
+def upstream_env(base_url: str) -> Dict[str, str]:
+    """Environment that points the API's upstream clients at a simulator."""
+    return {
+        "WEATHER_API_URL": f"{base_url}/v1/current.json",
+        "WEATHER_FORECAST_URL": f"{base_url}/v1/forecast.json",
+        "NEWS_API_URL": f"{base_url}/v2/everything",
+        "AERODATABOX_BASE_URL": base_url,
+        "WEATHER_API_KEY": "sim",
+        "NEWS_API_KEY": "sim",
+        "AERODATABOX_API_KEY": "sim",
+    }
+
+
+def add_arguments(parser: argparse.ArgumentParser, defaults: Optional[SimConfig] = None) -> None:
+    defaults = defaults or SimConfig()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="Mean upstream delay")
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms, help="Uniform +/- jitter on the delay")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="Share of calls that fail")
+    parser.add_argument("--error-status", type=int, default=defaults.error_status, help="Status of failed calls")
+    parser.add_argument("--flights", type=int, default=defaults.flights, help="Flights per direction per airport")
+    parser.add_argument("--articles", type=int, default=defaults.articles, help="Maximum articles per news query")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def config_from_args(args: argparse.Namespace) -> SimConfig:
+    return SimConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                     error_status=args.error_status, flights=args.flights, articles=args.articles, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f"[INFO] Upstream simulator listening on {args.host}:{args.port}")
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
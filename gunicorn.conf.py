@@ -0,0 +1,52 @@
+"""
+Gunicorn settings for production serving.
+
+    gunicorn main:app            # picks up ./gunicorn.conf.py
+
+One uvicorn worker process per core, each with its own event loop. The
+app is imported once in the master and the airport and city-search indexes
+are built there, so forked workers share those pages instead of building
+their own. On SIGTERM, each worker drains (see utils/lifecycle.py) and
+finishes in-flight requests within GRACEFUL_TIMEOUT.
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+# Rate budgets live in each process, so the app splits every provider's rate
+# evenly between WEB_CONCURRENCY workers (utils/upstream.py), and only the
+# worker holding the prewarm lock file runs background refreshes
+# (utils/prewarm.py). Exported so the app sees the default worker count too.
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("PRELOAD_APP", "true").lower() in ("1", "true", "yes")
+
+# Seconds a worker gets to finish in-flight requests after SIGTERM before it is killed
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Seconds a worker may go without heartbeating before it is restarted
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+# Recycle workers after this many requests (0 = never), staggered by the jitter
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+
+accesslog = os.getenv("ACCESS_LOG", "-") or None
+errorlog = "-"
+
+
+def when_ready(server):
+    """Build the shared read-only data in the master, before any worker is forked."""
+    if not preload_app:
+        return
+    from utils.airport_index import get_airport_index
+    from utils.city_search import get_city_search
+
+    index = get_airport_index()
+    get_city_search()
+    # Objects created so far are never collected, so the collector won't
+    # touch (and un-share) their pages in the workers
+    gc.freeze()
+    server.log.info("Preloaded %d airports for %d workers", len(index), server.num_workers)
@@ -1,16 +1,46 @@
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Any, Optional
-from utils.weather_api import get_weather
-from utils.flight_api import get_flights
-from utils.safety_api import get_safety
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional, Tuple
+from utils.weather_api import get_weather, get_weather_async, get_forecast_async, FORECAST_MAX_DAYS, WEATHER_TIMEOUT
+from utils.flight_api import get_flights, get_flights_async, get_flights_on_day_async, AERODATABOX_TIMEOUT
+from utils.safety_api import get_safety, get_safety_async, safety_cache_key, NEWS_API_TIMEOUT
+from utils.http_client import open_clients, close_clients, pool_stats
+from utils.upstream_archive import archive_stats
+from utils.cache import MISSING, cache_key, cache_stats, close_caches, get_cache
+from utils.airport_index import get_airport_index
+from utils.city_search import get_city_search
+from utils.prewarm import PREWARM_ENABLED, Prewarmer, request_tracker
+from utils.upstream import scheduler
+from utils.history import HISTORY_MAX_DAYS, close_history, get_history
+from utils.leaderboard import LEADERBOARD_ENABLED, REGIONS, Leaderboard, serves_all_workers
+from utils.lifecycle import configure_threadpool, lifecycle, threadpool_stats
+from utils.scoring_model import ScoringModel, get_scoring_model
+from utils.scoring import score_results
+from utils.responses import EncodedBody, EncodedCache, accepted_encoding, compress_stream, dumps, encoded_response
+from utils.metrics import REGISTRY, RECOMMEND_PHASE_SECONDS, MetricsMiddleware, record_timing
 from dotenv import load_dotenv
+from datetime import date, datetime, timedelta
+import asyncio
+import math
 import os
+import time
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Batch recommendation limits
+BATCH_MAX_CITIES = int(os.getenv("BATCH_MAX_CITIES", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Trip windows: days of forecast and flights fetched at once, and best dates reported
+TRIP_CONCURRENCY = int(os.getenv("TRIP_CONCURRENCY", "4"))
+TRIP_BEST_DATES = int(os.getenv("TRIP_BEST_DATES", "3"))
+
+# Close matches listed in the 404 for an unknown city
+CITY_NOT_FOUND_SUGGESTIONS = 3
+
 app = FastAPI(
     title="Smart Travel Planner API",
     description="A comprehensive travel recommendation system providing weather, safety, and flight data",
@@ -26,24 +56,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so it times everything including CORS handling
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+def load_airport_index():
+    """Build the airport and city-search indexes once so the first request doesn't pay for them"""
+    index = get_airport_index()
+    source = index.store.path if index.store is not None else index.csv_path
+    print(f"[INFO] Loaded {len(index)} airports from {source}")
+    get_city_search()
+
+@app.on_event("startup")
+def open_http_clients():
+    """Create the pooled keep-alive HTTP clients shared by all upstreams"""
+    open_clients()
+
+@app.on_event("startup")
+async def start_prewarmer():
+    """Start background refresh-ahead of popular cities"""
+    if PREWARM_ENABLED:
+        prewarmer.start()
+
+@app.on_event("startup")
+def start_leaderboard():
+    """Rank destinations as their upstream results are cached"""
+    if LEADERBOARD_ENABLED:
+        leaderboard.attach()
+
+@app.on_event("startup")
+async def finish_startup():
+    """Size the sync threadpool, delay shutdown on SIGTERM for draining, and report ready"""
+    size = configure_threadpool()
+    draining = lifecycle.install_drain_handler()
+    lifecycle.mark_started()
+    print(f"[INFO] Worker {os.getpid()} ready: {size} sync threads, drain on SIGTERM {'on' if draining else 'off'}")
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Stop background work and release pooled connections and cache handles"""
+    lifecycle.begin_shutdown()
+    await prewarmer.stop()
+    leaderboard.close()
+    await close_clients()
+    close_caches()
+    close_history()
+
 # Response models
 class WeatherResponse(BaseModel):
     location: Optional[Dict[str, Any]]
     current: Optional[Dict[str, Any]]
     weather_score: Optional[int]
+    scoring_version: Optional[str] = None
     error: Optional[str] = None
+    stale: bool = False
     status: str
 
 class SafetyResponse(BaseModel):
     safety_score: int
+    risk_level: Optional[str] = None
     articles: int
+    articles_count: int = 0
+    recent_articles: List[Dict[str, Any]] = []
+    scoring_version: Optional[str] = None
+    stale: bool = False
     status: str
 
 class FlightResponse(BaseModel):
     flights: Optional[list]
     total_flights: Optional[int]
     availability_score: Optional[int]
+    airport: Optional[str] = None
+    airports: Optional[List[str]] = None
+    scoring_version: Optional[str] = None
     error: Optional[str] = None
+    stale: bool = False
     status: str
 
 class RecommendationResponse(BaseModel):
@@ -54,8 +141,16 @@ class RecommendationResponse(BaseModel):
     safety: Dict[str, Any]
     flights: Dict[str, Any]
     summary: str
+    errors: Optional[List[str]] = None
+    stale: bool = False
+    trip: Optional[Dict[str, Any]] = None
+    scoring_version: Optional[str] = None
     status: str
 
+class BatchRecommendationRequest(BaseModel):
+    cities: List[str]
+    concurrency: Optional[int] = Field(None, ge=1)
+
 @app.get("/", tags=["Health"])
 def root():
     """Health check endpoint"""
@@ -65,6 +160,74 @@ def root():
         "status": "healthy"
     }
 
+@app.get("/ready", tags=["Health"])
+async def ready():
+    """
+    Readiness check: 503 until startup has finished and once shutdown or
+    draining has begun. Also reports how warm the caches are and the state
+    of the threadpool and upstream connection pools. Empty caches don't
+    make a worker unready.
+    """
+    index = get_airport_index()
+    pools = pool_stats()
+    # Off the sync-endpoint threadpool, so a saturated pool can't stall the check
+    caches = await asyncio.get_running_loop().run_in_executor(None, cache_stats)
+    checks = {
+        "started": lifecycle.started,
+        "not_draining": not lifecycle.draining,
+        "airport_index": len(index) > 0,
+        "http_clients": pools["async_client_open"] and pools["sync_session_open"],
+    }
+    is_ready = all(checks.values())
+    body = {
+        "status": "ready" if is_ready else ("draining" if lifecycle.draining else "not_ready"),
+        "checks": checks,
+        "process": lifecycle.stats(),
+        # Backends that can't count cheaply (redis) report entries and warm as null
+        "caches": {source: {"entries": stats["entries"],
+                            "warm": bool(stats["entries"]) if stats["entries"] is not None else None}
+                   for source, stats in caches.items()},
+        "prewarm": prewarmer.stats(),
+        "threadpool": threadpool_stats(),
+        "http_pool": pools,
+        "upstream_archive": archive_stats(),
+        "scoring_version": get_scoring_model().version,
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+@app.get("/cache/stats", tags=["Health"])
+def upstream_cache_stats():
+    """Hit/miss counters and occupancy of the per-source upstream caches"""
+    return cache_stats()
+
+@app.get("/prewarm/stats", tags=["Health"])
+def prewarm_stats():
+    """Queue depth, lag and budgets of the background refresh scheduler"""
+    return prewarmer.stats()
+
+@app.get("/upstream/stats", tags=["Health"])
+def upstream_stats():
+    """Rate-limit budget, grants and shed calls per upstream provider"""
+    return scheduler.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+def metrics():
+    """Request, upstream, cache and budget metrics in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cities/suggest", tags=["Cities"])
+def suggest_cities(
+    q: str = Query(..., description="Partial or misspelled city name", min_length=1),
+    limit: int = Query(10, ge=1, le=50, description="Maximum suggestions to return"),
+):
+    """
+    Autocomplete city names from airports.csv.
+    
+    Matches city names, airport names, countries and IATA/ICAO codes by
+    prefix, then falls back to fuzzy (trigram) matching for misspellings.
+    """
+    return {"query": q, "suggestions": get_city_search().suggest(q, limit), "status": "success"}
+
 @app.get("/weather", response_model=WeatherResponse, tags=["Weather"])
 def weather(city: str = Query(..., description="City name to fetch weather for", min_length=1)):
     """
@@ -72,13 +235,13 @@ def weather(city: str = Query(..., description="City name to fetch weather for",
     
     - **city**: Name of the city to get weather for
     """
-    if not city.strip():
-        raise HTTPException(status_code=400, detail="City name cannot be empty")
+    city = _resolve_city(city)
     
-    data = get_weather(city.strip())
+    request_tracker.record(city, ("weather",))
+    data = get_weather(city)
     
     if data.get("status") == "error":
-        raise HTTPException(status_code=500, detail=data.get("error", "Weather data unavailable"))
+        _raise_upstream_error(data, "Weather data unavailable")
     
     return data
 
@@ -88,13 +251,44 @@ def flights(city: str = Query(..., description="City name to get flights for", m
     Get available flights to an airport by city name.
     - **city**: Name of the city to assess flights for
     """
-    if not city.strip():
-        raise HTTPException(status_code=400, detail="City name cannot be empty")
-    data = get_flights(city.strip().upper())
+    # Flights need an airport, so unknown names get suggestions instead
+    city = _resolve_city(city, strict=True)
+    request_tracker.record(city, ("flights",))
+    data = get_flights(city.upper())
     if data.get("status") == "error":
-        raise HTTPException(status_code=500, detail=data.get("error", "Flight data unavailable"))
+        _raise_upstream_error(data, "Flight data unavailable")
     return data
 
+@app.get("/airports/nearest", tags=["Flights"])
+def nearest_airports(
+    lat: float = Query(..., ge=-90, le=90, description="Latitude in degrees"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude in degrees"),
+    radius_km: float = Query(100, gt=0, description="Search radius in kilometres"),
+    limit: int = Query(5, ge=1, le=50, description="Maximum airports to return"),
+):
+    """
+    Find the airports (with an IATA code) closest to a point, nearest first.
+    
+    - **lat**, **lon**: Coordinates, e.g. the location returned by /weather
+    """
+    nearest = get_airport_index().nearest_airports(lat, lon, limit, radius_km)
+    return {
+        "airports": [
+            {
+                "iata": airport.iata,
+                "icao": airport.icao,
+                "name": airport.name,
+                "city": airport.city,
+                "country": airport.country,
+                "latitude": airport.latitude,
+                "longitude": airport.longitude,
+                "distance_km": round(distance, 1)
+            }
+            for airport, distance in nearest
+        ],
+        "status": "success"
+    }
+
 @app.get("/safety", response_model=SafetyResponse, tags=["Safety"])
 def safety(city: str = Query(..., description="City name to assess safety for", min_length=1)):
     """
@@ -102,36 +296,182 @@ def safety(city: str = Query(..., description="City name to assess safety for",
     
     - **city**: Name of the city to assess safety for
     """
-    if not city.strip():
-        raise HTTPException(status_code=400, detail="City name cannot be empty")
+    city = _resolve_city(city)
     
-    data = get_safety(city.strip())
+    request_tracker.record(city, ("safety",))
+    data = get_safety(city)
     
     if data.get("status") == "error":
-        raise HTTPException(status_code=500, detail=data.get("error", "Safety data unavailable"))
+        _raise_upstream_error(data, "Safety data unavailable")
     
     return data
 
+@app.get("/history", tags=["History"])
+def history(
+    city: str = Query(..., description="City name", min_length=1),
+    days: int = Query(30, ge=1, le=HISTORY_MAX_DAYS, description="Days of daily aggregates to return"),
+):
+    """
+    Trends and daily aggregates from previously fetched results for a city.
+    
+    Served from precomputed rollups; no upstream calls are made.
+    
+    - **city**: Name of the city
+    - **days**: How many days of daily aggregates to include
+    """
+    city = _resolve_city(city)
+    recorder = get_history()
+    if recorder is None:
+        raise HTTPException(status_code=503, detail="History is disabled (HISTORY_ENABLED=false)")
+    
+    return {
+        "city": city,
+        "trends": recorder.store.rollups(city),
+        "daily": recorder.store.daily(city, days),
+        "status": "success"
+    }
+
+def _resolve_city(city: str, strict: bool = False) -> str:
+    """
+    Validate a city name and map it to its canonical spelling before any upstream call.
+    Names the index doesn't know are passed on as typed for the upstream to
+    geocode ("Kyoto", "Paris, France"), unless strict, when they are a 404
+    with suggestions.
+    """
+    if not city.strip():
+        raise HTTPException(status_code=400, detail="City name cannot be empty")
+    search = get_city_search()
+    resolved = search.resolve(city)
+    if resolved is None:
+        if not strict:
+            return " ".join(city.split())
+        detail = f"Unknown city '{city.strip()}'"
+        suggestions = [s["city"] for s in search.suggest(city, CITY_NOT_FOUND_SUGGESTIONS)]
+        if suggestions:
+            detail += f"; did you mean {', '.join(suggestions)}?"
+        raise HTTPException(status_code=404, detail=detail)
+    return resolved
+
+def _raise_upstream_error(data: Dict[str, Any], default: str):
+    """Turn an upstream error result into an HTTP error (503 when rate-limited)"""
+    if data.get("rate_limited"):
+        retry_after = max(1, math.ceil(data.get("retry_after") or 1))
+        raise HTTPException(status_code=503, detail=data.get("error", default),
+                            headers={"Retry-After": str(retry_after)})
+    raise HTTPException(status_code=500, detail=data.get("error", default))
+
+async def _fetch_upstream(name: str, call, timeout: float) -> Dict[str, Any]:
+    """Await one upstream call, turning timeouts and crashes into an error result"""
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(call, timeout=timeout)
+    except asyncio.TimeoutError:
+        return {"error": f"{name} request timed out after {timeout:g}s", "status": "error"}
+    except Exception as e:
+        return {"error": f"Unexpected error: {str(e)}", "status": "error"}
+    finally:
+        _record_phase(name.lower(), time.perf_counter() - start)
+
+def _record_phase(phase: str, seconds: float) -> None:
+    RECOMMEND_PHASE_SECONDS.observe(seconds, phase)
+    record_timing(phase, seconds)
+
 @app.get("/recommend", response_model=RecommendationResponse, tags=["Recommendations"])
-def recommend(city: str = Query(..., description="City name for travel recommendation", min_length=1)):
+async def recommend(request: Request,
+                    city: str = Query(..., description="City name for travel recommendation", min_length=1),
+                    start: Optional[date] = Query(None, description="First day of the trip (YYYY-MM-DD)"),
+                    end: Optional[date] = Query(None, description="Last day of the trip (YYYY-MM-DD)")):
     """
     Get comprehensive travel recommendation for a city.
     
     This endpoint combines weather, safety, and flight data to provide
-    a complete travel assessment with a composite score.
+    a complete travel assessment with a composite score. The three upstream
+    lookups run concurrently; if some of them fail the response is returned
+    with status "partial" and the failures listed in "errors".
+    
+    With start and end dates the response also has a "trip" section: each
+    day scored from its forecast and that day's flights, and the best days
+    to travel. Days are fetched concurrently and cached per (city, day).
+    
+    Responses carry an ETag (send it back in If-None-Match to get a 304)
+    and are gzip/brotli compressed when the client accepts it.
     
     - **city**: Name of the city for travel recommendation
+    - **start** / **end**: Trip dates, within the forecast range
     """
-    if not city.strip():
-        raise HTTPException(status_code=400, detail="City name cannot be empty")
+    if start is not None or end is not None:
+        _validate_trip(start, end)
+    city = _resolve_city(city)
+    
+    if start is not None:
+        result = await _build_trip(city, start, end)
+        # Built per request, so compressed at the fast levels rather than cached
+        return encoded_response(request, EncodedBody(dumps(result), reused=False))
     
-    city = city.strip()
+    result = await _get_recommendation(city)
+    # Cached results keep their encoded bytes, so repeats skip validation and encoding
+    return encoded_response(request, encoded_recommendations.get(cache_key(city), result))
+
+# Encoded bytes of the recommendations currently in the "scores" cache
+encoded_recommendations = EncodedCache()
+
+def _inputs_ttl(key: str, result: Any) -> Optional[float]:
+    """Seconds until the first of a recommendation's cached inputs expires"""
+    remaining = [
+        get_cache("weather").ttl_remaining(key),
+        get_cache("safety").ttl_remaining(safety_cache_key(key)),
+        get_cache("flights").ttl_remaining(key),
+    ]
+    remaining = [seconds for seconds in remaining if seconds is not None]
+    return min(remaining) if remaining else None
+
+# A recommendation is rebuilt as soon as any of its inputs would be refetched
+get_cache("scores").limit_ttl(_inputs_ttl)
+
+async def _get_recommendation(city: str) -> Dict[str, Any]:
+    """Return a cached recommendation, building it on a miss"""
+    request_tracker.record(city, RECOMMENDATION_SOURCES)
+    # Finished recommendations are cached too, so repeat requests skip scoring
+    result = await get_cache("scores").get_or_fetch_async(
+        cache_key(city), lambda: _build_recommendation(city)
+    )
+    if result.get("scoring_version") != get_scoring_model().version:
+        # Scored before the config changed; rebuilt from the cached components, which are re-scored on read
+        result = await _refresh_recommendation(city)
+    return result
+
+async def _refresh_recommendation(city: str) -> Dict[str, Any]:
+    """Rebuild a cached recommendation ahead of expiry (used by the prewarmer)"""
+    return await get_cache("scores").refresh_async(cache_key(city), lambda: _build_recommendation(city))
+
+async def _fetch_components(city: str) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """Weather, safety and flight results for a city; failures come back as error results"""
+    # Fetch all data concurrently; latency is the slowest upstream, not the sum
+    weather_data, safety_data, flight_data = await asyncio.gather(
+        _fetch_upstream("Weather", get_weather_async(city), WEATHER_TIMEOUT),
+        _fetch_upstream("Safety", get_safety_async(city), NEWS_API_TIMEOUT),
+        _fetch_upstream("Flights", get_flights_async(city), AERODATABOX_TIMEOUT),
+    )
+    return weather_data, safety_data, flight_data
+
+async def _build_recommendation(city: str) -> Dict[str, Any]:
+    """Fetch upstream data for a city and assemble its recommendation"""
+    weather_data, safety_data, flight_data = await _fetch_components(city)
+    _raise_if_unavailable(weather_data, safety_data, flight_data)
     
-    # Get all data
-    weather_data = get_weather(city)
-    safety_data = get_safety(city)
-    flight_data = get_flights(city)
+    # Calculate composite score
+    start = time.perf_counter()
+    model = get_scoring_model()
+    composite_score, recommendation, summary = calculate_composite_score(
+        weather_data, safety_data, flight_data, city, model
+    )
+    _record_phase("score", time.perf_counter() - start)
     
+    return _assemble_recommendation(city, weather_data, safety_data, flight_data,
+                                    composite_score, recommendation, summary, model)
+
+def _component_errors(weather_data: Dict[str, Any], safety_data: Dict[str, Any],
+                      flight_data: Dict[str, Any]) -> List[str]:
     # Check for errors in any of the services
     errors = []
     if weather_data.get("status") == "error":
@@ -140,18 +480,30 @@ def recommend(city: str = Query(..., description="City name for travel recommend
         errors.append(f"Safety: {safety_data.get('error', 'Unknown error')}")
     if flight_data.get("status") == "error":
         errors.append(f"Flights: {flight_data.get('error', 'Unknown error')}")
-    
-    if errors:
+    return errors
+
+def _raise_if_unavailable(weather_data: Dict[str, Any], safety_data: Dict[str, Any],
+                          flight_data: Dict[str, Any]) -> None:
+    """Only fail outright when no upstream returned anything usable"""
+    errors = _component_errors(weather_data, safety_data, flight_data)
+    if len(errors) == 3:
+        if all(d.get("rate_limited") for d in (weather_data, safety_data, flight_data)):
+            retry_after = min(d.get("retry_after") or 1 for d in (weather_data, safety_data, flight_data))
+            raise HTTPException(
+                status_code=503,
+                detail=f"Upstream rate budgets exhausted: {'; '.join(errors)}",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
         raise HTTPException(
             status_code=500, 
             detail=f"Some services are unavailable: {'; '.join(errors)}"
         )
-    
-    # Calculate composite score
-    composite_score, recommendation, summary = calculate_composite_score(
-        weather_data, safety_data, flight_data, city
-    )
-    
+
+def _assemble_recommendation(city: str, weather_data: Dict[str, Any], safety_data: Dict[str, Any],
+                             flight_data: Dict[str, Any], composite_score: int, recommendation: str,
+                             summary: str, model: ScoringModel) -> Dict[str, Any]:
+    """The /recommend response for a city's components and scores"""
+    errors = _component_errors(weather_data, safety_data, flight_data)
     return {
         "destination": city,
         "composite_score": composite_score,
@@ -175,13 +527,315 @@ def recommend(city: str = Query(..., description="City name for travel recommend
             "sample_flights": flight_data.get("flights", [])[:3]  # Top 3 flights
         },
         "summary": summary,
+        "errors": errors or None,
+        # Some component was served past its TTL because its upstream failed
+        "stale": any(d.get("stale", False) for d in (weather_data, safety_data, flight_data)),
+        "scoring_version": model.version,
+        "status": "partial" if errors else "success"
+    }
+
+async def _returning(value: Any) -> Any:
+    return value
+
+async def _score_recommendations(rows: List[Tuple[str, Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]]]
+                                 ) -> List[Tuple[str, Any]]:
+    """
+    Build and cache the recommendations for (city, components) rows, scoring
+    them together in one vectorized pass. Returns (city, recommendation or
+    HTTPException) pairs.
+    """
+    start = time.perf_counter()
+    model = get_scoring_model()
+    weather, safety, flights = zip(*(components for _, components in rows))
+    scores = score_results(weather, safety, flights, model)
+    _record_phase("score", time.perf_counter() - start)
+    
+    cache = get_cache("scores")
+    built = []
+    for i, (city, (weather_data, safety_data, flight_data)) in enumerate(rows):
+        try:
+            _raise_if_unavailable(weather_data, safety_data, flight_data)
+        except HTTPException as e:
+            built.append((city, e))
+            continue
+        result = _assemble_recommendation(
+            city, weather_data, safety_data, flight_data, int(scores["composite"][i]),
+            str(scores["recommendation"][i]),
+            recommendation_summary(weather_data, safety_data, flight_data, city, model), model,
+        )
+        # Stored like a /recommend miss would be (partial results briefly, nothing stale)
+        built.append((city, await cache.refresh_async(cache_key(city), lambda result=result: _returning(result))))
+    return built
+
+def _validate_trip(start: Optional[date], end: Optional[date]) -> None:
+    """Reject trip windows the forecast can't cover"""
+    if start is None or end is None:
+        raise HTTPException(status_code=400, detail="Both start and end are required for a trip")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    today = datetime.utcnow().date()
+    last = today + timedelta(days=FORECAST_MAX_DAYS - 1)
+    if start < today or end > last:
+        raise HTTPException(status_code=400,
+                            detail=f"Trip dates must be between {today.isoformat()} and {last.isoformat()}")
+
+async def _build_trip(city: str, start: date, end: date) -> Dict[str, Any]:
+    """Score each day of a trip window and pick the best ones, on top of the current recommendation"""
+    days = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+    semaphore = asyncio.Semaphore(TRIP_CONCURRENCY)
+    
+    async def fetch_day(day: str):
+        async with semaphore:
+            return await asyncio.gather(
+                _fetch_upstream("Forecast", get_forecast_async(city, day), WEATHER_TIMEOUT),
+                _fetch_upstream("Flights", get_flights_on_day_async(city, day), AERODATABOX_TIMEOUT),
+            )
+    
+    # Safety and current flights are shared with the recommendation through the cache
+    recommendation, safety_data, flight_data, *daily = await asyncio.gather(
+        _get_recommendation(city),
+        _fetch_upstream("Safety", get_safety_async(city), NEWS_API_TIMEOUT),
+        _fetch_upstream("Flights", get_flights_async(city), AERODATABOX_TIMEOUT),
+        *(fetch_day(day) for day in days),
+    )
+    
+    model = get_scoring_model()
+    series = []
+    for day, (forecast, day_flights) in zip(days, daily):
+        if forecast.get("status") == "error":
+            series.append({"date": day, "composite_score": None,
+                           "error": f"Forecast: {forecast.get('error', 'Unknown error')}"})
+            continue
+        # A day whose flights couldn't be fetched (often the AeroDataBox budget) uses current traffic
+        estimated = day_flights.get("status") == "error"
+        flights_used = flight_data if estimated else day_flights
+        summary = forecast.get("day", {})
+        series.append({
+            "date": day,
+            "composite_score": calculate_composite_score(forecast, safety_data, flights_used, city, model)[0],
+            "weather_score": forecast.get("weather_score"),
+            "condition": summary.get("condition", {}).get("text"),
+            "max_temp_f": summary.get("maxtemp_f"),
+            "min_temp_f": summary.get("mintemp_f"),
+            "chance_of_rain": summary.get("daily_chance_of_rain"),
+            "availability_score": flights_used.get("availability_score", 0),
+            "total_flights": flights_used.get("total_flights", 0),
+            "flights_estimated": estimated,
+        })
+    
+    ranked = sorted((d for d in series if d["composite_score"] is not None),
+                    key=lambda d: (-d["composite_score"], d["date"]))
+    return {
+        **recommendation,
+        "trip": {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "days": series,
+            "best_dates": [d["date"] for d in ranked[:TRIP_BEST_DATES]],
+        }
+    }
+
+@app.post("/recommend/batch", tags=["Recommendations"])
+async def recommend_batch(request: Request, body: BatchRecommendationRequest):
+    """
+    Score many cities in one request.
+    
+    Names are resolved first, so spellings and aliases of the same city
+    (e.g. "NYC" and "New York") are deduplicated. Cached recommendations are
+    returned at once; the rest are looked up concurrently, with at most
+    `concurrency` in flight at once, and the cities whose data arrives
+    together are scored together in one vectorized pass. The
+    response is NDJSON: one `{"type": "result"}` or `{"type": "error"}` line
+    per city as soon as it is ready, followed by a final `{"type": "ranking"}`
+    line listing the successful cities ordered by composite score.
+    
+    - **cities**: City names to compare
+    - **concurrency**: Maximum cities looked up at the same time
+    """
+    names: Dict[str, str] = {}
+    for name in body.cities:
+        if name.strip():
+            names.setdefault(cache_key(name), name.strip())
+    if not names:
+        raise HTTPException(status_code=400, detail="At least one city name is required")
+    if len(names) > BATCH_MAX_CITIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_CITIES} cities per batch")
+    
+    # Deduplicate on the resolved city, so "NYC" and "New York" are looked up once
+    cities: Dict[str, str] = {}
+    unknown: List[bytes] = []
+    for name in names.values():
+        try:
+            resolved = _resolve_city(name)
+        except HTTPException as e:
+            unknown.append(dumps({"type": "error", "destination": name, "error": e.detail}))
+            continue
+        cities.setdefault(cache_key(resolved), resolved)
+    
+    semaphore = asyncio.Semaphore(min(body.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    
+    async def lookup(city: str) -> Tuple[str, Any]:
+        """A city's cached recommendation, else its upstream components (or the error)"""
+        request_tracker.record(city, RECOMMENDATION_SOURCES)
+        cached = get_cache("scores").get(cache_key(city))
+        if cached is not MISSING and cached.get("scoring_version") == get_scoring_model().version:
+            return city, cached
+        async with semaphore:
+            try:
+                return city, await _fetch_components(city)
+            except Exception as e:
+                return city, e
+    
+    def line(city: str, outcome: Any) -> Tuple[Optional[Dict[str, Any]], bytes]:
+        if isinstance(outcome, HTTPException):
+            return None, dumps({"type": "error", "destination": city, "error": outcome.detail})
+        if isinstance(outcome, Exception):
+            return None, dumps({"type": "error", "destination": city, "error": f"Unexpected error: {str(outcome)}"})
+        # Splice the type tag into the cached encoding instead of re-encoding
+        encoded = encoded_recommendations.get(cache_key(city), outcome).body
+        return outcome, b'{"type":"result",' + encoded[1:]
+    
+    async def stream():
+        tasks = [asyncio.ensure_future(lookup(city)) for city in cities.values()]
+        pending = set(tasks)
+        ranking = []
+        for unknown_line in unknown:
+            yield unknown_line + b"\n"
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                outcomes, rows = [], []
+                for task in done:
+                    city, value = task.result()
+                    if isinstance(value, tuple):
+                        rows.append((city, value))
+                    else:
+                        outcomes.append((city, value))
+                if rows:
+                    # Everything that arrived together is scored in one vectorized pass
+                    try:
+                        outcomes.extend(await _score_recommendations(rows))
+                    except Exception as e:
+                        outcomes.extend((city, e) for city, _ in rows)
+                for city, outcome in outcomes:
+                    result, encoded = line(city, outcome)
+                    if result is not None:
+                        ranking.append((result["composite_score"], result["destination"]))
+                    yield encoded + b"\n"
+        finally:
+            # Stop outstanding lookups if the client goes away mid-stream
+            for task in tasks:
+                task.cancel()
+        ranking.sort(key=lambda item: item[0], reverse=True)
+        yield dumps({
+            "type": "ranking",
+            "ranking": [
+                {"rank": i + 1, "destination": destination, "composite_score": composite_score}
+                for i, (composite_score, destination) in enumerate(ranking)
+            ]
+        }) + b"\n"
+    
+    encoding = accepted_encoding(request)
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(compress_stream(stream(), encoding), media_type="application/x-ndjson",
+                             headers=headers)
+
+@app.get("/leaderboard", tags=["Recommendations"])
+def best_destinations(
+    limit: int = Query(10, ge=1, le=100, description="Maximum destinations to return"),
+    offset: int = Query(0, ge=0, description="Destinations to skip, for paging"),
+    country: Optional[str] = Query(None, description="Only destinations in this country"),
+    region: Optional[str] = Query(None, description=f"Only destinations in this region ({', '.join(REGIONS)}, Other)"),
+):
+    """
+    Best places to go right now, by composite score.
+    
+    Served from a leaderboard kept up to date in the background as weather,
+    safety and flight results are cached, so this never calls an upstream.
+    Only destinations with all three results cached are ranked.
+    
+    - **limit**: Maximum destinations to return
+    - **offset**: Destinations to skip
+    - **country** / **region**: Restrict the ranking
+    """
+    if not LEADERBOARD_ENABLED:
+        raise HTTPException(status_code=503, detail="Leaderboard is disabled")
+    if not serves_all_workers():
+        # Each worker would rank only the cities it happened to fetch itself
+        raise HTTPException(status_code=503, detail="Leaderboard needs a shared cache backend "
+                                                    "(sqlite or redis) with several workers")
+    if region and " ".join(region.split()).casefold() not in {r.casefold() for r in (*REGIONS, "Other")}:
+        raise HTTPException(status_code=400, detail=f"Unknown region '{region}'; expected one of: "
+                                                    f"{', '.join(REGIONS)}, Other")
+    total, rows = leaderboard.top(limit, offset, country=country, region=region)
+    return {
+        "total": total,
+        "country": country,
+        "region": region,
+        "leaderboard": rows,
+        "scoring_version": get_scoring_model().version,
         "status": "success"
     }
 
+# Sources a /recommend call depends on, refreshed together by the prewarmer
+RECOMMENDATION_SOURCES = ("weather", "safety", "flights", "scores")
+
+prewarmer = Prewarmer({
+    "weather": get_weather_async.refresh,
+    "safety": get_safety_async.refresh,
+    "flights": get_flights_async.refresh,
+    "scores": _refresh_recommendation,
+})
+
+# Ranked from cached components with the same weights as /recommend
+leaderboard = Leaderboard()
+
+# Gauges read from existing stats when /metrics is scraped
+def _cache_samples(field: str):
+    for source, stats in cache_stats().items():
+        if stats.get(field) is not None:
+            yield {"source": source}, stats[field]
+
+def _upstream_samples(field: str):
+    for provider, stats in scheduler.stats().items():
+        yield {"provider": provider}, stats[field]
+
+REGISTRY.collect("cache_hits_total", "counter", "Cache lookups answered from cache",
+                 lambda: _cache_samples("hits"))
+REGISTRY.collect("cache_misses_total", "counter", "Cache lookups that went upstream",
+                 lambda: _cache_samples("misses"))
+REGISTRY.collect("cache_stale_served_total", "counter", "Expired entries served because upstream failed",
+                 lambda: _cache_samples("stale_served"))
+REGISTRY.collect("cache_hit_ratio", "gauge", "Fraction of cache lookups that were hits",
+                 lambda: _cache_samples("hit_ratio"))
+REGISTRY.collect("cache_entries", "gauge", "Entries held per cache",
+                 lambda: _cache_samples("entries"))
+REGISTRY.collect("upstream_budget_granted_total", "counter", "Upstream calls granted a rate-limit token",
+                 lambda: _upstream_samples("granted"))
+REGISTRY.collect("upstream_budget_shed_total", "counter", "Upstream calls shed for lack of budget",
+                 lambda: _upstream_samples("shed"))
+REGISTRY.collect("upstream_throttled_total", "counter", "429 responses that paused a provider's budget",
+                 lambda: _upstream_samples("throttled"))
+REGISTRY.collect("upstream_budget_available_tokens", "gauge", "Tokens left in each provider's budget",
+                 lambda: _upstream_samples("available"))
+REGISTRY.collect("history_recorded_total", "counter", "Results queued for the history store",
+                 lambda: [({}, get_history().recorded)] if get_history() else [])
+REGISTRY.collect("history_dropped_total", "counter", "Results not recorded because the history queue was full",
+                 lambda: [({}, get_history().dropped)] if get_history() else [])
+REGISTRY.collect("leaderboard_entries", "gauge", "Destinations currently ranked on the leaderboard",
+                 lambda: [({}, leaderboard.stats()["entries"])])
+REGISTRY.collect("prewarm_queue_depth", "gauge", "Refreshes waiting in the prewarm queue",
+                 lambda: [({}, prewarmer.stats()["queue_depth"])])
+REGISTRY.collect("prewarm_queue_lag_seconds", "gauge", "How far behind schedule the oldest queued refresh is",
+                 lambda: [({}, prewarmer.stats()["queue_lag_seconds"])])
+
 def calculate_composite_score(weather_data: Dict[str, Any], 
                             safety_data: Dict[str, Any], 
                             flight_data: Dict[str, Any],
-                            city: str) -> tuple[int, str, str]:
+                            city: str,
+                            model: Optional[ScoringModel] = None) -> tuple[int, str, str]:
     """
     Calculate composite travel score and generate recommendation.
     
@@ -190,37 +844,32 @@ def calculate_composite_score(weather_data: Dict[str, Any],
         safety_data: Safety assessment
         flight_data: Flight availability
         city: City name for summary generation
+        model: Scoring model to use (defaults to the current one)
         
     Returns:
         Tuple of (composite_score, recommendation, summary)
     """
+    model = model or get_scoring_model()
     # Extract scores
-    weather_score = weather_data.get("weather_score", 50)
-    safety_score = safety_data.get("safety_score", 50)
-    flight_score = flight_data.get("availability_score", 50)
-    
-    # Weighted scoring (weather and safety are more important than flights)
-    weather_weight = 0.4
-    safety_weight = 0.4
-    flight_weight = 0.2
-    
-    composite_score = int(
-        (weather_score * weather_weight) + 
-        (safety_score * safety_weight) + 
-        (flight_score * flight_weight)
-    )
+    weather_score = weather_data.get("weather_score", model.composite_missing)
+    safety_score = safety_data.get("safety_score", model.composite_missing)
+    flight_score = flight_data.get("availability_score", model.composite_missing)
     
-    # Generate recommendation
-    if composite_score >= 80:
-        recommendation = "Excellent destination"
-    elif composite_score >= 70:
-        recommendation = "Good to visit"
-    elif composite_score >= 60:
-        recommendation = "Consider visiting"
-    elif composite_score >= 50:
-        recommendation = "Proceed with caution"
-    else:
-        recommendation = "Not recommended"
+    # Weighted scoring (weather and safety are more important than flights by default)
+    composite_score = model.composite_score(weather_score, safety_score, flight_score)
+    recommendation = model.recommendation(composite_score)
+    
+    return composite_score, recommendation, recommendation_summary(weather_data, safety_data, flight_data, city, model)
+
+def recommendation_summary(weather_data: Dict[str, Any],
+                           safety_data: Dict[str, Any],
+                           flight_data: Dict[str, Any],
+                           city: str,
+                           model: Optional[ScoringModel] = None) -> str:
+    """One-sentence summary of a city's weather, safety and flights"""
+    model = model or get_scoring_model()
+    weather_score = weather_data.get("weather_score", model.composite_missing)
+    safety_score = safety_data.get("safety_score", model.composite_missing)
     
     # Generate summary
     weather_condition = weather_data.get("current", {}).get("condition", {}).get("text", "Unknown")
@@ -252,10 +901,10 @@ def calculate_composite_score(weather_data: Dict[str, Any],
     else:
         summary_parts.append("with limited flight options")
     
-    summary = f"{city} offers {', '.join(summary_parts)}."
-    
-    return composite_score, recommendation, summary
+    return f"{city} offers {', '.join(summary_parts)}."
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
+    # Single-process development server; production runs under gunicorn (see gunicorn.conf.py)
+    uvicorn.run("main:app", host=os.getenv("HOST", "127.0.0.1"), port=int(os.getenv("PORT", "8000")),
+                reload=os.getenv("RELOAD", "false").lower() in ("1", "true", "yes"))
\ No newline at end of file
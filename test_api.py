@@ -75,6 +75,35 @@ def test_recommendation(city="New York"):
         print(f"Error: {response.text}")
     print()
 
+def test_batch_recommendation(cities=("New York", "London", "Tokyo")):
+    """Test the batch recommendation endpoint"""
+    print(f"Testing batch recommendation for {', '.join(cities)}...")
+    response = requests.post(f"{BASE_URL}/recommend/batch", json={"cities": list(cities)}, stream=True)
+    print(f"Status: {response.status_code}")
+    if response.status_code == 200:
+        for line in response.iter_lines():
+            data = json.loads(line)
+            if data.get("type") == "ranking":
+                for entry in data.get("ranking", []):
+                    print(f"#{entry['rank']} {entry['destination']}: {entry['composite_score']}")
+            elif data.get("type") == "error":
+                print(f"Error for {data.get('destination')}: {data.get('error')}")
+    else:
+        print(f"Error: {response.text}")
+    print()
+
+def test_city_suggest(query="londn"):
+    """Test the city autocomplete endpoint"""
+    print(f"Testing city suggestions for '{query}'...")
+    response = requests.get(f"{BASE_URL}/cities/suggest", params={"q": query, "limit": 5})
+    print(f"Status: {response.status_code}")
+    if response.status_code == 200:
+        for suggestion in response.json().get("suggestions", []):
+            print(f"{suggestion['city']}, {suggestion['country']} ({suggestion['iata']})")
+    else:
+        print(f"Error: {response.text}")
+    print()
+
 def main():
     """Run all tests"""
     print("🚀 Smart Travel Planner API Tests")
@@ -86,6 +115,8 @@ def main():
         test_safety("New York")
         test_flights("New York")
         test_recommendation("New York")
+        test_batch_recommendation()
+        test_city_suggest()
         
         print("✅ All tests completed!")
         
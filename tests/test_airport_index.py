@@ -0,0 +1,86 @@
+import math
+import random
+
+import pytest
+
+from utils.airport_index import Airport, GeoTree, get_airport_index, metro_areas
+
+
+def airport(iata, latitude, longitude, city="Somewhere", country="Nowhere"):
+    return Airport(f"{iata} Airport", city, country, iata, "", latitude, longitude, 0, "", "")
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(a))
+
+
+@pytest.fixture(scope="module")
+def random_airports():
+    rng = random.Random(11)
+    return [airport(f"A{i}", rng.uniform(-90, 90), rng.uniform(-180, 180)) for i in range(2000)]
+
+
+def brute_force(airports, latitude, longitude, k, radius_km=None):
+    distances = sorted((haversine_km(latitude, longitude, a.latitude, a.longitude), a.iata) for a in airports)
+    if radius_km is not None:
+        distances = [d for d in distances if d[0] <= radius_km]
+    return distances[:k]
+
+
+def test_nearest_matches_brute_force(random_airports):
+    tree = GeoTree(random_airports)
+    rng = random.Random(5)
+    for _ in range(100):
+        latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        k = rng.randint(1, 8)
+        found = tree.nearest(latitude, longitude, k)
+        expected = brute_force(random_airports, latitude, longitude, k)
+        assert [a.iata for a, _ in found] == [iata for _, iata in expected]
+        assert [km for _, km in found] == pytest.approx([km for km, _ in expected], abs=1e-6)
+
+
+def test_nearest_respects_the_radius(random_airports):
+    tree = GeoTree(random_airports)
+    found = tree.nearest(48.85, 2.35, k=50, radius_km=1500)
+    expected = brute_force(random_airports, 48.85, 2.35, 50, radius_km=1500)
+    assert [a.iata for a, _ in found] == [iata for _, iata in expected]
+    assert all(km <= 1500 for _, km in found)
+
+
+def test_nearest_across_the_antimeridian_and_poles():
+    tree = GeoTree([airport("WST", 0.0, 179.9), airport("EST", 0.0, -179.9), airport("MID", 0.0, 100.0),
+                    airport("NTH", 89.9, 0.0), airport("NTX", 89.9, 180.0)])
+    assert [a.iata for a, _ in tree.nearest(0.0, -179.95, k=2)] == ["EST", "WST"]
+    assert {a.iata for a, _ in tree.nearest(90.0, 45.0, k=2)} == {"NTH", "NTX"}
+
+
+def test_nearest_edge_cases():
+    assert GeoTree([]).nearest(0, 0) == []
+    assert GeoTree([airport("ONE", 1, 1)]).nearest(0, 0, k=0) == []
+    assert [a.iata for a, _ in GeoTree([airport("ONE", 1, 1)]).nearest(0, 0, k=5)] == ["ONE"]
+
+
+def test_metro_areas_pick_the_main_country_and_drop_stray_airfields():
+    airports = [
+        airport("LHR", 51.47, -0.45, "London", "United Kingdom"),
+        airport("LGW", 51.15, -0.19, "London", "United Kingdom"),
+        airport("LCY", 51.50, 0.05, "London", "United Kingdom"),
+        airport("YXU", 43.03, -81.15, "London", "Canada"),
+        # Same name, same country, far away
+        airport("XXX", 57.0, -3.0, "London", "United Kingdom"),
+    ]
+    metros = metro_areas(airports, radius_km=80)
+    assert metros["london"][0] == "LHR"
+    assert set(metros["london"]) == {"LHR", "LGW", "LCY"}
+    assert metro_areas(airports, radius_km=80, max_airports=2)["london"] == metros["london"][:2]
+
+
+def test_index_lookups():
+    index = get_airport_index()
+    jfk = index.airport_by_iata("jfk")
+    assert jfk.city == "New York"
+    assert index.airport_by_icao("KJFK") == jfk
+    assert index.nearest_airports(jfk.latitude, jfk.longitude, k=1)[0][0].iata == "JFK"
+    assert {"JFK", "LGA"} <= set(index.metro_airports("  new YORK "))
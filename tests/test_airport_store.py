@@ -0,0 +1,52 @@
+import pytest
+
+from utils.airport_index import AirportIndex
+from utils.airport_store import AirportStore, MAGIC, compile_airports, open_store
+
+CSV = """key,name,city,country,iata,icao,latitude,longitude,altitude,timezone,dst
+LHR,Heathrow Airport,London,United Kingdom,LHR,EGLL,51.4706,-0.461941,83,0,E
+LGW,Gatwick Airport,London,United Kingdom,LGW,EGKK,51.148102,-0.190278,202,0,E
+CDG,Charles de Gaulle International Airport,Paris,France,CDG,LFPG,49.012798,2.55,392,1,E
+ZRH,Zürich Airport,Zurich,Switzerland,ZRH,LSZH,47.464699,8.54917,1416,1,E
+NRT,Narita International Airport,Tokyo,Japan,NRT,RJAA,35.764702,140.386002,141,9,U
+"""
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "airports.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return str(path)
+
+
+def test_compiled_index_matches_the_csv(csv_path):
+    path = compile_airports(csv_path)
+    store = open_store(csv_path, path)
+    assert store is not None
+    compiled, parsed = AirportIndex.from_store(csv_path, store), AirportIndex.from_csv(csv_path)
+
+    assert list(compiled.airports) == list(parsed.airports)
+    assert dict(compiled.city_to_metro) == dict(parsed.city_to_metro)
+    assert compiled.airport_by_iata("zrh").name == "Zürich Airport"
+    assert compiled.airport_by_icao("EGKK") == parsed.airport_by_icao("EGKK")
+    assert ([a.iata for a, _ in compiled.nearest_airports(48.85, 2.35, k=3)]
+            == [a.iata for a, _ in parsed.nearest_airports(48.85, 2.35, k=3)])
+
+
+def test_stale_compiled_file_is_ignored(csv_path):
+    path = compile_airports(csv_path)
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write("CIA,Ciampino Airport,Rome,Italy,CIA,LIRA,41.7994,12.5949,427,1,E\n")
+    assert open_store(csv_path, path) is None
+    # AirportIndex.load falls back to parsing the changed CSV
+    assert AirportIndex.load(csv_path).airport_by_iata("CIA").city == "Rome"
+
+
+def test_corrupt_or_missing_compiled_file_is_ignored(csv_path, tmp_path):
+    assert open_store(csv_path, str(tmp_path / "missing.bin")) is None
+    path = compile_airports(csv_path)
+    with open(path, "r+b") as f:
+        f.write(b"X" * len(MAGIC))
+    assert open_store(csv_path, path) is None
+    with pytest.raises(ValueError):
+        AirportStore(path)
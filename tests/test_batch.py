@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from utils.cache import get_cache
+
+
+def components(temp_f):
+    model = main.get_scoring_model()
+    weather = {"current": {"temp_f": temp_f, "humidity": 50, "condition": {"text": "Sunny"}}, "status": "success"}
+    weather["weather_score"] = model.weather_score(weather)
+    safety = {"articles_count": 10, "safety_score": model.safety_score(10), "risk_level": "Low", "status": "success"}
+    flights = {"total_flights": 40, "unique_airlines": 5,
+               "availability_score": model.availability_score(40, 5), "status": "success"}
+    return weather, safety, flights
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    calls = []
+
+    async def fake_fetch(city):
+        calls.append(city)
+        return components(70 if city == "London" else 40)
+
+    get_cache("scores").clear()
+    monkeypatch.setattr(main, "_fetch_components", fake_fetch)
+    yield calls
+    get_cache("scores").clear()
+
+
+def post(cities):
+    response = TestClient(main.app).post("/recommend/batch", json={"cities": cities})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_looks_up_each_resolved_city_once(fetched):
+    lines = post(["NYC", "New York", "  new   york ", "JFK", "Lodnon", "London"])
+    assert sorted(fetched) == ["London", "New York"]
+    assert sorted(line["destination"] for line in lines if line["type"] == "result") == ["London", "New York"]
+
+
+def test_batch_ranks_results_and_serves_repeats_from_the_cache(fetched):
+    lines = post(["New York", "London"])
+    ranking = lines[-1]
+    assert ranking["type"] == "ranking"
+    assert [row["destination"] for row in ranking["ranking"]] == ["London", "New York"]
+
+    # Same scores as a single /recommend lookup of the same data
+    weather, safety, flights = components(70)
+    composite, _, _ = main.calculate_composite_score(weather, safety, flights, "London")
+    assert ranking["ranking"][0]["composite_score"] == composite
+
+    post(["London"])
+    assert sorted(fetched) == ["London", "New York"]
+
+
+def test_batch_rejects_empty_and_oversized_requests():
+    client = TestClient(main.app)
+    assert client.post("/recommend/batch", json={"cities": ["  "]}).status_code == 400
+    too_many = [f"City {i}" for i in range(main.BATCH_MAX_CITIES + 1)]
+    assert client.post("/recommend/batch", json={"cities": too_many}).status_code == 400
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+from utils.cache import CACHE_PARTIAL_TTL, TTLCache, cache_key
+from utils.cache_backends import MISSING, MemoryBackend
+
+
+def make_cache(ttl=60.0, stale_grace=3600.0):
+    return TTLCache("test", ttl, MemoryBackend(), stale_grace=stale_grace)
+
+
+def test_cache_key_ignores_case_and_spacing():
+    assert cache_key("  New   York ") == cache_key("new york")
+    assert cache_key("Paris", "2024-01-15") == "paris|2024-01-15"
+
+
+def test_hit_after_fetch():
+    cache = make_cache()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {"status": "success", "value": 1}
+
+    assert cache.get_or_fetch("k", fetch)["value"] == 1
+    assert cache.get_or_fetch("k", fetch)["value"] == 1
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expired_entry_is_kept_for_the_stale_grace():
+    cache = make_cache(ttl=0.05)
+    cache.set("k", {"status": "success"})
+    time.sleep(0.1)
+    assert cache.get("k") is MISSING
+    assert cache.get_stale("k") == {"status": "success"}
+    assert cache.ttl_remaining("k") is None
+
+
+def test_upstream_error_is_answered_with_stale_data():
+    cache = make_cache(ttl=0.05)
+    cache.set("k", {"status": "success", "value": 1})
+    time.sleep(0.1)
+    result = cache.get_or_fetch("k", lambda: {"status": "error", "error": "down"})
+    assert result == {"status": "success", "value": 1, "stale": True}
+    assert cache.stale_served == 1
+
+
+def test_errors_without_stale_data_are_not_cached():
+    cache = make_cache()
+    error = {"status": "error", "error": "down"}
+    assert cache.get_or_fetch("k", lambda: error) == error
+    assert cache.get_stale("k") is MISSING
+
+
+def test_partial_results_are_cached_briefly():
+    cache = make_cache(ttl=3600)
+    cache.get_or_fetch("k", lambda: {"status": "partial", "error": "LHR: down"})
+    remaining = cache.ttl_remaining("k")
+    assert remaining is not None and remaining <= min(3600, CACHE_PARTIAL_TTL)
+
+
+def test_fetched_values_expire_with_their_inputs():
+    inputs = make_cache(ttl=100)
+    inputs.set("k", {"status": "success"})
+    derived = make_cache(ttl=3600)
+    derived.limit_ttl(lambda key, value: inputs.ttl_remaining(key))
+    derived.get_or_fetch("k", lambda: {"status": "success"})
+    assert derived.ttl_remaining("k") <= 100
+    # Without cached inputs the value keeps its own TTL
+    derived.get_or_fetch("other", lambda: {"status": "success"})
+    assert derived.ttl_remaining("other") > 3000
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = make_cache()
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"status": "success"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch("k", fetch))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert results == [{"status": "success"}] * 8
+
+
+def test_concurrent_async_misses_share_one_fetch():
+    cache = make_cache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"status": "success"}
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_fetch_async("k", fetch) for _ in range(8)))
+
+    assert asyncio.run(run()) == [{"status": "success"}] * 8
+    assert len(calls) == 1
+
+
+def test_listeners_see_every_write():
+    cache = make_cache()
+    seen = []
+    cache.subscribe(lambda key, value: seen.append((key, value)))
+    cache.set("k", 1)
+    assert seen == [("k", 1)]
+
+
+def test_sqlite_backend_evicts_the_least_recently_used(tmp_path, monkeypatch):
+    from utils.cache_backends import SQLiteBackend
+
+    monkeypatch.setattr(SQLiteBackend, "PRUNE_EVERY", 4)
+    monkeypatch.setattr(SQLiteBackend, "TOUCH_INTERVAL", 0.0)
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"), maxsize=3)
+    # "old" expires first, but is read after the others were written
+    backend.set("old", 1, 60)
+    backend.set("a", 2, 3600)
+    backend.set("b", 3, 3600)
+    backend.get("old")
+    backend.set("c", 4, 3600)
+    assert backend.get("a") is MISSING
+    assert [backend.get(key) for key in ("old", "b", "c")] == [1, 3, 4]
+    backend.close()
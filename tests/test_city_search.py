@@ -0,0 +1,68 @@
+import pytest
+
+from utils.city_search import get_city_search
+
+
+@pytest.fixture(scope="module")
+def search():
+    return get_city_search()
+
+
+@pytest.mark.parametrize("query, city", [
+    ("London", "London"),
+    ("  new   YORK ", "New York"),
+    ("Zürich", "Zurich"),
+    ("NYC", "New York"),
+    ("LA", "Los Angeles"),
+    ("JFK", "New York"),
+    ("KJFK", "New York"),
+])
+def test_resolve_exact_names_codes_and_aliases(search, query, city):
+    assert search.resolve(query) == city
+
+
+@pytest.mark.parametrize("query, city", [
+    ("Lodnon", "London"),
+    ("Tokio", "Tokyo"),
+    ("Frankfrut", "Frankfurt"),
+])
+def test_resolve_corrects_typos(search, query, city):
+    assert search.resolve(query) == city
+
+
+@pytest.mark.parametrize("query", ["Nowhereville", "xyzzy", "a", "", "   ", "Kyoto", "Paris, France"])
+def test_resolve_rejects_unknown_names(search, query):
+    assert search.resolve(query) is None
+
+
+@pytest.mark.parametrize("query", ["Bali", "Bath", "Maui", "Berln"])
+def test_resolve_does_not_swap_in_another_real_city(search, query):
+    # Too short to be sure of, or as close to several cities
+    assert search.resolve(query) is None
+
+
+def test_unknown_names_reach_the_upstream_as_typed():
+    from fastapi import HTTPException
+    from main import _resolve_city
+
+    assert _resolve_city("  Brooklyn ") == "Brooklyn"
+    assert _resolve_city("Lodnon") == "London"
+    with pytest.raises(HTTPException) as e:
+        _resolve_city("Nowhereville", strict=True)
+    assert e.value.status_code == 404
+
+
+def test_resolve_keeps_country_names_as_typed(search):
+    assert search.resolve("France") == "France"
+
+
+def test_suggest_ranks_fuzzy_matches_like_resolve(search):
+    for query in ("Lodnon", "Tokio", "Frankfrut"):
+        assert search.suggest(query, 3)[0]["city"] == search.resolve(query)
+
+
+def test_suggest_puts_prefix_matches_first(search):
+    suggestions = search.suggest("Lond", 5)
+    assert suggestions[0]["city"] == "London"
+    assert suggestions[0]["match"] != "fuzzy"
+    assert len(suggestions) <= 5
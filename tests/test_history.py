@@ -0,0 +1,109 @@
+import asyncio
+import random
+import statistics
+import time
+
+import pytest
+
+from utils.cache import get_cache
+from utils.history import HistoryRecorder, HistoryStore, _day, extract_metrics, trend
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"), ewma_alpha=0.5)
+    yield store
+    store.close()
+
+
+def weather(temp_f, humidity=50):
+    return {"current": {"temp_f": temp_f, "humidity": humidity}, "weather_score": 70, "status": "success"}
+
+
+def test_rollups_match_a_full_recompute(store):
+    rng = random.Random(2)
+    temps = [round(rng.uniform(20, 100), 1) for _ in range(200)]
+    start = time.time() - 3600
+    # Several transactions, so the upserts build on rows written earlier
+    for offset in range(0, len(temps), 50):
+        store.append([("Paris", "weather", start + i, weather(t)) for i, t in enumerate(temps[offset:offset + 50], offset)])
+
+    rollup = store.rollups("  PARIS ")["weather"]["temp_f"]
+    assert rollup["samples"] == len(temps)
+    assert rollup["mean"] == pytest.approx(statistics.mean(temps), abs=0.01)
+    assert rollup["stddev"] == pytest.approx(statistics.stdev(temps), abs=0.01)
+    assert rollup["latest"] == temps[-1]
+    assert rollup["since"] == start and rollup["updated_at"] == start + len(temps) - 1
+
+    ewma = temps[0]
+    for value in temps[1:]:
+        ewma += 0.5 * (value - ewma)
+    assert rollup["moving_average"] == pytest.approx(ewma, abs=0.01)
+
+
+def test_late_observations_do_not_replace_the_latest_value(store):
+    now = time.time()
+    store.append([("Rome", "weather", now, weather(80))])
+    store.append([("Rome", "weather", now - 60, weather(60))])
+    rollup = store.rollups("Rome")["weather"]["temp_f"]
+    assert rollup["latest"] == 80
+    assert rollup["updated_at"] == now
+    assert rollup["samples"] == 2
+
+
+def test_daily_buckets(store):
+    now = time.time()
+    store.append([("Oslo", "weather", now - 86400, weather(30)),
+                  ("Oslo", "weather", now, weather(40)), ("Oslo", "weather", now, weather(50))])
+    days = store.daily("Oslo", days=7)["weather"]["temp_f"]
+    assert [(d["day"], d["count"], d["min"], d["max"], d["mean"]) for d in days] == [
+        (_day(now - 86400), 1, 30, 30, 30),
+        (_day(now), 2, 40, 50, 45),
+    ]
+
+
+def test_only_finite_numeric_metrics_are_tracked():
+    result = {"current": {"temp_f": float("nan"), "humidity": True, "wind_mph": "7"}, "weather_score": 55}
+    assert extract_metrics("weather", result) == {"weather_score": 55.0}
+    assert extract_metrics("unknown", result) == {}
+
+
+def test_trend_direction():
+    assert trend(1, 10, 0, 10, 10, 0, 0)["direction"] == "steady"
+    # Mean 50, stddev 10: a moving average of 60 is more than half a stddev above
+    up = trend(11, 50, 1000, 60, 70, 0, 0)
+    assert up["direction"] == "up" and up["stddev"] == 10 and up["z_score"] == 2
+    assert trend(11, 50, 1000, 44, 40, 0, 0)["direction"] == "down"
+
+
+def test_recorder_writes_in_the_background(store):
+    recorder = HistoryRecorder(store, flush_interval=0)
+    for t in (60, 70):
+        recorder.record("Lima", "weather", weather(t))
+    recorder.close()
+    assert store.rollups("Lima")["weather"]["temp_f"]["samples"] == 2
+
+
+def test_only_rolling_flight_results_are_recorded(monkeypatch):
+    from utils import flight_api, history
+
+    recorded = []
+
+    class Recorder:
+        def record(self, city, source, result):
+            recorded.append((city, source))
+
+    async def fetch(city, window=None):
+        return {"total_flights": 12, "unique_airlines": 3, "availability_score": 40, "status": "success"}
+
+    monkeypatch.setattr(history, "get_history", lambda: Recorder())
+    monkeypatch.setattr(flight_api, "_flights_for_city_async", fetch)
+    get_cache("flights").clear()
+    try:
+        # Flights for a travel day describe that day, not the day they were observed on
+        asyncio.run(flight_api.get_flights_on_day_async("Quito", "2030-01-01"))
+        assert recorded == []
+        asyncio.run(flight_api.get_flights_async("Quito"))
+        assert recorded == [("Quito", "flights")]
+    finally:
+        get_cache("flights").clear()
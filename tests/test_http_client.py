@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import http_client
+from utils.upstream import BudgetExhausted, UpstreamScheduler
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.hits += 1
+        status, headers = server.responses.pop(0) if server.responses else (200, {})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.hits, server.responses = 0, []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/data"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    def make(per_minute):
+        # Burst of per_minute / 6 tokens, and nothing refills within a test
+        scheduler = UpstreamScheduler({"api": per_minute}, burst_seconds=10, max_wait=0, background_max_wait=0,
+                                      workers=1)
+        monkeypatch.setattr(http_client, "scheduler", scheduler)
+        return scheduler
+
+    monkeypatch.setattr(http_client, "BACKOFF_FACTOR", 0.0)
+    return make
+
+
+def async_get(url):
+    async def run():
+        try:
+            return await http_client.async_get(url, provider="api")
+        finally:
+            await http_client.close_async_client()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("get", [lambda url: http_client.get(url, provider="api"), async_get])
+def test_every_retry_takes_a_token(upstream, budget, get):
+    scheduler = budget(60)
+    upstream.responses = [(500, {}), (503, {})]
+    assert get(upstream.url).status_code == 200
+    assert upstream.hits == 3
+    assert scheduler.stats()["api"]["granted"] == 3
+
+
+@pytest.mark.parametrize("get", [lambda url: http_client.get(url, provider="api"), async_get])
+def test_retries_stop_when_the_budget_runs_out(upstream, budget, get):
+    scheduler = budget(12)  # two tokens
+    upstream.responses = [(500, {})] * 3
+    assert get(upstream.url).status_code == 500
+    assert upstream.hits == 2
+    assert scheduler.stats()["api"]["granted"] == 2
+
+
+@pytest.mark.parametrize("get", [lambda url: http_client.get(url, provider="api"), async_get])
+def test_throttling_pauses_the_budget_instead_of_retrying(upstream, budget, get):
+    scheduler = budget(60)
+    upstream.responses = [(429, {"Retry-After": "30"})]
+    assert get(upstream.url).status_code == 429
+    assert upstream.hits == 1
+    assert scheduler.stats()["api"]["throttled"] == 1
+    with pytest.raises(BudgetExhausted) as shed:
+        scheduler.acquire_blocking("api")
+    assert shed.value.retry_after == pytest.approx(30, abs=1)
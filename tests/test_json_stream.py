@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from utils.json_stream import ArrayItemParser, iter_array_items
+
+DOCUMENT = {
+    "meta": {"departures": "not an array", "note": "ignored"},
+    "departures": [
+        {"number": "BA 117", "airline": {"name": "British Airways"}, "codeshares": ["AA 6140"]},
+        {"number": "LH 901", "airline": {"name": "Lufthansa"}, "note": "Zürich ✈ München"},
+    ],
+    "other": [1, 2, 3],
+    "arrivals": [{"number": "AF 1680", "nested": {"departures": [{"number": "inner"}]}}],
+}
+
+
+def expected_items():
+    return [("departures", item) for item in DOCUMENT["departures"]] + \
+           [("arrivals", item) for item in DOCUMENT["arrivals"]]
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+def test_items_match_a_full_parse_at_any_chunk_size(size):
+    # Multi-byte characters and array headers get split across chunks at small sizes
+    data = json.dumps(DOCUMENT, ensure_ascii=False).encode("utf-8")
+    assert list(iter_array_items(chunked(data, size), ["departures", "arrivals"])) == expected_items()
+
+
+def test_only_selected_arrays_are_read():
+    data = json.dumps(DOCUMENT).encode("utf-8")
+    items = list(iter_array_items([data], ["arrivals"]))
+    assert items == [("arrivals", DOCUMENT["arrivals"][0])]
+
+
+def test_empty_arrays_and_missing_keys():
+    assert list(iter_array_items([b'{"departures": [], "arrivals": []}'], ["departures", "arrivals"])) == []
+    assert list(iter_array_items([b'{"error": "quota"}'], ["departures"])) == []
+
+
+def test_truncated_array_raises():
+    data = json.dumps(DOCUMENT).encode("utf-8")
+    with pytest.raises(ValueError):
+        list(iter_array_items([data[:len(data) // 2]], ["departures", "arrivals"]))
+
+
+def test_oversized_element_raises(monkeypatch):
+    monkeypatch.setattr("utils.json_stream.MAX_ITEM_CHARS", 100)
+    parser = ArrayItemParser(["departures"])
+    with pytest.raises(ValueError):
+        parser.feed('{"departures": [{"number": "' + "x" * 200)
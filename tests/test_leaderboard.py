@@ -0,0 +1,126 @@
+import random
+import time
+from unittest import mock
+
+import pytest
+
+from utils.cache import get_cache
+from utils.leaderboard import Leaderboard, SkipList, region_for
+from utils.safety_api import safety_cache_key
+
+
+def entry(city, country, score, updated_at=None):
+    return {
+        "destination": city,
+        "country": country,
+        "region": region_for(country),
+        "composite_score": score,
+        "updated_at": time.time() if updated_at is None else updated_at,
+    }
+
+
+@pytest.fixture
+def leaderboard():
+    board = Leaderboard(scan_interval=0)
+    board.update("paris", entry("Paris", "France", 81))
+    board.update("london", entry("London", "United Kingdom", 74))
+    board.update("tokyo", entry("Tokyo", "Japan", 90))
+    board.update("lyon", entry("Lyon", "France", 74))
+    return board
+
+
+def test_skiplist_matches_a_sorted_list():
+    rng = random.Random(7)
+    skiplist, reference = SkipList(seed=1), []
+    for key in rng.sample(range(10000), 500):
+        skiplist.insert(key, str(key))
+        reference.append(key)
+    for key in rng.sample(reference, 200):
+        assert skiplist.remove(key) == str(key)
+        reference.remove(key)
+    reference.sort()
+    assert len(skiplist) == len(reference)
+    assert [key for key, _ in skiplist.iter_from(0)] == reference
+    assert [key for key, _ in skiplist.iter_from(250)] == reference[250:]
+    for i in (0, 1, 150, len(reference) - 1):
+        assert skiplist.rank(reference[i]) == i
+
+
+def test_skiplist_remove_missing_key():
+    skiplist = SkipList()
+    skiplist.insert(1, "a")
+    with pytest.raises(KeyError):
+        skiplist.remove(2)
+
+
+def test_top_orders_by_score_then_name(leaderboard):
+    total, rows = leaderboard.top(10)
+    assert total == 4
+    assert [r["destination"] for r in rows] == ["Tokyo", "Paris", "London", "Lyon"]
+    assert [r["rank"] for r in rows] == [1, 2, 3, 4]
+
+
+def test_top_pages_and_filters(leaderboard):
+    total, rows = leaderboard.top(2, offset=1)
+    assert total == 4
+    assert [(r["rank"], r["destination"]) for r in rows] == [(2, "Paris"), (3, "London")]
+    assert [r["destination"] for r in leaderboard.top(10, country=" france ")[1]] == ["Paris", "Lyon"]
+    assert [r["destination"] for r in leaderboard.top(10, region="europe")[1]] == ["Paris", "London", "Lyon"]
+    assert leaderboard.top(10, country="Atlantis") == (0, [])
+
+
+def test_update_moves_an_entry(leaderboard):
+    leaderboard.update("london", entry("London", "United Kingdom", 95))
+    assert leaderboard.rank("London") == 1
+    assert leaderboard.rank("tokyo") == 2
+    assert leaderboard.top(10)[0] == 4
+
+
+def test_sweep_drops_old_entries(leaderboard):
+    leaderboard.update("tokyo", entry("Tokyo", "Japan", 90, updated_at=time.time() - 2 * leaderboard.max_age))
+    assert leaderboard.sweep() == 1
+    assert leaderboard.rank("Tokyo") is None
+    assert leaderboard.top(10, country="Japan") == (0, [])
+
+
+@pytest.fixture
+def cached_components():
+    caches = [get_cache(source) for source in ("weather", "safety", "flights")]
+    for cache in caches:
+        cache.clear()
+
+    def store(city, ages=(0, 0, 0)):
+        weather = {"current": {"temp_f": 72, "humidity": 40, "condition": {"text": "Sunny"}},
+                   "weather_score": 100, "status": "success"}
+        safety = {"articles_count": 3, "safety_score": 82, "status": "success"}
+        flights = {"total_flights": 200, "unique_airlines": 20, "availability_score": 100, "status": "success"}
+        now = time.time()
+        for cache, key, value, age in zip(caches, (city, safety_cache_key(city), city), (weather, safety, flights),
+                                          ages):
+            with mock.patch("utils.cache.time.time", return_value=now - age):
+                cache.set(key, value)
+
+    yield store
+    for cache in caches:
+        cache.clear()
+
+
+def test_refresh_ranks_with_the_oldest_component_time(cached_components):
+    board = Leaderboard(max_age=3600, scan_interval=0)
+    cached_components("Paris", ages=(0, 600, 60))
+    cached_components("Tokyo")
+    assert board.refresh_many(["Paris", "Tokyo", "Atlantis"]) == 2
+    paris = board.top(10, country="France")[1][0]
+    assert paris["updated_at"] == pytest.approx(time.time() - 600, abs=5)
+    assert paris["composite_score"] == board.top(10, country="Japan")[1][0]["composite_score"]
+
+
+def test_refresh_unranks_cities_with_dead_components(cached_components):
+    board = Leaderboard(max_age=3600, scan_interval=0)
+    cached_components("Paris")
+    board.refresh("Paris")
+    assert board.rank("Paris") == 1
+    # Safety is still in the cache's stale grace, but older than max_age
+    cached_components("Paris", ages=(0, 7200, 0))
+    board.refresh("Paris")
+    assert board.rank("Paris") is None
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pytest
+
+from utils import prewarm
+from utils.prewarm import Prewarmer, RequestTracker
+
+
+def test_tracker_ranks_by_decayed_request_count():
+    tracker = RequestTracker(half_life=3600)
+    for city, count in (("Paris", 3), ("Rome", 1), ("Oslo", 2)):
+        for _ in range(count):
+            tracker.record(city, ("weather",))
+    tracker.record("Lima", ("safety",))
+    assert tracker.top("weather", 2) == [("paris", "Paris"), ("oslo", "Oslo")]
+    assert tracker.top("safety", 5) == [("lima", "Lima")]
+
+
+def test_old_requests_count_for_less():
+    tracker = RequestTracker(half_life=1)
+    tracker.record("Paris", ("weather",))
+    tracker.record("Paris", ("weather",))
+    tracker._counts[("weather", "paris")] = (2.0, time.time() - 10)
+    tracker.record("Rome", ("weather",))
+    assert tracker.top("weather", 1) == [("rome", "Rome")]
+
+
+@pytest.mark.parametrize("backend, workers, exclusive", [
+    ("memory", 1, False),
+    ("memory", 4, False),
+    ("sqlite", 1, False),
+    ("sqlite", 4, True),
+])
+def test_only_a_shared_cache_is_prewarmed_by_one_worker(monkeypatch, tmp_path, backend, workers, exclusive):
+    monkeypatch.setattr(prewarm, "CACHE_BACKEND", backend)
+    monkeypatch.setattr(prewarm, "UPSTREAM_WORKERS", workers)
+    lock_path = str(tmp_path / "prewarm.lock")
+    first, second = Prewarmer({}, lock_path=lock_path), Prewarmer({}, lock_path=lock_path)
+    assert first.owns_prewarming()
+    assert second.owns_prewarming() is not exclusive
+    asyncio.run(first.stop())
+    assert second.owns_prewarming()
+
+
+def test_stats_report_queue_lag_of_the_most_overdue_refresh():
+    tracker = RequestTracker()
+    tracker.record("Paris", ("weather",))
+    tracker.record("Rome", ("weather",))
+
+    async def refresh(city):
+        await asyncio.sleep(0.2)
+        return {"status": "success"}
+
+    async def run():
+        prewarmer = Prewarmer({"weather": refresh}, tracker=tracker, workers=1, budgets={})
+        prewarmer.start()
+        await asyncio.sleep(0.05)
+        during = prewarmer.stats()
+        await asyncio.sleep(0.5)
+        after = prewarmer.stats()
+        await prewarmer.stop()
+        return during, after
+
+    during, after = asyncio.run(run())
+    assert during["queue_depth"] == 1 and during["queue_lag_seconds"] > 0
+    assert after["queue_depth"] == 0 and after["queue_lag_seconds"] == 0
+    assert after["completed"] == 2
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils import rate_limit
+from utils.rate_limit import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_starts_full_and_reports_the_wait(clock):
+    bucket = TokenBucket(rate=2.0, capacity=4)
+    assert [bucket.try_acquire() for _ in range(4)] == [0.0] * 4
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    assert bucket.try_acquire(tokens=3) == pytest.approx(1.5)
+
+
+def test_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2.0, capacity=4)
+    bucket.try_acquire(tokens=4)
+    clock[0] += 1.0
+    assert bucket.stats()["available"] == 2.0
+    clock[0] += 60.0
+    assert bucket.stats()["available"] == 4.0
+
+
+def test_reserve_is_left_in_the_bucket(clock):
+    bucket = TokenBucket(rate=1.0, capacity=4)
+    assert bucket.try_acquire(tokens=3, reserve=1) == 0.0
+    assert bucket.try_acquire(reserve=1) == pytest.approx(1.0)
+    # Without a reserve the last token can still be taken
+    assert bucket.try_acquire() == 0.0
+
+
+def test_multi_token_requests_are_all_or_nothing(clock):
+    bucket = TokenBucket(rate=1.0, capacity=4)
+    bucket.try_acquire(tokens=2)
+    assert bucket.try_acquire(tokens=3) > 0
+    assert bucket.stats()["available"] == 2.0
+
+
+def test_zero_rate_never_refills(clock):
+    bucket = TokenBucket(rate=0.0, capacity=1)
+    bucket.try_acquire()
+    assert bucket.try_acquire() == float("inf")
+
+
+def test_concurrent_threads_never_overdraw():
+    bucket = TokenBucket(rate=0.0, capacity=100)
+    granted = []
+
+    def take():
+        for _ in range(50):
+            if bucket.try_acquire() == 0.0:
+                granted.append(1)
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(granted) == 100
+
+
+def test_acquire_waits_for_a_refill():
+    bucket = TokenBucket(rate=50.0, capacity=1)
+    bucket.acquire_blocking()
+    asyncio.run(bucket.acquire())
+    assert bucket.stats()["available"] < 1
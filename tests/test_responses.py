@@ -0,0 +1,28 @@
+import gzip
+
+from utils.responses import EncodedBody, EncodedCache, dumps
+
+BODY = dumps({"destination": "Paris", "summary": "Paris offers good weather " * 40})
+
+
+def test_compressed_variants_round_trip():
+    payload = EncodedBody(BODY)
+    assert gzip.decompress(payload.encoded("gzip")) == BODY
+    assert payload.encoded(None) is BODY
+    assert len({payload.etag_for(encoding) for encoding in (None, "gzip", "br")}) == 3
+
+
+def test_one_shot_bodies_use_the_fast_level():
+    # Byte 8 of a gzip header (XFL) is 2 only for the maximum compression level
+    assert EncodedBody(BODY).encoded("gzip")[8] == 2
+    assert EncodedBody(BODY, reused=False).encoded("gzip")[8] == 0
+    assert gzip.decompress(EncodedBody(BODY, reused=False).encoded("gzip")) == BODY
+
+
+def test_encoded_cache_reuses_the_encoding_of_the_same_object():
+    cache = EncodedCache()
+    value = {"destination": "Paris"}
+    first = cache.get("paris", value)
+    assert cache.get("paris", value) is first
+    # An equal but new object (as a shared backend returns) is re-encoded
+    assert cache.get("paris", dict(value)) is not first
@@ -0,0 +1,70 @@
+import random
+
+import numpy as np
+
+from main import calculate_composite_score
+from utils.scoring import score_results
+from utils.scoring_model import get_scoring_model
+
+CONDITIONS = [
+    "Sunny", "Clear", "Partly cloudy", "Overcast", "Mist", "Patchy rain possible",
+    "Light drizzle", "Heavy snow", "Thundery outbreaks possible", "",
+]
+
+ERROR = {"status": "error", "error": "upstream unavailable"}
+
+
+def make_results(n, seed=3):
+    """Component results as the weather, safety and flight APIs return them, some failed."""
+    rng = random.Random(seed)
+    model = get_scoring_model()
+    weather, safety, flights = [], [], []
+    for _ in range(n):
+        current = {
+            "temp_f": round(rng.uniform(-10, 110), 1),
+            "humidity": rng.randint(0, 100),
+            "condition": {"text": rng.choice(CONDITIONS)},
+        }
+        if rng.random() < 0.05:
+            current["temp_f"] = float("nan")
+        result = {"current": current, "status": "success"}
+        weather.append(ERROR if rng.random() < 0.1 else {**result, "weather_score": model.weather_score(result)})
+
+        articles = rng.randint(0, 500)
+        safety.append(ERROR if rng.random() < 0.1 else {
+            "articles_count": articles, "safety_score": model.safety_score(articles), "status": "success",
+        })
+
+        total, airlines = rng.randint(0, 400), rng.randint(0, 20)
+        flights.append(ERROR if rng.random() < 0.1 else {
+            "total_flights": total, "unique_airlines": airlines,
+            "availability_score": model.availability_score(total, airlines), "status": "success",
+        })
+    return weather, safety, flights
+
+
+def test_score_results_matches_the_scalar_path():
+    model = get_scoring_model()
+    weather, safety, flights = make_results(2000)
+    scores = score_results(weather, safety, flights, model)
+
+    for name, results, field in (("weather", weather, "weather_score"), ("safety", safety, "safety_score"),
+                                 ("availability", flights, "availability_score")):
+        expected = [r.get(field, model.composite_missing) for r in results]
+        assert scores[name].tolist() == expected, name
+
+    expected = [calculate_composite_score(w, s, f, "", model) for w, s, f in zip(weather, safety, flights)]
+    assert scores["composite"].tolist() == [composite for composite, _, _ in expected]
+    assert scores["recommendation"].tolist() == [label for _, label, _ in expected]
+
+
+def test_score_results_counts_failed_components_as_missing():
+    model = get_scoring_model()
+    scores = score_results([ERROR], [ERROR], [ERROR], model)
+    assert scores["weather"].tolist() == [model.composite_missing]
+    assert scores["composite"].tolist() == [calculate_composite_score(ERROR, ERROR, ERROR, "", model)[0]]
+
+
+def test_score_results_empty():
+    scores = score_results([], [], [])
+    assert all(isinstance(column, np.ndarray) and len(column) == 0 for column in scores.values())
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from utils.upstream import BACKGROUND, INTERACTIVE, BudgetExhausted, UpstreamScheduler
+
+
+def make_scheduler(per_minute=30.0, workers=1, **kwargs):
+    kwargs.setdefault("max_wait", 0)
+    kwargs.setdefault("background_max_wait", 0)
+    return UpstreamScheduler({"api": per_minute}, burst_seconds=10, workers=workers, **kwargs)
+
+
+def test_rate_and_burst_are_split_between_workers():
+    bucket = make_scheduler(per_minute=120, workers=4).buckets["api"]
+    assert bucket.rate == pytest.approx(0.5)
+    assert bucket.capacity == pytest.approx(5)
+
+
+def test_background_keeps_a_reserve_for_interactive_requests():
+    scheduler = make_scheduler(per_minute=60)  # capacity 10, 2.5 reserved
+    for _ in range(7):
+        scheduler.acquire_blocking("api", BACKGROUND)
+    with pytest.raises(BudgetExhausted):
+        scheduler.acquire_blocking("api", BACKGROUND)
+    scheduler.acquire_blocking("api", INTERACTIVE)
+
+
+@pytest.mark.parametrize("workers", [8, 16])
+def test_background_is_granted_when_a_worker_share_is_one_token(workers):
+    scheduler = make_scheduler(per_minute=30, workers=workers)
+    assert scheduler.buckets["api"].capacity == 1.0
+    scheduler.acquire_blocking("api", BACKGROUND)
+    asyncio.run(make_scheduler(per_minute=30, workers=workers).acquire("api", BACKGROUND))
+
+
+def test_unknown_providers_are_not_limited():
+    scheduler = make_scheduler()
+    scheduler.acquire_blocking("other")
+    assert scheduler.stats()["api"]["granted"] == 0
+
+
+@pytest.mark.parametrize("per_minute, workers", [(30, 1), (60, 1), (30, 4), (30, 8), (120, 3)])
+@pytest.mark.parametrize("priority", [INTERACTIVE, BACKGROUND])
+def test_max_tokens_can_always_be_granted(per_minute, workers, priority):
+    scheduler = make_scheduler(per_minute=per_minute, workers=workers)
+    tokens = scheduler.max_tokens("api", priority)
+    assert tokens >= 1
+    scheduler.acquire_blocking("api", priority, tokens=tokens)
+
+
+def test_metro_fan_out_is_capped_by_priority():
+    from utils.flight_api import _metro_budget
+    from utils.upstream import scheduler, upstream_priority
+
+    airports = ["A", "B", "C", "D", "E", "F", "G"]
+    assert len(_metro_budget(airports)) == scheduler.max_tokens("aerodatabox", INTERACTIVE)
+    token = upstream_priority.set(BACKGROUND)
+    try:
+        capped = _metro_budget(airports)
+    finally:
+        upstream_priority.reset(token)
+    assert capped == airports[:scheduler.max_tokens("aerodatabox", BACKGROUND)]
+    assert len(capped) < scheduler.max_tokens("aerodatabox", INTERACTIVE)
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from utils.upstream_archive import UpstreamArchive, archive_key, compact, iter_latest, loose_key
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "upstream.archive")
+
+
+def test_archive_key_ignores_host_credentials_and_parameter_order():
+    a = archive_key("https://api.weatherapi.com/v1/current.json?key=secret&q=Paris&aqi=no")
+    b = archive_key("http://127.0.0.1:8931/v1/current.json?aqi=no&q=Paris")
+    assert a == b == "/v1/current.json?aqi=no&q=Paris"
+    assert "secret" not in a
+    assert archive_key("https://example.com/flights/LHR") == "/flights/LHR"
+
+
+def test_loose_key_masks_dates_and_times():
+    key = archive_key("https://x/flights/airports/iata/LHR/2024-05-01T08:00/2024-05-01T20:00?withLeg=true")
+    assert loose_key(key) == "/flights/airports/iata/LHR/{date}/{date}?withLeg=true"
+    news = archive_key("https://x/v2/everything?q=Paris&from=2024-05-01")
+    assert loose_key(news) == "/v2/everything?from={date}&q=Paris"
+
+
+def test_replays_exact_and_date_shifted_requests(path):
+    recorder = UpstreamArchive(path, "record")
+    url = "https://x/flights/airports/iata/LHR/2024-05-01T08:00/2024-05-01T20:00"
+    assert recorder.record(url, 200, {"content-type": "application/json", "x-other": "1"}, b'{"departures": []}')
+    assert not recorder.record("https://x/v1/current.json?q=Paris", 429, {}, b"slow down")
+
+    replay = UpstreamArchive(path, "replay")
+    exact = replay.lookup(url + "?key=abc")
+    assert exact.status == 200 and exact.body == b'{"departures": []}'
+    assert exact.headers == {"content-type": "application/json"}
+    assert replay.lookup(url.replace("2024-05-01", "2025-01-02")).body == exact.body
+    assert replay.lookup("https://x/flights/airports/iata/CDG/2024-05-01T08:00/2024-05-01T20:00") is None
+    assert replay.lookup("https://x/v1/current.json?q=Paris") is None
+    assert (replay.hits, replay.loose_hits, replay.misses) == (1, 1, 2)
+    recorder.close()
+    replay.close()
+
+
+def test_later_records_win_and_are_seen_by_open_readers(path):
+    recorder = UpstreamArchive(path, "record")
+    reader = UpstreamArchive(path, "replay")
+    recorder.record("https://x/a?q=1", 200, {}, b"old")
+    assert reader.lookup("https://x/a?q=1").body == b"old"
+    recorder.record("https://x/a?q=1", 200, {}, b"new")
+    recorder.record("https://x/b", 200, {}, b"other")
+    assert reader.lookup("https://x/b").body == b"other"
+    assert reader.lookup("https://x/a?q=1").body == b"new"
+    recorder.close()
+    reader.close()
+
+
+def test_partial_record_is_dropped_before_appending(path):
+    recorder = UpstreamArchive(path, "record")
+    recorder.record("https://x/a", 200, {}, b"first")
+    recorder.close()
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")  # a writer killed mid-record
+    recorder = UpstreamArchive(path, "record")
+    recorder.record("https://x/b", 200, {}, b"second")
+    recorder.close()
+    assert [key for key, _ in iter_latest(path)] == ["/a", "/b"]
+
+
+def test_compact_keeps_the_newest_record_of_each_key(path):
+    recorder = UpstreamArchive(path, "record")
+    for body in (b"1", b"2", b"3"):
+        recorder.record("https://x/a", 200, {}, body * 1000)
+    recorder.close()
+    before, after = compact(path)
+    assert after < before
+    reader = UpstreamArchive(path, "replay")
+    assert reader.lookup("https://x/a").body == b"3" * 1000
+    reader.close()
+
+
+def test_a_file_that_is_not_an_archive_is_ignored(path):
+    with open(path, "wb") as f:
+        f.write(b"not an archive at all")
+    assert UpstreamArchive(path, "replay").lookup("https://x/a") is None
+    with pytest.raises(ValueError):
+        UpstreamArchive(path, "record").record("https://x/a", 200, {}, b"x")
+    assert os.path.getsize(path) == len(b"not an archive at all")
+
+
+def test_replay_needs_no_api_keys(path, monkeypatch):
+    import asyncio
+
+    from utils import http_client, upstream_archive, weather_api
+    from utils.cache import get_cache
+
+    body = b'{"location": {"name": "Paris"}, "current": {"temp_f": 68, "condition": {"text": "Sunny"}}}'
+    recorder = UpstreamArchive(path, "record")
+    recorder.record(weather_api.WEATHER_API_URL + "?q=Paris&aqi=no", 200, {"content-type": "application/json"}, body)
+    recorder.close()
+
+    monkeypatch.delenv("WEATHER_API_KEY", raising=False)
+    monkeypatch.setattr(upstream_archive, "UPSTREAM_ARCHIVE_MODE", "replay")
+    monkeypatch.setattr(upstream_archive, "_archive", UpstreamArchive(path, "replay"))
+    monkeypatch.setattr(http_client, "_session", None)
+    monkeypatch.setattr(http_client, "_async_client", None)
+
+    async def fetch_async():
+        try:
+            return await weather_api.get_weather_async("Paris")
+        finally:
+            await http_client.close_async_client()
+
+    get_cache("weather").clear()
+    try:
+        assert weather_api.get_weather("Paris")["status"] == "success"
+        get_cache("weather").clear()
+        assert asyncio.run(fetch_async())["status"] == "success"
+    finally:
+        get_cache("weather").clear()
+        upstream_archive._archive.close()
@@ -0,0 +1,440 @@
+import csv
+import heapq
+import math
+import os
+import threading
+import time
+from collections.abc import Mapping as MappingABC, Sequence as SequenceABC
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.airport_store import AirportStore, open_store
+
+DEFAULT_CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "airports.csv")
+
+# How often (seconds) the index checks whether airports.csv changed on disk
+RELOAD_CHECK_INTERVAL = float(os.getenv("AIRPORTS_RELOAD_INTERVAL", "5"))
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Airports further than this from the centre of a city's group aren't part of its metro area
+METRO_RADIUS_KM = float(os.getenv("METRO_RADIUS_KM", "80"))
+METRO_MAX_AIRPORTS = int(os.getenv("METRO_MAX_AIRPORTS", "6"))
+
+# IATA metropolitan-area codes and common abbreviations, mapped to the city
+# as airports.csv spells it. Airport IATA/ICAO codes need no entry here.
+CITY_ALIASES: Mapping[str, str] = MappingProxyType({
+    "nyc": "New York", "lon": "London", "par": "Paris", "tyo": "Tokyo", "chi": "Chicago",
+    "was": "Washington", "mow": "Moscow", "mil": "Milan", "rom": "Rome", "sao": "Sao Paulo",
+    "rio": "Rio De Janeiro", "bue": "Buenos Aires", "osa": "Osaka", "sel": "Seoul", "sto": "Stockholm",
+    "yto": "Toronto", "ymq": "Montreal", "bjs": "Beijing", "jkt": "Jakarta", "rek": "Reykjavik",
+    "buh": "Bucharest", "dtt": "Detroit", "qdf": "Dallas",
+    "la": "Los Angeles", "sf": "San Francisco", "dc": "Washington", "new york city": "New York",
+})
+
+
+class Airport(NamedTuple):
+    """Immutable airport record (tuple-backed, so it carries no per-instance __dict__)."""
+    name: str
+    city: str
+    country: str
+    iata: str
+    icao: str
+    latitude: float
+    longitude: float
+    altitude: int
+    timezone: str
+    dst: str
+
+
+def normalize_city(city: str) -> str:
+    """Normalize a city name for index lookups (trimmed, single-spaced, case-folded)."""
+    return " ".join(city.split()).casefold()
+
+
+def _to_float(value: str, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _unit_vector(latitude: float, longitude: float) -> Tuple[float, float, float]:
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def _chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def _km_to_chord(km: float) -> float:
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+def _haversine_km(a: "Airport", b: "Airport") -> float:
+    return _chord_to_km(math.dist(_unit_vector(a.latitude, a.longitude), _unit_vector(b.latitude, b.longitude)))
+
+
+def metro_areas(airports: Sequence["Airport"], radius_km: float = METRO_RADIUS_KM,
+                max_airports: int = METRO_MAX_AIRPORTS) -> Dict[str, Tuple[str, ...]]:
+    """
+    IATA codes of the airports serving each city name.
+
+    A name can belong to several places (London, UK and London, Ontario), so
+    the country with the most airports of that name wins. Within it, airports
+    more than radius_km from the group's medoid are dropped (stray same-name
+    airfields elsewhere in the country), and the rest are ordered by distance
+    from it.
+    """
+    groups: Dict[str, Dict[str, List[Airport]]] = {}
+    for airport in airports:
+        if airport.iata:
+            groups.setdefault(normalize_city(airport.city), {}).setdefault(airport.country, []).append(airport)
+    metros = {}
+    for city, by_country in groups.items():
+        # max() keeps the first of equal groups, i.e. the country listed first in the CSV
+        group = max(by_country.values(), key=len)
+        if len(group) > 1:
+            centre = min(group, key=lambda a: sum(_haversine_km(a, b) for b in group))
+            distances = [(_haversine_km(centre, a), i) for i, a in enumerate(group)]
+            group = [group[i] for km, i in sorted(distances) if km <= radius_km]
+        metros[city] = tuple(a.iata.upper() for a in group[:max_airports])
+    return metros
+
+
+class GeoTree:
+    """
+    Static k-d tree over airport positions.
+
+    Points are stored as 3-d unit vectors rather than (lat, lon), so
+    straight-line (chord) distance orders points exactly like great-circle
+    distance and nothing special happens at the antimeridian or the poles.
+    The tree is implicit: each subtree [lo, hi) of `order` has its splitting
+    point at the middle index.
+    """
+
+    __slots__ = ("airports", "points", "order")
+
+    def __init__(self, airports: Sequence[Airport], points: Optional[Sequence[Sequence[float]]] = None,
+                 order: Optional[List[int]] = None):
+        """Build the tree, or adopt a prebuilt one when points and order are given."""
+        self.airports = airports if isinstance(airports, SequenceABC) else tuple(airports)
+        if points is None:
+            points = tuple(_unit_vector(a.latitude, a.longitude) for a in self.airports)
+        self.points = points
+        if order is None:
+            self.order = list(range(len(points)))
+            self._build(0, len(self.order), 0)
+        else:
+            self.order = order
+
+    def _build(self, lo: int, hi: int, axis: int) -> None:
+        if hi - lo <= 1:
+            return
+        points = self.points
+        self.order[lo:hi] = sorted(self.order[lo:hi], key=lambda i: points[i][axis])
+        mid = (lo + hi) // 2
+        self._build(lo, mid, (axis + 1) % 3)
+        self._build(mid + 1, hi, (axis + 1) % 3)
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1,
+                radius_km: Optional[float] = None) -> List[Tuple[Airport, float]]:
+        """
+        Find the k airports closest to a point.
+
+        Args:
+            latitude: Latitude of the point in degrees
+            longitude: Longitude of the point in degrees
+            k: Maximum number of airports to return
+            radius_km: Ignore airports further away than this
+
+        Returns:
+            (airport, great-circle distance in km) pairs, nearest first
+        """
+        if k <= 0 or not self.order:
+            return []
+        query = _unit_vector(latitude, longitude)
+        limit = _km_to_chord(radius_km) ** 2 if radius_km is not None else 4.0
+        points, order = self.points, self.order
+        best: List[Tuple[float, int]] = []  # max-heap of (-squared chord, point)
+
+        def search(lo: int, hi: int, axis: int, bound: float) -> float:
+            while lo < hi:
+                mid = (lo + hi) // 2
+                i = order[mid]
+                p = points[i]
+                d = (p[0] - query[0]) ** 2 + (p[1] - query[1]) ** 2 + (p[2] - query[2]) ** 2
+                if d <= bound:
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    else:
+                        heapq.heapreplace(best, (-d, i))
+                    if len(best) == k:
+                        bound = -best[0][0]
+                diff = query[axis] - p[axis]
+                near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+                bound = search(near[0], near[1], (axis + 1) % 3, bound)
+                if diff * diff > bound:
+                    break
+                lo, hi = far
+                axis = (axis + 1) % 3
+            return bound
+
+        search(0, len(order), 0, limit)
+        return [(self.airports[i], _chord_to_km(math.sqrt(-d))) for d, i in sorted(best, reverse=True)]
+
+
+class AirportTable(SequenceABC):
+    """Airport records decoded on demand from the compiled columns."""
+
+    def __init__(self, store: AirportStore):
+        self._strings = [store.strings(f"airports.{field}") for field in
+                         ("name", "city", "country", "iata", "icao", "timezone", "dst")]
+        self._latitude = store.array("airports.latitude")
+        self._longitude = store.array("airports.longitude")
+        self._altitude = store.array("airports.altitude")
+
+    def __getitem__(self, i: int) -> Airport:
+        name, city, country, iata, icao, timezone, dst = (column[i] for column in self._strings)
+        return Airport(name, city, country, iata, icao, float(self._latitude[i]),
+                       float(self._longitude[i]), int(self._altitude[i]), timezone, dst)
+
+    def __len__(self) -> int:
+        return len(self._latitude)
+
+
+class RowView(SequenceABC):
+    """The rows of a table selected by an index array."""
+
+    def __init__(self, table: Sequence, rows: np.ndarray):
+        self._table = table
+        self._rows = rows
+
+    def __getitem__(self, i: int) -> Any:
+        return self._table[int(self._rows[i])]
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class RowLookup(MappingABC):
+    """Read-only mapping from a code to the table row holding it."""
+
+    def __init__(self, table: Sequence, rows: Dict[str, int]):
+        self._table = table
+        self._rows = rows
+
+    def __getitem__(self, key: str) -> Any:
+        return self._table[self._rows[key]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class AirportIndex:
+    """
+    Read-only lookup tables built once from airports.csv.
+
+    The maps are exposed as read-only views so callers cannot mutate a
+    shared index; a changed CSV produces a new AirportIndex instead. When
+    a current compiled file exists (see utils.airport_store) the tables are
+    mapped from it rather than rebuilt, and `store` holds that file.
+    """
+
+    __slots__ = ("csv_path", "mtime", "size", "airports", "city_to_iata", "city_to_metro", "by_iata", "by_icao",
+                 "geo", "store")
+
+    def __init__(self, csv_path: str, airports: tuple, mtime: float = 0.0, size: int = 0):
+        city_to_iata: Dict[str, str] = {}
+        by_iata: Dict[str, Airport] = {}
+        by_icao: Dict[str, Airport] = {}
+        for airport in airports:
+            if airport.iata:
+                # Keep the first match per city, as the old CSV scan did
+                city_to_iata.setdefault(normalize_city(airport.city), airport.iata)
+                by_iata.setdefault(airport.iata.upper(), airport)
+            if airport.icao:
+                by_icao.setdefault(airport.icao.upper(), airport)
+
+        self.csv_path = csv_path
+        self.mtime = mtime
+        self.size = size
+        self.airports = airports
+        self.city_to_iata: Mapping[str, str] = MappingProxyType(city_to_iata)
+        self.city_to_metro: Mapping[str, Tuple[str, ...]] = MappingProxyType(metro_areas(airports))
+        self.by_iata: Mapping[str, Airport] = MappingProxyType(by_iata)
+        self.by_icao: Mapping[str, Airport] = MappingProxyType(by_icao)
+        # Only airports with an IATA code serve scheduled flights
+        self.geo = GeoTree(by_iata.values())
+        self.store: Optional[AirportStore] = None
+
+    @classmethod
+    def from_store(cls, csv_path: str, store: AirportStore, mtime: float = 0.0, size: int = 0) -> "AirportIndex":
+        """Map a compiled airports file; nothing is parsed or rebuilt."""
+        index = cls.__new__(cls)
+        index.csv_path = csv_path
+        index.mtime = mtime
+        index.size = size
+        index.store = store
+        index.airports = AirportTable(store)
+        # Keys are decoded into per-process dicts so lookups stay O(1);
+        # the airport records themselves are only decoded when asked for
+        index.city_to_iata = MappingProxyType(dict(zip(store.strings("lookup.city.keys"),
+                                                       store.strings("lookup.city.iata"))))
+        offsets = store.array("lookup.metro.offsets").tolist()
+        metro_iata = list(store.strings("lookup.metro.iata"))
+        index.city_to_metro = MappingProxyType({
+            city: tuple(metro_iata[offsets[i]:offsets[i + 1]])
+            for i, city in enumerate(store.strings("lookup.metro.keys"))
+        })
+        index.by_iata = RowLookup(index.airports, dict(zip(store.strings("lookup.iata.keys"),
+                                                           store.array("lookup.iata.rows").tolist())))
+        index.by_icao = RowLookup(index.airports, dict(zip(store.strings("lookup.icao.keys"),
+                                                           store.array("lookup.icao.rows").tolist())))
+        # The k-d tree is walked point by point, which is faster on Python floats
+        index.geo = GeoTree(RowView(index.airports, store.array("geo.rows")),
+                            points=store.array("geo.points").tolist(), order=store.array("geo.order").tolist())
+        return index
+
+    def tables(self) -> Dict[str, Any]:
+        """Columns and lookup tables to write to a compiled airports file."""
+        rows = {id(airport): i for i, airport in enumerate(self.airports)}
+        tables: Dict[str, Any] = {
+            f"airports.{field}": [getattr(airport, field) for airport in self.airports]
+            for field in ("name", "city", "country", "iata", "icao", "timezone", "dst")
+        }
+        tables["airports.latitude"] = np.array([a.latitude for a in self.airports], dtype=np.float64)
+        tables["airports.longitude"] = np.array([a.longitude for a in self.airports], dtype=np.float64)
+        tables["airports.altitude"] = np.array([a.altitude for a in self.airports], dtype=np.int32)
+        cities = sorted(self.city_to_iata)
+        tables["lookup.city.keys"] = cities
+        tables["lookup.city.iata"] = [self.city_to_iata[city] for city in cities]
+        metros = sorted(self.city_to_metro)
+        tables["lookup.metro.keys"] = metros
+        tables["lookup.metro.offsets"] = np.cumsum([0] + [len(self.city_to_metro[city]) for city in metros],
+                                                   dtype=np.int32)
+        tables["lookup.metro.iata"] = [iata for city in metros for iata in self.city_to_metro[city]]
+        for name, lookup in (("iata", self.by_iata), ("icao", self.by_icao)):
+            codes = sorted(lookup)
+            tables[f"lookup.{name}.keys"] = codes
+            tables[f"lookup.{name}.rows"] = np.array([rows[id(lookup[code])] for code in codes], dtype=np.int32)
+        tables["geo.rows"] = np.array([rows[id(airport)] for airport in self.geo.airports], dtype=np.int32)
+        tables["geo.points"] = np.array(self.geo.points, dtype=np.float64).reshape(-1, 3)
+        tables["geo.order"] = np.array(self.geo.order, dtype=np.int32)
+        return tables
+
+    @classmethod
+    def from_csv(cls, csv_path: str = DEFAULT_CSV_PATH) -> "AirportIndex":
+        """
+        Parse airports.csv into a new index.
+
+        Args:
+            csv_path: Path to the airports CSV file
+
+        Returns:
+            AirportIndex built from the file contents
+        """
+        stat = os.stat(csv_path)
+        airports = []
+        with open(csv_path, newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader)
+            col = {name: i for i, name in enumerate(header)}
+            for row in reader:
+                if len(row) < len(header):
+                    continue
+                airports.append(Airport(
+                    name=row[col["name"]].strip(),
+                    city=row[col["city"]].strip(),
+                    country=row[col["country"]].strip(),
+                    iata=row[col["iata"]].strip(),
+                    icao=row[col["icao"]].strip(),
+                    latitude=_to_float(row[col["latitude"]]),
+                    longitude=_to_float(row[col["longitude"]]),
+                    altitude=int(_to_float(row[col["altitude"]])),
+                    timezone=row[col["timezone"]].strip(),
+                    dst=row[col["dst"]].strip(),
+                ))
+        return cls(csv_path, tuple(airports), mtime=stat.st_mtime, size=stat.st_size)
+
+    @classmethod
+    def load(cls, csv_path: str = DEFAULT_CSV_PATH) -> "AirportIndex":
+        """Map the compiled form of csv_path if it is current, else parse the CSV."""
+        stat = os.stat(csv_path)
+        store = open_store(csv_path)
+        if store is not None:
+            return cls.from_store(csv_path, store, mtime=stat.st_mtime, size=stat.st_size)
+        return cls.from_csv(csv_path)
+
+    def iata_for_city(self, city: str) -> Optional[str]:
+        return self.city_to_iata.get(normalize_city(city))
+
+    def city_for_alias(self, name: str) -> Optional[str]:
+        """City for a metro code, abbreviation (see CITY_ALIASES) or airport IATA/ICAO code."""
+        key = normalize_city(name)
+        city = CITY_ALIASES.get(key)
+        if city is not None and normalize_city(city) in self.city_to_iata:
+            return city
+        airport = self.by_iata.get(key.upper()) or self.by_icao.get(key.upper())
+        return airport.city if airport is not None and airport.city else None
+
+    def metro_airports(self, city: str) -> Tuple[str, ...]:
+        """Every airport serving a city (see metro_areas), nearest the centre first."""
+        return self.city_to_metro.get(normalize_city(city), ())
+
+    def airport_by_iata(self, iata: str) -> Optional[Airport]:
+        return self.by_iata.get(iata.strip().upper())
+
+    def airport_by_icao(self, icao: str) -> Optional[Airport]:
+        return self.by_icao.get(icao.strip().upper())
+
+    def nearest_airports(self, latitude: float, longitude: float, k: int = 5,
+                         radius_km: Optional[float] = None) -> List[Tuple[Airport, float]]:
+        """Closest IATA airports to a point, as (airport, distance in km) pairs."""
+        return self.geo.nearest(latitude, longitude, k, radius_km)
+
+    def __len__(self) -> int:
+        return len(self.airports)
+
+
+_indexes: Dict[str, AirportIndex] = {}
+_last_checked: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def get_airport_index(csv_path: str = DEFAULT_CSV_PATH) -> AirportIndex:
+    """
+    Return the shared index for csv_path, rebuilding it if the file changed.
+
+    The file is stat'ed at most once every RELOAD_CHECK_INTERVAL seconds, so
+    steady-state lookups never touch the filesystem.
+    """
+    now = time.monotonic()
+    index = _indexes.get(csv_path)
+    if index is not None and now - _last_checked.get(csv_path, 0.0) < RELOAD_CHECK_INTERVAL:
+        return index
+
+    with _lock:
+        index = _indexes.get(csv_path)
+        if index is not None and now - _last_checked.get(csv_path, 0.0) < RELOAD_CHECK_INTERVAL:
+            return index
+        try:
+            stat = os.stat(csv_path)
+            if index is None or (stat.st_mtime, stat.st_size) != (index.mtime, index.size):
+                if index is not None:
+                    print(f"[INFO] {csv_path} changed, reloading airport index")
+                index = AirportIndex.load(csv_path)
+                _indexes[csv_path] = index
+        except OSError as e:
+            if index is None:
+                raise
+            # Keep serving the last good index if the file is briefly unavailable
+            print(f"[ERROR] Could not stat {csv_path}: {e}")
+        _last_checked[csv_path] = now
+        return index
@@ -0,0 +1,232 @@
+"""
+Compiled, memory-mapped form of airports.csv.
+
+`python -m utils.airport_store` parses the CSV once and writes the airport
+columns, an interned string table and the prebuilt lookup, k-d tree and
+city-search tables to a single binary file (airports.bin next to the CSV).
+Loading maps that file read-only, so every worker shares the same pages and
+startup skips both CSV parsing and index building.
+
+The CSV stays the source of truth: the file records the CSV's SHA-256 and
+is ignored (with a warning) when it no longer matches.
+
+Layout: 8-byte magic, 4-byte little-endian header length, JSON header,
+then 8-byte aligned arrays described by the header.
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+MAGIC = b"STPAIRP1"
+FORMAT_VERSION = 2
+_ALIGN = 8
+
+
+def csv_checksum(csv_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compiled_path_for(csv_path: str) -> str:
+    """Where the compiled form of a CSV lives (AIRPORTS_COMPILED_PATH overrides)."""
+    return os.getenv("AIRPORTS_COMPILED_PATH") or os.path.splitext(csv_path)[0] + ".bin"
+
+
+class StringTable(Sequence):
+    """Interned strings stored as one UTF-8 blob plus an offsets array."""
+
+    def __init__(self, offsets: np.ndarray, buffer: Any, base: int):
+        self._offsets = offsets
+        self._buffer = buffer  # the mapped file; string i is at base + offsets[i]
+        self._base = base
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self._offsets[i:i + 2].tolist()
+        return self._buffer[self._base + start:self._base + end].decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def take(self, ids: np.ndarray) -> List[str]:
+        """Decode many strings at once."""
+        ids = ids.astype(np.int64)
+        buffer, base = self._buffer, self._base
+        return [buffer[base + start:base + end].decode("utf-8")
+                for start, end in zip(self._offsets[ids].tolist(), self._offsets[ids + 1].tolist())]
+
+
+class StringColumn(Sequence):
+    """A column of string ids, read through the shared string table."""
+
+    def __init__(self, ids: np.ndarray, table: StringTable):
+        self.ids = ids
+        self._table = table
+
+    def __getitem__(self, i: int) -> str:
+        return self._table[int(self.ids[i])]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table.take(self.ids))
+
+
+class AirportStore:
+    """Read-only view of a compiled airports file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a compiled airports file")
+        (header_len,) = struct.unpack_from("<I", self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._mmap[start:start + header_len].decode("utf-8"))
+        if self.header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {self.header.get('version')}, expected {FORMAT_VERSION}")
+        self.csv_sha256: str = self.header["csv_sha256"]
+        self._strings = StringTable(self.array("strings.offsets"), self._mmap, self.header["arrays"]["strings.blob"][0])
+
+    def array(self, name: str) -> np.ndarray:
+        """Zero-copy numpy view of a stored array."""
+        offset, dtype, shape = self.header["arrays"][name]
+        count = int(np.prod(shape)) if shape else 1
+        return np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=count, offset=offset).reshape(shape)
+
+    def strings(self, name: str) -> StringColumn:
+        return StringColumn(self.array(name), self._strings)
+
+
+def write_store(path: str, csv_sha256: str, tables: Mapping[str, Any]) -> None:
+    """
+    Write tables to a compiled airports file.
+
+    Args:
+        path: Output file (replaced atomically)
+        csv_sha256: Checksum of the CSV the tables were built from
+        tables: numpy arrays, or sequences of str which are interned into
+            the shared string table and stored as id columns
+    """
+    interned: Dict[str, int] = {}
+    strings: List[str] = []
+    arrays: Dict[str, np.ndarray] = {}
+    for name, values in tables.items():
+        if isinstance(values, np.ndarray):
+            arrays[name] = values
+            continue
+        ids = []
+        for value in values:
+            if value not in interned:
+                interned[value] = len(strings)
+                strings.append(value)
+            ids.append(interned[value])
+        arrays[name] = np.array(ids, dtype=np.uint32)
+
+    encoded = [s.encode("utf-8") for s in strings]
+    arrays["strings.offsets"] = np.cumsum([0] + [len(b) for b in encoded], dtype=np.uint64)
+    arrays["strings.blob"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    def aligned(n: int) -> int:
+        return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+    # Offsets depend on the header length and vice versa; iterate until stable
+    header_len = 0
+    while True:
+        offset = aligned(len(MAGIC) + 4 + header_len)
+        layout = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            arrays[name] = array
+            layout[name] = [offset, array.dtype.str, list(array.shape)]
+            offset = aligned(offset + array.nbytes)
+        header = json.dumps({"version": FORMAT_VERSION, "csv_sha256": csv_sha256, "arrays": layout}).encode("utf-8")
+        if len(header) == header_len:
+            break
+        header_len = len(header)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".airports-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + struct.pack("<I", len(header)) + header)
+            for name, array in arrays.items():
+                f.write(b"\0" * (layout[name][0] - f.tell()))
+                f.write(array.tobytes())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def open_store(csv_path: str, path: Optional[str] = None) -> Optional[AirportStore]:
+    """
+    Open the compiled file for csv_path if it exists and is current.
+
+    Returns:
+        AirportStore, or None if there is no usable compiled file
+    """
+    path = path or compiled_path_for(csv_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        store = AirportStore(path)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Ignoring compiled airports file {path}: {e}")
+        return None
+    if store.csv_sha256 != csv_checksum(csv_path):
+        print(f"[ERROR] {path} is stale ({csv_path} changed since it was built); "
+              f"falling back to the CSV. Rebuild with: python -m utils.airport_store")
+        return None
+    return store
+
+
+def compile_airports(csv_path: str, path: Optional[str] = None) -> str:
+    """Build every airport table from the CSV and write them to the compiled file."""
+    from utils.airport_index import AirportIndex
+    from utils.city_search import CitySearch
+
+    path = path or compiled_path_for(csv_path)
+    index = AirportIndex.from_csv(csv_path)
+    tables = dict(index.tables())
+    tables.update(CitySearch.build(index).tables())
+    write_store(path, csv_checksum(csv_path), tables)
+    return path
+
+
+def main():
+    from utils.airport_index import DEFAULT_CSV_PATH
+
+    parser = argparse.ArgumentParser(description="Compile airports.csv into a memory-mapped binary file")
+    parser.add_argument("--csv", default=DEFAULT_CSV_PATH, help="Source CSV (default: %(default)s)")
+    parser.add_argument("--out", default=None, help="Output file (default: next to the CSV, .bin)")
+    parser.add_argument("--check", action="store_true", help="Only verify the compiled file is current")
+    args = parser.parse_args()
+
+    if args.check:
+        path = args.out or compiled_path_for(args.csv)
+        if open_store(args.csv, path) is None:
+            print(f"[ERROR] {path} is missing or stale")
+            sys.exit(1)
+        print(f"[INFO] {path} is up to date")
+        return
+    path = compile_airports(args.csv, args.out)
+    print(f"[INFO] Wrote {path} ({os.path.getsize(path) / 1024:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.airport_index import normalize_city
+from utils.cache_backends import MISSING, CacheBackend, create_backend
+
+# Per-source freshness (seconds): weather moves quickly, news and schedules less so
+CACHE_TTLS = {
+    "weather": float(os.getenv("WEATHER_CACHE_TTL", "600")),
+    "flights": float(os.getenv("FLIGHTS_CACHE_TTL", "1800")),
+    "safety": float(os.getenv("SAFETY_CACHE_TTL", "21600")),
+    # Per-day forecasts, for trip windows
+    "forecast": float(os.getenv("FORECAST_CACHE_TTL", "3600")),
+    # Finished recommendations; each is also capped at the remaining TTL of its inputs
+    "scores": float(os.getenv("SCORES_CACHE_TTL", os.getenv("WEATHER_CACHE_TTL", "600"))),
+}
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+# How long (seconds) past its TTL an entry is kept to answer upstream failures
+CACHE_STALE_GRACE = float(os.getenv("CACHE_STALE_GRACE", "86400"))
+# Partial results (some upstream calls failed) are kept only briefly, so a
+# struggling upstream isn't hit again by every request but recovers quickly
+CACHE_PARTIAL_TTL = float(os.getenv("CACHE_PARTIAL_TTL", "60"))
+
+# "memory" keeps a private cache per worker; "sqlite" and "redis" are shared
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_BACKEND_OPTIONS = {
+    "path": os.getenv("CACHE_SQLITE_PATH", "cache.sqlite3"),
+    "url": os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"),
+}
+
+
+def _consume_exception(task: "asyncio.Task") -> None:
+    # Avoid "exception was never retrieved" noise when every waiter gave up
+    if not task.cancelled():
+        task.exception()
+
+
+async def _join_task(task: "asyncio.Task") -> Any:
+    # Shielded so one waiter being cancelled doesn't cancel the shared fetch
+    return await asyncio.shield(task)
+
+
+def _current_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class _Flight:
+    """An in-progress sync upstream call that other threads can wait on."""
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """
+    TTL cache for one upstream source, stored in a pluggable CacheBackend.
+
+    Concurrent misses for the same key are collapsed into a single upstream
+    call (single-flight), whether they come from threadpool requests or from
+    the event loop. Entries outlive their TTL by a stale grace period so an
+    upstream failure can be answered with the last good value, flagged
+    "stale". Backend failures are logged and treated as misses so a cache
+    outage never takes the API down with it.
+    """
+
+    def __init__(self, name: str, ttl: float, backend: CacheBackend, stale_grace: float = CACHE_STALE_GRACE):
+        self.name = name
+        self.ttl = ttl
+        self.stale_grace = stale_grace
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self._prefix = f"{name}:"
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+        self._inflight_async: Dict[str, Tuple["asyncio.Task", asyncio.AbstractEventLoop]] = {}
+        self._listeners: List[Callable[[str, Any], None]] = []
+        self._ttl_limit: Optional[Callable[[str, Any], Optional[float]]] = None
+
+    def _read(self, key: str) -> Tuple[float, Any, float]:
+        """Return (fresh_until, value, stored_at), or (0, MISSING, 0) if nothing is stored."""
+        try:
+            entry = self.backend.get(self._prefix + key)
+        except Exception as e:
+            print(f"[ERROR] {self.backend.name} cache read failed for {self.name}: {e}")
+            return 0.0, MISSING, 0.0
+        if entry is MISSING:
+            return 0.0, MISSING, 0.0
+        # Entries written before the store time was kept are assumed to have had the default TTL
+        return entry[0], entry[1], entry[2] if len(entry) > 2 else entry[0] - self.ttl
+
+    def get(self, key: str) -> Any:
+        """Return the cached value for key, or MISSING if absent or expired."""
+        fresh_until, value, _ = self._read(key)
+        if fresh_until <= time.time():
+            return MISSING
+        return value
+
+    def get_stale(self, key: str) -> Any:
+        """Return the cached value even if it has expired (within the stale grace)."""
+        return self._read(key)[1]
+
+    def get_stale_entry(self, key: str) -> Tuple[float, Any]:
+        """Return (time it was stored, value) even if it has expired, or (0, MISSING)."""
+        _, value, stored_at = self._read(key)
+        return stored_at, value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        try:
+            self.backend.set(self._prefix + key, [now + ttl, value, now], ttl + self.stale_grace)
+        except Exception as e:
+            print(f"[ERROR] {self.backend.name} cache write failed for {self.name}: {e}")
+            return
+        for listener in self._listeners:
+            try:
+                listener(key, value)
+            except Exception as e:
+                print(f"[ERROR] {self.name} cache listener failed: {e}")
+
+    def limit_ttl(self, limit: Callable[[str, Any], Optional[float]]) -> None:
+        """
+        Cap the TTL of each fetched value at limit(key, value) seconds (None
+        for no cap), e.g. so a value derived from other cached values
+        expires with the first of them.
+        """
+        self._ttl_limit = limit
+
+    def _fetched_ttl(self, key: str, value: Any, ttl: float) -> float:
+        if self._ttl_limit is not None:
+            limit = self._ttl_limit(key, value)
+            if limit is not None:
+                ttl = min(ttl, max(0.0, limit))
+        return ttl
+
+    def subscribe(self, listener: Callable[[str, Any], None]) -> None:
+        """Call listener(key, value) after every value this process stores. It must not block."""
+        self._listeners.append(listener)
+
+    def clear(self) -> None:
+        self.backend.clear(self._prefix)
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        """Seconds until key stops being fresh, or None if it isn't cached or already stale."""
+        fresh_until, value, _ = self._read(key)
+        remaining = fresh_until - time.time()
+        return remaining if value is not MISSING and remaining > 0 else None
+
+    def _record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _resolve(self, key: str, result: Any) -> Any:
+        """Store a fresh result, or fall back to stale data if the upstream failed."""
+        if isinstance(result, dict):
+            if result.get("status") == "error":
+                stale = self.get_stale(key)
+                if isinstance(stale, dict):
+                    with self._lock:
+                        self.stale_served += 1
+                    return {**stale, "stale": True}
+                return result
+            # Never cache already-stale results; the next request should retry
+            if result.get("stale"):
+                return result
+            if result.get("status") == "partial":
+                self.set(key, result, self._fetched_ttl(key, result, min(self.ttl, CACHE_PARTIAL_TTL)))
+                return result
+        self.set(key, result, self._fetched_ttl(key, result, self.ttl))
+        return result
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is not MISSING:
+            self._record(True)
+            return value
+        self._record(False)
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            pending = self._inflight_async.get(key)
+            # Blocking on an async fetch is only possible from outside its loop
+            leader = flight is None and (pending is None or pending[1] is _current_loop())
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            if flight is not None:
+                flight.event.wait()
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+            # An async request is already fetching this key; wait for it on its loop
+            task, loop = pending
+            return asyncio.run_coroutine_threadsafe(_join_task(task), loop).result()
+
+        try:
+            flight.result = self._resolve(key, fetch())
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.event.set()
+
+    async def get_or_fetch_async(self, key: str, fetch: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is not MISSING:
+            self._record(True)
+            return value
+        self._record(False)
+
+        return await self.refresh_async(key, fetch)
+
+    async def refresh_async(self, key: str, fetch: Callable[[], Any]) -> Any:
+        """
+        Fetch key from upstream and store it, ignoring any cached value.
+
+        Joins an in-progress fetch for the same key rather than starting a
+        second one. The upstream call runs as its own task so a caller timing
+        out or disconnecting doesn't cancel it for everyone else waiting.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            pending = self._inflight_async.get(key)
+            flight = self._inflight.get(key) if pending is None else None
+            if pending is None and flight is None:
+                task = asyncio.ensure_future(self._fetch_async(key, fetch))
+                task.add_done_callback(_consume_exception)
+                pending = self._inflight_async[key] = (task, loop)
+
+        if flight is not None:
+            # A threadpool request is already fetching this key
+            await loop.run_in_executor(None, flight.event.wait)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        return await _join_task(pending[0])
+
+    async def _fetch_async(self, key: str, fetch: Callable[[], Any]) -> Any:
+        try:
+            return self._resolve(key, await fetch())
+        finally:
+            with self._lock:
+                self._inflight_async.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            entries = self.backend.size(self._prefix)
+        except Exception:
+            entries = None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend.name,
+                "entries": entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_served": self.stale_served,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_caches: Dict[str, TTLCache] = {}
+_shared_backend: Optional[CacheBackend] = None
+_caches_lock = threading.Lock()
+
+
+def _backend_for(source: str) -> CacheBackend:
+    global _shared_backend
+    if CACHE_BACKEND == "memory":
+        # Separate LRU per source so busy weather keys can't evict news results
+        return create_backend("memory", CACHE_MAX_ENTRIES)
+    if _shared_backend is None:
+        _shared_backend = create_backend(CACHE_BACKEND, CACHE_MAX_ENTRIES * len(CACHE_TTLS), CACHE_BACKEND_OPTIONS)
+    return _shared_backend
+
+
+def get_cache(source: str) -> TTLCache:
+    """Return the cache for a source ("weather", "flights", "safety", "forecast", "scores")."""
+    cache = _caches.get(source)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(source)
+            if cache is None:
+                cache = _caches[source] = TTLCache(source, CACHE_TTLS[source], _backend_for(source))
+    return cache
+
+
+def close_caches() -> None:
+    """Release backend connections (SQLite handles, Redis sockets)."""
+    for cache in list(_caches.values()):
+        cache.backend.close()
+
+
+def cache_key(city: str, *args: Any) -> str:
+    """Build a cache key from the normalized city name plus any extra arguments."""
+    return "|".join([normalize_city(city)] + [str(arg) for arg in args])
+
+
+def cached(source: str, key_func: Optional[Callable[..., str]] = None,
+           rescore: Optional[Callable[[Any], Any]] = None):
+    """
+    Decorate a sync or async upstream client so its results go through the
+    shared cache for source. Both variants of a client share one cache.
+    Async clients also get a .refresh(...) coroutine that bypasses the
+    cached value.
+
+    rescore, if given, is applied to every value returned, so cached
+    results scored by an older scoring model are brought up to date
+    without being fetched again.
+    """
+    key_func = key_func or cache_key
+
+    def finish(value: Any) -> Any:
+        return rescore(value) if rescore is not None else value
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = key_func(*args, **kwargs)
+                return finish(await get_cache(source).get_or_fetch_async(key, lambda: func(*args, **kwargs)))
+
+            async def refresh(*args, **kwargs):
+                key = key_func(*args, **kwargs)
+                return finish(await get_cache(source).refresh_async(key, lambda: func(*args, **kwargs)))
+
+            # Lets background jobs re-fetch an entry before it expires
+            refresh.cache_key = key_func
+            async_wrapper.refresh = refresh
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_func(*args, **kwargs)
+            return finish(get_cache(source).get_or_fetch(key, lambda: func(*args, **kwargs)))
+        return wrapper
+
+    return decorator
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss counters and occupancy for every cache."""
+    return {source: get_cache(source).stats() for source in CACHE_TTLS}
@@ -0,0 +1,400 @@
+import abc
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Payloads at least this large are zlib-compressed before they are stored
+COMPRESS_THRESHOLD = 1024
+
+MISSING = object()
+
+
+def encode_value(value: Any) -> bytes:
+    """
+    Serialize a cache entry compactly: minified JSON, zlib-compressed when large.
+
+    The first byte tags the encoding so either form can be read back.
+    """
+    raw = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(raw) >= COMPRESS_THRESHOLD:
+        return b"z" + zlib.compress(raw, 1)
+    return b"j" + raw
+
+
+def decode_value(data: bytes) -> Any:
+    tag, body = data[:1], data[1:]
+    if tag == b"z":
+        body = zlib.decompress(body)
+    return json.loads(body)
+
+
+class CacheBackend(abc.ABC):
+    """
+    Storage for cache entries. Keys are strings; values are JSON-compatible.
+
+    Expiry uses wall-clock time so entries written by one process are valid
+    in every other process sharing the backend.
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Any:
+        """Return the stored value, or MISSING if absent or expired."""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store value under key for ttl seconds."""
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove key if it is stored."""
+
+    @abc.abstractmethod
+    def clear(self, prefix: str = "") -> None:
+        """Remove every entry whose key starts with prefix."""
+
+    def size(self, prefix: str = "") -> Optional[int]:
+        """
+        Number of live entries whose key starts with prefix, or None where
+        counting would mean walking a remote keyspace.
+        """
+        return None
+
+    def close(self) -> None:
+        """Release every connection this process opened."""
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process LRU store; values are kept as live objects, never serialized."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def size(self, prefix: str = "") -> int:
+        with self._lock:
+            if not prefix:
+                return len(self._entries)
+            return sum(1 for k in self._entries if k.startswith(prefix))
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Disk-backed store shared by every worker process on the host.
+
+    The database runs in WAL mode with a busy timeout, so concurrent writers
+    from several processes serialize on SQLite's lock instead of failing.
+    When the table grows past maxsize the least recently used entries are
+    evicted first. Reads refresh an entry's access time at most once every
+    TOUCH_INTERVAL seconds, so hot keys don't turn every hit into a write.
+    """
+
+    name = "sqlite"
+    PRUNE_EVERY = 128
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, path: str, maxsize: int = 10000):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        # Every thread's (pid, connection), so close() can reach them all
+        self._conns: List[Tuple[int, sqlite3.Connection]] = []
+        self._conns_lock = threading.Lock()
+        self._generation = 0
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " expires_at REAL NOT NULL,"
+            " value BLOB NOT NULL,"
+            " accessed_at REAL NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+        if "accessed_at" not in columns:
+            # Databases written before eviction was LRU
+            try:
+                conn.execute("ALTER TABLE cache ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass  # another process added it first
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread, and never reuse one inherited across fork()
+        # (nor one that close() has since closed)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid() or self._local.generation != self._generation:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            with self._conns_lock:
+                self._conns.append((os.getpid(), conn))
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.generation = self._generation
+        return conn
+
+    def get(self, key: str) -> Any:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, accessed_at FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return MISSING
+        if now - row[1] >= self.TOUCH_INTERVAL:
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return decode_value(row[0])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, expires_at, value, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, now + ttl, sqlite3.Binary(encode_value(value)), now),
+        )
+        with self._writes_lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if prune:
+            self._prune(conn)
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            if count > self.maxsize:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (count - self.maxsize,),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self, prefix: str = "") -> None:
+        self._conn().execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def size(self, prefix: str = "") -> int:
+        (count,) = self._conn().execute(
+            "SELECT COUNT(*) FROM cache WHERE substr(key, 1, ?) = ? AND expires_at > ?",
+            (len(prefix), prefix, time.time()),
+        ).fetchone()
+        return count
+
+    def close(self) -> None:
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+            self._generation += 1
+        for pid, conn in conns:
+            # Connections inherited across fork() belong to the parent; only forget them
+            if pid == os.getpid():
+                conn.close()
+
+
+class RedisError(Exception):
+    pass
+
+
+class _RespConnection:
+    """Minimal blocking client for the Redis serialization protocol (RESP2)."""
+
+    def __init__(self, host: str, port: int, db: int, password: Optional[str], timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if password:
+            self.command("AUTH", password)
+        if db:
+            self.command("SELECT", db)
+
+    def command(self, *args: Any) -> Any:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self.sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self) -> Any:
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length == -1:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+        finally:
+            self.sock.close()
+
+
+class RedisBackend(CacheBackend):
+    """
+    Store backed by any server speaking the Redis protocol.
+
+    Expiry is delegated to the server (SET ... PX) and size bounds to its
+    maxmemory policy. Every write is a single atomic SET, so concurrent
+    writers from any number of processes are safe. Entries aren't counted:
+    that would mean a SCAN of the keyspace on every stats call.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self._local = threading.local()
+        # Every thread's (pid, connection), so close() can reach them all
+        self._conns: List[Tuple[int, _RespConnection]] = []
+        self._conns_lock = threading.Lock()
+        self._generation = 0
+
+    def _command(self, *args: Any) -> Any:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid() or self._local.generation != self._generation:
+            conn = _RespConnection(self.host, self.port, self.db, self.password, self.timeout)
+            with self._conns_lock:
+                self._conns.append((os.getpid(), conn))
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.generation = self._generation
+        try:
+            return conn.command(*args)
+        except (OSError, ConnectionError):
+            # Drop the broken connection so the next call reconnects
+            self._local.conn = None
+            with self._conns_lock:
+                self._conns = [(pid, c) for pid, c in self._conns if c is not conn]
+            conn.close()
+            raise
+
+    def get(self, key: str) -> Any:
+        data = self._command("GET", key)
+        if data is None:
+            return MISSING
+        return decode_value(data)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._command("SET", key, encode_value(value), "PX", max(1, int(ttl * 1000)))
+
+    def delete(self, key: str) -> None:
+        self._command("DEL", key)
+
+    def _scan(self, prefix: str) -> List[bytes]:
+        keys: List[bytes] = []
+        cursor = b"0"
+        while True:
+            cursor, batch = self._command("SCAN", cursor, "MATCH", prefix + "*", "COUNT", 500)
+            keys.extend(batch)
+            if cursor in (b"0", "0"):
+                return keys
+
+    def clear(self, prefix: str = "") -> None:
+        keys = self._scan(prefix)
+        for i in range(0, len(keys), 500):
+            self._command("DEL", *keys[i:i + 500])
+
+    def close(self) -> None:
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+            self._generation += 1
+        for pid, conn in conns:
+            # A socket inherited across fork() is the parent's; closing it here would cut it off
+            if pid == os.getpid():
+                conn.close()
+
+
+def create_backend(kind: str, maxsize: int, options: Optional[Dict[str, str]] = None) -> CacheBackend:
+    """
+    Build a cache backend by name.
+
+    Args:
+        kind: "memory", "sqlite" or "redis"
+        maxsize: Entry bound (memory and sqlite only)
+        options: Backend settings ("path" for sqlite, "url" for redis)
+
+    Returns:
+        Configured CacheBackend
+    """
+    options = options or {}
+    if kind == "memory":
+        return MemoryBackend(maxsize)
+    if kind == "sqlite":
+        return SQLiteBackend(options.get("path", "cache.sqlite3"), maxsize)
+    if kind == "redis":
+        return RedisBackend(options.get("url", "redis://localhost:6379/0"))
+    raise ValueError(f"Unknown cache backend '{kind}'")
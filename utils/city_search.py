@@ -0,0 +1,425 @@
+"""
+Fuzzy city-name search over airports.csv.
+
+One index serves two jobs: autocomplete for /cities/suggest, and resolving
+what a user typed into a canonical city name before any upstream call, so
+misspellings are corrected and gibberish is rejected locally instead of
+costing a WeatherAPI or NewsAPI round trip. Both rank fuzzy matches with
+the same function, so the first fuzzy suggestion is what resolve() picks.
+"""
+
+import bisect
+import os
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.airport_index import AirportIndex, get_airport_index
+from utils.airport_store import AirportStore
+
+# Minimum trigram similarity for a name to be considered as a fuzzy match
+FUZZY_MIN_SIMILARITY = float(os.getenv("CITY_FUZZY_MIN_SIMILARITY", "0.2"))
+# Most similar names ranked by edit distance per fuzzy query
+FUZZY_CANDIDATES = int(os.getenv("CITY_FUZZY_CANDIDATES", "200"))
+# Edit distances above this all rank the same
+_MAX_TYPOS = 2
+
+# Match kinds, best first
+CITY, AIRPORT, CODE, COUNTRY, FUZZY = "city", "airport", "code", "country", "fuzzy"
+_KIND_RANK = {CITY: 0, AIRPORT: 1, CODE: 2, COUNTRY: 3}
+_KIND_NAME = {rank: kind for kind, rank in _KIND_RANK.items()}
+
+# Prefixes this short match too many terms to rank per query; their top
+# results are precomputed instead
+_SHORT_PREFIX = 2
+_PREFIX_TOP = 50
+
+# Tables stored in compiled airports files (see utils.airport_store)
+_STRING_TABLES = (
+    "search.entry.city", "search.entry.country", "search.entry.iata",
+    "search.terms", "search.gram.keys", "search.prefix.keys",
+)
+_NUMERIC_TABLES = (
+    "search.entry.airports", "search.match.offsets", "search.match.rank", "search.match.entry",
+    "search.gram.offsets", "search.gram.terms", "search.gram.counts",
+    "search.prefix.offsets", "search.prefix.rank", "search.prefix.entry",
+)
+
+_NON_WORD = re.compile(r"[^\w]+")
+# Words too common in airport names to help fuzzy matching
+_GENERIC_WORDS = frozenset((
+    "airport", "international", "intl", "regional", "municipal", "county", "field",
+    "airfield", "aerodrome", "airstrip", "air", "base", "national", "domestic",
+))
+
+
+def fold(text: str) -> str:
+    """Accent-, case- and punctuation-insensitive form used for matching."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", stripped.casefold()).split())
+
+
+def _strip_generic(term: str) -> str:
+    return " ".join(word for word in term.split() if word not in _GENERIC_WORDS) or term
+
+
+def trigrams(term: str) -> frozenset:
+    padded = f"  {term} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Edit distance counting adjacent transpositions as one edit.
+
+    Gives up, returning limit + 1, as soon as the distance must exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def _offsets(groups: Sequence[Sequence]) -> np.ndarray:
+    """CSR offsets for a list of groups: group i is items[offsets[i]:offsets[i + 1]]."""
+    return np.cumsum([0] + [len(group) for group in groups], dtype=np.int64)
+
+
+class CityEntry(NamedTuple):
+    city: str
+    country: str
+    iata: str  # first listed airport for the city
+    airports: int  # used as a popularity proxy when ranking
+
+
+class CitySearch:
+    """
+    Prefix and trigram index over city, airport name, country and IATA/ICAO.
+
+    Terms are kept in one sorted list, so a prefix query is a bisect plus a
+    scan of the matching run (the flat-array equivalent of a trie). Fuzzy
+    matches come from an inverted trigram index over city and airport names.
+    All tables are flat arrays, built by build() or mapped from a compiled
+    airports file by from_store().
+    """
+
+    def __init__(self, tables: Mapping[str, Any], index: Optional[AirportIndex] = None):
+        self._tables = tables
+        # Used to resolve metro codes, abbreviations and airport codes
+        self.index = index
+        self.entries = [
+            CityEntry(city, country, iata, airports) for city, country, iata, airports in zip(
+                tables["search.entry.city"], tables["search.entry.country"], tables["search.entry.iata"],
+                tables["search.entry.airports"].tolist())
+        ]
+        self.entry_airports = tables["search.entry.airports"]
+        self.terms: Sequence[str] = tables["search.terms"]
+        # Entries matching terms[i] are match_*[match_offsets[i]:match_offsets[i + 1]], best first
+        self.match_offsets = tables["search.match.offsets"]
+        self.match_rank = tables["search.match.rank"]
+        self.match_entry = tables["search.match.entry"]
+
+        offsets = tables["search.gram.offsets"].tolist()
+        gram_terms = tables["search.gram.terms"]
+        self.gram_postings: Dict[str, np.ndarray] = {
+            gram: gram_terms[offsets[i]:offsets[i + 1]] for i, gram in enumerate(tables["search.gram.keys"])
+        }
+        self.gram_counts = tables["search.gram.counts"].astype(np.float64)
+
+        self.prefix_keys: Sequence[str] = tables["search.prefix.keys"]
+        self.prefix_offsets = tables["search.prefix.offsets"]
+        self.prefix_rank = tables["search.prefix.rank"]
+        self.prefix_entry = tables["search.prefix.entry"]
+
+    @classmethod
+    def build(cls, index: AirportIndex) -> "CitySearch":
+        """Build the search tables from an airport index."""
+        entry_ids: Dict[Tuple[str, str], int] = {}
+        entries: List[CityEntry] = []
+        postings: Dict[str, Dict[int, str]] = defaultdict(dict)  # term -> {entry: best kind}
+
+        def add(term: str, entry_id: int, kind: str) -> None:
+            if not term:
+                return
+            kinds = postings[term]
+            if entry_id not in kinds or _KIND_RANK[kind] < _KIND_RANK[kinds[entry_id]]:
+                kinds[entry_id] = kind
+
+        counts: Dict[int, int] = defaultdict(int)
+        for airport in index.airports:
+            if not airport.iata or not airport.city:
+                continue
+            key = (fold(airport.city), airport.country)
+            entry_id = entry_ids.get(key)
+            if entry_id is None:
+                entry_id = entry_ids[key] = len(entries)
+                entries.append(CityEntry(airport.city, airport.country, airport.iata, 0))
+            counts[entry_id] += 1
+            add(fold(airport.city), entry_id, CITY)
+            add(fold(airport.name), entry_id, AIRPORT)
+            add(fold(airport.country), entry_id, COUNTRY)
+            add(airport.iata.casefold(), entry_id, CODE)
+            add(airport.icao.casefold(), entry_id, CODE)
+
+        airports = [counts[i] for i in range(len(entries))]
+        terms = sorted(postings)
+        # Per term, its entries best-first: (kind rank, -airports, entry)
+        matches = [
+            sorted(((_KIND_RANK[kind], -airports[e], e) for e, kind in postings[term].items()))
+            for term in terms
+        ]
+
+        # Only city and airport names take part in fuzzy matching
+        grams = [
+            trigrams(_strip_generic(term)) if ranked[0][0] <= _KIND_RANK[AIRPORT] else frozenset()
+            for term, ranked in zip(terms, matches)
+        ]
+        postings_by_gram: Dict[str, List[int]] = defaultdict(list)
+        for term_id, term_grams in enumerate(grams):
+            for gram in term_grams:
+                postings_by_gram[gram].append(term_id)
+        gram_keys = sorted(postings_by_gram)
+
+        # Precompute the best entries for the shortest prefixes
+        short_prefixes: Dict[str, List[Tuple[int, int, int]]] = defaultdict(list)
+        for term, ranked in zip(terms, matches):
+            for n in range(1, min(_SHORT_PREFIX, len(term)) + 1):
+                short_prefixes[term[:n]].extend(ranked)
+        prefix_keys = sorted(short_prefixes)
+        prefix_top = [cls._first_per_entry(sorted(short_prefixes[prefix]), _PREFIX_TOP) for prefix in prefix_keys]
+
+        return cls(index=index, tables={
+            "search.entry.city": [entry.city for entry in entries],
+            "search.entry.country": [entry.country for entry in entries],
+            "search.entry.iata": [entry.iata for entry in entries],
+            "search.entry.airports": np.array(airports, dtype=np.int32),
+            "search.terms": terms,
+            "search.match.offsets": _offsets(matches),
+            "search.match.rank": np.array([r for ranked in matches for r, _, _ in ranked], dtype=np.int8),
+            "search.match.entry": np.array([e for ranked in matches for _, _, e in ranked], dtype=np.int32),
+            "search.gram.keys": gram_keys,
+            "search.gram.offsets": _offsets([postings_by_gram[gram] for gram in gram_keys]),
+            "search.gram.terms": np.array([t for gram in gram_keys for t in postings_by_gram[gram]], dtype=np.int32),
+            "search.gram.counts": np.array([len(term_grams) for term_grams in grams], dtype=np.uint8),
+            "search.prefix.keys": prefix_keys,
+            "search.prefix.offsets": _offsets(prefix_top),
+            "search.prefix.rank": np.array([r for top in prefix_top for r, _, _ in top], dtype=np.int8),
+            "search.prefix.entry": np.array([e for top in prefix_top for _, _, e in top], dtype=np.int32),
+        })
+
+    @classmethod
+    def from_store(cls, store: AirportStore, index: Optional[AirportIndex] = None) -> "CitySearch":
+        """Map the prebuilt tables of a compiled airports file."""
+        return cls({
+            name: store.strings(name) if name in _STRING_TABLES else store.array(name)
+            for name in _NUMERIC_TABLES + _STRING_TABLES
+        }, index)
+
+    def tables(self) -> Dict[str, Any]:
+        """Tables to write to a compiled airports file."""
+        return dict(self._tables)
+
+    @staticmethod
+    def _first_per_entry(ranked: List[Tuple[int, int, int]], limit: int) -> List[Tuple[int, int, int]]:
+        """Keep the first of each entry in sorted (rank, -airports, entry) triples."""
+        seen = set()
+        best = []
+        for item in ranked:
+            if item[2] not in seen:
+                seen.add(item[2])
+                best.append(item)
+                if len(best) == limit:
+                    break
+        return best
+
+    @staticmethod
+    def _find(keys: Sequence[str], key: str) -> Optional[int]:
+        i = bisect.bisect_left(keys, key)
+        return i if i < len(keys) and keys[i] == key else None
+
+    def _matches(self, term_id: int) -> List[Tuple[int, int]]:
+        """(kind rank, entry) pairs for a term, best first."""
+        start, end = self.match_offsets[term_id], self.match_offsets[term_id + 1]
+        return list(zip(self.match_rank[start:end].tolist(), self.match_entry[start:end].tolist()))
+
+    def _prefix(self, query: str, limit: int) -> List[Tuple[int, int]]:
+        if len(query) <= _SHORT_PREFIX:
+            i = self._find(self.prefix_keys, query)
+            if i is None:
+                return []
+            start = int(self.prefix_offsets[i])
+            end = min(int(self.prefix_offsets[i + 1]), start + limit)
+            return list(zip(self.prefix_rank[start:end].tolist(), self.prefix_entry[start:end].tolist()))
+        first = bisect.bisect_left(self.terms, query)
+        last = bisect.bisect_left(self.terms, query + "\U0010ffff", first)
+        start, end = int(self.match_offsets[first]), int(self.match_offsets[last])
+        if start == end:
+            return []
+        rank, entry = self.match_rank[start:end], self.match_entry[start:end]
+        # Best kind, then most airports, then entry order; first hit per entry wins
+        order = np.lexsort((entry, -self.entry_airports[entry], rank))
+        entry = entry[order]
+        _, first_hits = np.unique(entry, return_index=True)
+        keep = np.sort(first_hits)[:limit]
+        return list(zip(rank[order][keep].tolist(), entry[keep].tolist()))
+
+    def _similar(self, query: str, limit: int, min_similarity: float) -> List[Tuple[float, int]]:
+        """(similarity, term id) of the closest city/airport names, best first."""
+        grams = trigrams(query)
+        postings = [self.gram_postings[gram] for gram in grams if gram in self.gram_postings]
+        if not postings:
+            return []
+        # Count shared grams for every term at once rather than per posting
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.terms))
+        similarity = shared / (len(grams) + self.gram_counts - shared)
+        matches = np.flatnonzero(similarity >= min_similarity)
+        # Stable sort keeps equally similar terms in alphabetical order
+        best = matches[np.argsort(-similarity[matches], kind="stable")[:limit]]
+        return [(float(similarity[term_id]), int(term_id)) for term_id in best]
+
+    def _fuzzy(self, folded: str) -> List[Tuple[int, int]]:
+        """
+        (edit distance, term id) of city and airport names close to folded, best first.
+
+        Ranked by edit distance (capped at _MAX_TYPOS + 1), then cities before
+        airport names, then trigram similarity, then larger cities first.
+        """
+        ranked = []
+        for similarity, term_id in self._similar(folded, FUZZY_CANDIDATES, FUZZY_MIN_SIMILARITY):
+            rank, entry_id = self._matches(term_id)[0]
+            if rank > _KIND_RANK[AIRPORT]:
+                continue
+            distance = edit_distance(folded, self.terms[term_id], _MAX_TYPOS)
+            ranked.append((distance, rank, -similarity, -int(self.entry_airports[entry_id]), term_id))
+        ranked.sort()
+        return [(distance, term_id) for distance, _, _, _, term_id in ranked]
+
+    @staticmethod
+    def _allowed_typos(folded: str) -> int:
+        # Too short to tell a typo from a different place ("Bali" vs "Bari")
+        if len(folded) < 5:
+            return 0
+        return 1 if len(folded) < 10 else _MAX_TYPOS
+
+    def _correction(self, folded: str) -> Optional[int]:
+        """
+        Entry a misspelling unambiguously stands for, or None.
+
+        Corrected only when the closest city is within the typo allowance
+        and no other city is as close; otherwise the name may well be a
+        real place the index doesn't know.
+        """
+        allowed = self._allowed_typos(folded)
+        if allowed == 0:
+            return None
+        ranked = self._fuzzy(folded)
+        if not ranked or ranked[0][0] > allowed:
+            return None
+        best_distance, best_term = ranked[0]
+        _, entry_id = self._matches(best_term)[0]
+        best = self.entries[entry_id]
+        for distance, term_id in ranked[1:]:
+            if distance > best_distance:
+                break
+            other = self.entries[self._matches(term_id)[0][1]]
+            if (other.city, other.country) != (best.city, best.country):
+                return None
+        return entry_id
+
+    def _describe(self, entry_id: int, match: str) -> Dict[str, Any]:
+        entry = self.entries[entry_id]
+        return {"city": entry.city, "country": entry.country, "iata": entry.iata, "match": match}
+
+    def suggest(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Autocomplete a partial or misspelled city name.
+
+        Prefix matches come first (cities before airport names, codes and
+        countries, larger cities first), then fuzzy matches in the order
+        resolve() ranks them.
+
+        Args:
+            query: Text typed so far
+            limit: Maximum suggestions to return
+
+        Returns:
+            Suggestions with city, country, primary IATA code and match kind
+        """
+        folded = fold(query)
+        if not folded or limit <= 0:
+            return []
+        results = [self._describe(e, _KIND_NAME[rank]) for rank, e in self._prefix(folded, limit)]
+        if len(results) < limit and len(folded) >= 3:
+            seen = {(r["city"], r["country"]) for r in results}
+            for _, term_id in self._fuzzy(folded):
+                for rank, e in self._matches(term_id):
+                    entry = self.entries[e]
+                    if rank <= _KIND_RANK[AIRPORT] and (entry.city, entry.country) not in seen:
+                        seen.add((entry.city, entry.country))
+                        results.append(self._describe(e, FUZZY))
+                if len(results) >= limit:
+                    break
+        return results[:limit]
+
+    def resolve(self, query: str) -> Optional[str]:
+        """
+        Canonical city name for user input, or None if it isn't a known place.
+
+        Exact city, airport name or IATA/ICAO matches, metro codes and
+        abbreviations (see airport_index.CITY_ALIASES) map to the city.
+        Country names are kept as typed. A misspelling of a known city or
+        airport name (one edit for names of five or more characters, two
+        from ten) is corrected when exactly one city is that close. Names
+        under five characters are never corrected. None means the index
+        doesn't know the name; callers decide whether to pass it on as typed.
+        """
+        folded = fold(query)
+        if not folded:
+            return None
+        if self.index is not None:
+            city = self.index.city_for_alias(folded)
+            if city is not None:
+                return city
+        term_id = self._find(self.terms, folded)
+        if term_id is not None:
+            rank, entry_id = self._matches(term_id)[0]
+            if rank == _KIND_RANK[COUNTRY]:
+                return " ".join(query.split())
+            return self.entries[entry_id].city
+
+        entry_id = self._correction(folded)
+        return self.entries[entry_id].city if entry_id is not None else None
+
+
+_search: Optional[Tuple[AirportIndex, CitySearch]] = None
+_lock = threading.Lock()
+
+
+def get_city_search() -> CitySearch:
+    """Shared search index, rebuilt whenever the airport index reloads."""
+    global _search
+    index = get_airport_index()
+    current = _search
+    if current is not None and current[0] is index:
+        return current[1]
+    with _lock:
+        if _search is None or _search[0] is not index:
+            search = (CitySearch.from_store(index.store, index) if index.store is not None
+                      else CitySearch.build(index))
+            _search = (index, search)
+        return _search[1]
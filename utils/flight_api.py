@@ -1,22 +1,318 @@
 import os
+import asyncio
 import requests
-from typing import Dict, Any
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Union
 from datetime import datetime, timedelta
-import csv
+from utils.airport_index import DEFAULT_CSV_PATH, get_airport_index
+from utils.cache import cache_key, cached
+from utils.history import recorded
+from utils.scoring_model import get_scoring_model, rescore
+from utils import http_client
+from utils.upstream_archive import upstream_key
+from utils.upstream import BudgetExhausted, budget_exhausted_result, scheduler
+from utils.json_stream import ArrayItemParser, iter_array_items
+from utils.weather_api import get_weather, get_weather_async
 
+AERODATABOX_HOST = "aerodatabox.p.rapidapi.com"
+# Override to point at a local simulator (benchmarks/upstream_sim.py)
+AERODATABOX_BASE_URL = os.getenv("AERODATABOX_BASE_URL", f"https://{AERODATABOX_HOST}")
+AERODATABOX_TIMEOUT = float(os.getenv("AERODATABOX_API_TIMEOUT", "15"))
+# How far from a city's coordinates to look for an airport when its name isn't in airports.csv
+NEAREST_AIRPORT_RADIUS_KM = float(os.getenv("NEAREST_AIRPORT_RADIUS_KM", "100"))
+# Most AeroDataBox calls in flight at once for one metro-area lookup
+FLIGHTS_MAX_PARALLEL = int(os.getenv("FLIGHTS_MAX_PARALLEL", "4"))
+# Local hours of a day covered when scoring flights for a trip date (AeroDataBox allows 12 at most)
+FLIGHT_DAY_WINDOW = ("08:00", "20:00")
 
-def city_to_iata(city: str, csv_path: str = "airports.csv") -> str:
-    city = city.strip().lower()
-    with open(csv_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['city'].strip().lower() == city and row['iata']:
-                return row['iata']
-    return None
 
+def city_to_iata(city: str, csv_path: str = DEFAULT_CSV_PATH) -> str:
+    return get_airport_index(csv_path).iata_for_city(city)
 
+
+def nearest_iata(location: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    IATA code of the airport closest to a WeatherAPI location.
+
+    Args:
+        location: The "location" object of a weather response (lat/lon)
+
+    Returns:
+        IATA code, or None if no airport is within NEAREST_AIRPORT_RADIUS_KM
+    """
+    if not location or location.get("lat") is None or location.get("lon") is None:
+        return None
+    nearest = get_airport_index().nearest_airports(
+        float(location["lat"]), float(location["lon"]), 1, NEAREST_AIRPORT_RADIUS_KM
+    )
+    return nearest[0][0].iata if nearest else None
+
+
+def resolve_iata(city: str) -> Optional[str]:
+    """Airport for a city: exact name match, else the airport nearest its coordinates."""
+    # WeatherAPI geocodes suburbs and misspellings that airports.csv doesn't
+    # know, and its response is cached (and shared with /weather) anyway
+    return city_to_iata(city) or nearest_iata(get_weather(city).get("location"))
+
+
+async def resolve_iata_async(city: str) -> Optional[str]:
+    """Async variant of resolve_iata."""
+    return city_to_iata(city) or nearest_iata((await get_weather_async(city)).get("location"))
+
+
+def resolve_airports(city: str) -> List[str]:
+    """
+    Every airport serving a city: its metro area from airports.csv, else
+    the single airport resolve_iata finds.
+
+    Args:
+        city: City name
+
+    Returns:
+        IATA codes, nearest the city centre first (empty if none found)
+    """
+    airports = get_airport_index().metro_airports(city)
+    if airports:
+        return list(airports)
+    iata = resolve_iata(city)
+    return [iata] if iata else []
+
+
+async def resolve_airports_async(city: str) -> List[str]:
+    """Async variant of resolve_airports."""
+    airports = get_airport_index().metro_airports(city)
+    if airports:
+        return list(airports)
+    iata = await resolve_iata_async(city)
+    return [iata] if iata else []
+
+
+def _flights_request(iata: str, api_key: str,
+                     window: Optional[Tuple[str, str]] = None) -> Tuple[str, Dict[str, str], Dict[str, str]]:
+    if window:
+        from_time, to_time = window
+    else:
+        # Use a 12-hour window from now
+        now = datetime.utcnow()
+        from_time = now.strftime('%Y-%m-%dT%H:00')
+        to_time = (now + timedelta(hours=12)).strftime('%Y-%m-%dT%H:00')
+    url = f"{AERODATABOX_BASE_URL}/flights/airports/iata/{iata}/{from_time}/{to_time}"
+    headers = {
+        "X-RapidAPI-Key": api_key,
+        "X-RapidAPI-Host": AERODATABOX_HOST
+    }
+    params = {
+        "withLeg": "true",
+        "direction": "Both",
+        "withCancelled": "true",
+        # Codeshares are the same aircraft under another flight number
+        "withCodeshared": "false",
+        "withCargo": "true",
+        "withPrivate": "true",
+        "withLocation": "false"
+    }
+    return url, headers, params
+
+
+def calculate_availability_score(total_flights: int, unique_airlines: int) -> int:
+    """
+    Score flight availability from traffic volume and airline variety.
+
+    Args:
+        total_flights: Departures plus arrivals in the window
+        unique_airlines: Number of distinct airlines operating them
+
+    Returns:
+        Availability score (0-100)
+    """
+    return get_scoring_model().availability_score(total_flights, unique_airlines)
+
+
+def rescore_flights(result: Any) -> Any:
+    """A cached flights result, re-scored if the scoring model changed since."""
+    return rescore(result, lambda model, data: {
+        "availability_score": model.availability_score(data["total_flights"], data["unique_airlines"])
+    })
+
+
+class FlightSummary:
+    """
+    Incremental aggregate over the departures and arrivals of one response.
+
+    Counts every flight and distinct airline but keeps only the first
+    TOP_N records of each direction, so memory per request is bounded no
+    matter how large the upstream payload is. Codeshares are counted once,
+    as the operating flight.
+    """
+
+    TOP_N = 10
+
+    def __init__(self):
+        self.total_flights = 0
+        self.airlines = set()
+        self.departures: List[Dict[str, Any]] = []
+        self.arrivals: List[Dict[str, Any]] = []
+        self._seen = set()
+
+    def add(self, direction: str, f: Dict[str, Any]) -> None:
+        if f.get("codeshareStatus") == "IsCodeshared":
+            return
+        # Marketing copies that slip through share everything but the
+        # airline and number with the operating flight
+        here, there = ("departure", "arrival") if direction == "departures" else ("arrival", "departure")
+        other = f.get(there, {}).get("airport", {})
+        key = (direction, f.get(here, {}).get("scheduledTime", {}).get("local"),
+               other.get("iata") or other.get("name"), f.get("aircraft", {}).get("model"))
+        if key[1] is not None:
+            if key in self._seen:
+                return
+            self._seen.add(key)
+        self.total_flights += 1
+        airline = f.get("airline", {}).get("name")
+        if airline:
+            self.airlines.add(airline)
+        kept = self.departures if direction == "departures" else self.arrivals
+        if len(kept) < self.TOP_N:
+            kept.append({
+                "airline": airline,
+                "flight_number": f.get("number") or f.get("flightNumber"),
+                "departure_airport": f.get("departure", {}).get("airport", {}).get("name"),
+                "arrival_airport": f.get("arrival", {}).get("airport", {}).get("name"),
+                "departure_time": f.get("departure", {}).get("scheduledTime", {}).get("local"),
+                "arrival_time": f.get("arrival", {}).get("scheduledTime", {}).get("local")
+            })
+
+    def merge(self, other: "FlightSummary") -> None:
+        """Fold in the summary of another airport's response."""
+        self.total_flights += other.total_flights
+        self.airlines |= other.airlines
+        self.departures = (self.departures + other.departures)[:self.TOP_N]
+        self.arrivals = (self.arrivals + other.arrivals)[:self.TOP_N]
+
+    def result(self) -> Dict[str, Any]:
+        model = get_scoring_model()
+        return {
+            # Departures first, then arrivals, as the full-list version returned
+            "flights": (self.departures + self.arrivals)[:self.TOP_N],
+            "total_flights": self.total_flights,
+            "unique_airlines": len(self.airlines),
+            "availability_score": model.availability_score(self.total_flights, len(self.airlines)),
+            "scoring_version": model.version,
+            "status": "success"
+        }
+
+
+FLIGHT_ARRAYS = ("departures", "arrivals")
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _upstream_error(status_code: int) -> Dict[str, Any]:
+    print(f"[ERROR] AeroDataBox API returned HTTP {status_code}")
+    return {
+        "error": f"AeroDataBox API returned HTTP {status_code}",
+        "status": "error"
+    }
+
+
+def _request_failed(e: Exception) -> Dict[str, Any]:
+    print(f"[ERROR] AeroDataBox API request failed: {e}")
+    return {
+        "error": f"AeroDataBox API request failed: {str(e)}",
+        "status": "error"
+    }
+
+
+def _unreadable_response(e: Exception) -> Dict[str, Any]:
+    print(f"[ERROR] AeroDataBox API returned an unreadable response: {e}")
+    return {
+        "error": f"AeroDataBox API returned an unreadable response: {str(e)}",
+        "status": "error"
+    }
+
+
+def _metro_budget(airports: List[str]) -> List[str]:
+    """
+    The airports a single lookup may query: one AeroDataBox call each, so
+    never more than the budget can grant at once at the current priority
+    (background refreshes leave a reserve), nearest airports first.
+    """
+    return airports[:max(1, scheduler.max_tokens("aerodatabox"))]
+
+
+def _fetch_airport(iata: str, api_key: str) -> Union[FlightSummary, Dict[str, Any]]:
+    """
+    Summary of one airport's departures and arrivals, or an error result.
+    The caller has already taken the call's token from the AeroDataBox budget.
+    """
+    try:
+        url, headers, params = _flights_request(iata, api_key)
+        # Stream the body through the incremental parser instead of
+        # materializing a multi-MB response
+        with http_client.stream(url, headers=headers, params=params, timeout=AERODATABOX_TIMEOUT,
+                                provider="aerodatabox", prepaid=True) as resp:
+            if resp.status_code >= 400:
+                return _upstream_error(resp.status_code)
+            summary = FlightSummary()
+            for direction, f in iter_array_items(resp.iter_content(STREAM_CHUNK_SIZE), FLIGHT_ARRAYS):
+                summary.add(direction, f)
+            return summary
+    except requests.exceptions.RequestException as e:
+        return _request_failed(e)
+    except (ValueError, KeyError) as e:
+        return _unreadable_response(e)
+
+
+async def _fetch_airport_async(iata: str, api_key: str,
+                               window: Optional[Tuple[str, str]] = None) -> Union[FlightSummary, Dict[str, Any]]:
+    """Async variant of _fetch_airport, optionally for a given (from, to) local time window."""
+    try:
+        url, headers, params = _flights_request(iata, api_key, window)
+        async with http_client.async_stream(url, headers=headers, params=params, timeout=AERODATABOX_TIMEOUT,
+                                            provider="aerodatabox", prepaid=True) as resp:
+            if resp.status_code >= 400:
+                return _upstream_error(resp.status_code)
+            summary = FlightSummary()
+            parser = ArrayItemParser(FLIGHT_ARRAYS)
+            async for text in resp.aiter_text(STREAM_CHUNK_SIZE):
+                for direction, f in parser.feed(text):
+                    summary.add(direction, f)
+            parser.close()
+            return summary
+    except httpx.HTTPError as e:
+        return _request_failed(e)
+    except (ValueError, KeyError) as e:
+        return _unreadable_response(e)
+
+
+def _merge_airports(airports: List[str], outcomes: List[Union[FlightSummary, Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Combine per-airport outcomes into one flights result.
+
+    Airports that failed make the result "partial" (cached only briefly);
+    if every airport failed, the first failure is returned as is.
+    """
+    summary = FlightSummary()
+    ok, errors = [], []
+    for iata, outcome in zip(airports, outcomes):
+        if isinstance(outcome, FlightSummary):
+            summary.merge(outcome)
+            ok.append(iata)
+        else:
+            errors.append((iata, outcome))
+    if not ok:
+        return errors[0][1]
+    result = {**summary.result(), "airport": ok[0], "airports": ok}
+    if errors:
+        result["status"] = "partial"
+        result["error"] = "; ".join(f"{iata}: {e.get('error')}" for iata, e in errors)
+    return result
+
+
+@cached("flights", rescore=rescore_flights)
+@recorded("flights")
 def get_flights(city: str) -> Dict[str, Any]:
-    api_key = os.getenv("AERODATABOX_API_KEY")
+    api_key = upstream_key("AERODATABOX_API_KEY")
     if not api_key:
         print("[ERROR] AeroDataBox API key not configured")
         return {
@@ -24,72 +320,100 @@ def get_flights(city: str) -> Dict[str, Any]:
             "status": "error"
         }
     try:
-        iata = city_to_iata(city)
-        if not iata:
+        airports = resolve_airports(city)
+        if not airports:
             return {
                 "error": f"Could not find IATA code for city '{city}'",
                 "status": "error"
             }
-        # Use a 12-hour window from now
-        now = datetime.utcnow()
-        from_time = now.strftime('%Y-%m-%dT%H:00')
-        to_time = (now + timedelta(hours=12)).strftime('%Y-%m-%dT%H:00')
-        url = f"https://aerodatabox.p.rapidapi.com/flights/airports/iata/{iata}/{from_time}/{to_time}"
-        headers = {
-            "X-RapidAPI-Key": api_key,
-            "X-RapidAPI-Host": "aerodatabox.p.rapidapi.com"
-        }
-        params = {
-            "withLeg": "true",
-            "direction": "Both",
-            "withCancelled": "true",
-            "withCodeshared": "true",
-            "withCargo": "true",
-            "withPrivate": "true",
-            "withLocation": "false"
-        }
-        print(f"[INFO] Requesting: {url}")
-        resp = requests.get(url, headers=headers, params=params)
-        print(f"[INFO] Status: {resp.status_code}")
-        print(f"[DEBUG] Response: {resp.text}")
-        data = resp.json()
-        flights = []
-        for f in data.get("departures", []) + data.get("arrivals", []):
-            airline = f.get("airline", {}).get("name")
-            flight_number = f.get("number") or f.get("flightNumber")
-            dep_airport = f.get("departure", {}).get("airport", {}).get("name")
-            arr_airport = f.get("arrival", {}).get("airport", {}).get("name")
-            dep_time = f.get("departure", {}).get("scheduledTime", {}).get("local")
-            arr_time = f.get("arrival", {}).get("scheduledTime", {}).get("local")
-            flights.append({
-                    "airline": airline,
-                    "flight_number": flight_number,
-                    "departure_airport": dep_airport,
-                    "arrival_airport": arr_airport,
-                    "departure_time": dep_time,
-                    "arrival_time": arr_time
-            })
-        useful_flights = flights
-        unique_airlines = set(f["airline"] for f in useful_flights if f.get("airline"))
-        flight_score = min(len(useful_flights), 150) / 150 * 60
-        airline_score = min(len(unique_airlines), 8) / 8 * 40
-        availability_score = int(flight_score + airline_score)
+        airports = _metro_budget(airports)
+        # Budget the whole metro up front rather than shedding some of its airports
+        http_client.acquire_budget_blocking("aerodatabox", len(airports))
+        if len(airports) == 1:
+            outcomes = [_fetch_airport(airports[0], api_key)]
+        else:
+            # One query per airport; latency is the slowest, not the sum
+            with ThreadPoolExecutor(max_workers=min(FLIGHTS_MAX_PARALLEL, len(airports))) as pool:
+                outcomes = list(pool.map(lambda iata: _fetch_airport(iata, api_key), airports))
+        return _merge_airports(airports, outcomes)
+    except BudgetExhausted as e:
+        return budget_exhausted_result(e)
+    except Exception as e:
+        print(f"[ERROR] Unexpected error: {e}")
         return {
-            "flights": useful_flights[:10],
-            "total_flights": len(useful_flights),
-            "unique_airlines": len(unique_airlines),
-            "availability_score": availability_score,
-            "status": "success"
+            "error": f"Unexpected error: {str(e)}",
+            "status": "error"
         }
-    except requests.exceptions.RequestException as e:
-        print(f"[ERROR] AeroDataBox API request failed: {e}")
+
+
+async def _flights_for_city_async(city: str, window: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+    api_key = upstream_key("AERODATABOX_API_KEY")
+    if not api_key:
+        print("[ERROR] AeroDataBox API key not configured")
         return {
-            "error": f"AeroDataBox API request failed: {str(e)}",
+            "error": "AeroDataBox API key not configured",
             "status": "error"
         }
+    try:
+        airports = await resolve_airports_async(city)
+        if not airports:
+            return {
+                "error": f"Could not find IATA code for city '{city}'",
+                "status": "error"
+            }
+        airports = _metro_budget(airports)
+        await http_client.acquire_budget("aerodatabox", len(airports))
+        semaphore = asyncio.Semaphore(FLIGHTS_MAX_PARALLEL)
+
+        async def fetch(iata: str) -> Union[FlightSummary, Dict[str, Any]]:
+            async with semaphore:
+                return await _fetch_airport_async(iata, api_key, window)
+
+        outcomes = await asyncio.gather(*(fetch(iata) for iata in airports))
+        return _merge_airports(airports, list(outcomes))
+    except BudgetExhausted as e:
+        return budget_exhausted_result(e)
     except Exception as e:
         print(f"[ERROR] Unexpected error: {e}")
         return {
             "error": f"Unexpected error: {str(e)}",
             "status": "error"
-        }
\ No newline at end of file
+        }
+
+
+@cached("flights", rescore=rescore_flights)
+@recorded("flights")
+async def get_flights_async(city: str) -> Dict[str, Any]:
+    """
+    Async variant of get_flights using the shared pooled HTTP client.
+
+    Args:
+        city: City name to look up departures and arrivals for
+
+    Returns:
+        Dict containing flight availability or error information
+    """
+    return await _flights_for_city_async(city)
+
+
+def flights_day_cache_key(city: str, day: str) -> str:
+    return cache_key(city, day)
+
+
+@cached("flights", key_func=flights_day_cache_key, rescore=rescore_flights)
+async def get_flights_on_day_async(city: str, day: str) -> Dict[str, Any]:
+    """
+    Flight availability over the busiest hours (FLIGHT_DAY_WINDOW) of one day.
+
+    Cached per (city, day), so overlapping trip windows share their days.
+    Not recorded in the history, which tracks the rolling 12 hours from now.
+
+    Args:
+        city: City name to look up departures and arrivals for
+        day: ISO date
+
+    Returns:
+        Dict containing flight availability or error information
+    """
+    start, end = FLIGHT_DAY_WINDOW
+    return await _flights_for_city_async(city, (f"{day}T{start}", f"{day}T{end}"))
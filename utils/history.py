@@ -0,0 +1,371 @@
+"""
+Append-only history of upstream results with incrementally maintained rollups.
+
+Every fresh weather, flight and safety result is appended to a SQLite
+database (HISTORY_DB_PATH). The same transaction folds its numeric fields
+into two rollup tables:
+
+- a running count/mean/variance (Welford) and an exponentially weighted
+  moving average per (city, source, metric)
+- per-day count/sum/min/max per (city, source, metric)
+
+Rollups are updated with UPSERTs, so recording costs the same however long
+the history is, and trend and /history lookups read a handful of rows by
+primary key instead of rescanning observations or calling the upstreams.
+
+Writes happen on a background thread in batches, so recording a result
+never waits on disk. When the queue is full, new observations are dropped
+and counted rather than slowing requests down.
+"""
+
+import asyncio
+import functools
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.airport_index import normalize_city
+
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "history.sqlite3")
+# Weight of the newest observation in the moving average
+HISTORY_EWMA_ALPHA = float(os.getenv("HISTORY_EWMA_ALPHA", "0.2"))
+HISTORY_QUEUE_SIZE = int(os.getenv("HISTORY_QUEUE_SIZE", "10000"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1"))
+HISTORY_MAX_DAYS = 366
+
+# Numeric fields kept per source, as paths into the client result
+METRICS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "weather": {
+        "temp_f": ("current", "temp_f"),
+        "humidity": ("current", "humidity"),
+        "wind_mph": ("current", "wind_mph"),
+        "weather_score": ("weather_score",),
+    },
+    "flights": {
+        "total_flights": ("total_flights",),
+        "unique_airlines": ("unique_airlines",),
+        "availability_score": ("availability_score",),
+    },
+    "safety": {
+        "articles": ("articles",),
+        "safety_score": ("safety_score",),
+    },
+}
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS observations ("
+    " id INTEGER PRIMARY KEY,"
+    " city TEXT NOT NULL,"
+    " source TEXT NOT NULL,"
+    " observed_at REAL NOT NULL,"
+    " data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS observations_city ON observations (city, source, observed_at)",
+    "CREATE TABLE IF NOT EXISTS rollups ("
+    " city TEXT NOT NULL,"
+    " source TEXT NOT NULL,"
+    " metric TEXT NOT NULL,"
+    " count INTEGER NOT NULL,"
+    " mean REAL NOT NULL,"
+    " m2 REAL NOT NULL,"
+    " ewma REAL NOT NULL,"
+    " last REAL NOT NULL,"
+    " first_at REAL NOT NULL,"
+    " last_at REAL NOT NULL,"
+    " PRIMARY KEY (city, source, metric)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS daily ("
+    " city TEXT NOT NULL,"
+    " source TEXT NOT NULL,"
+    " metric TEXT NOT NULL,"
+    " day TEXT NOT NULL,"
+    " count INTEGER NOT NULL,"
+    " total REAL NOT NULL,"
+    " min REAL NOT NULL,"
+    " max REAL NOT NULL,"
+    " PRIMARY KEY (city, source, metric, day)) WITHOUT ROWID",
+)
+
+# Welford's update, written so every right-hand side sees the old row
+_UPSERT_ROLLUP = (
+    "INSERT INTO rollups (city, source, metric, count, mean, m2, ewma, last, first_at, last_at)"
+    " VALUES (:city, :source, :metric, 1, :value, 0, :value, :value, :at, :at)"
+    " ON CONFLICT (city, source, metric) DO UPDATE SET"
+    " count = count + 1,"
+    " mean = mean + (:value - mean) / (count + 1),"
+    " m2 = m2 + (:value - mean) * (:value - (mean + (:value - mean) / (count + 1))),"
+    " ewma = ewma + :alpha * (:value - ewma),"
+    " last = CASE WHEN :at >= last_at THEN :value ELSE last END,"
+    " last_at = MAX(last_at, :at)"
+)
+_UPSERT_DAILY = (
+    "INSERT INTO daily (city, source, metric, day, count, total, min, max)"
+    " VALUES (:city, :source, :metric, :day, 1, :value, :value, :value)"
+    " ON CONFLICT (city, source, metric, day) DO UPDATE SET"
+    " count = count + 1, total = total + :value, min = MIN(min, :value), max = MAX(max, :value)"
+)
+
+
+def extract_metrics(source: str, result: Dict[str, Any]) -> Dict[str, float]:
+    """Numeric fields of a client result that are tracked for source."""
+    values = {}
+    for metric, path in METRICS.get(source, {}).items():
+        value: Any = result
+        for part in path:
+            value = value.get(part) if isinstance(value, dict) else None
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            values[metric] = float(value)
+    return values
+
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).date().isoformat()
+
+
+class HistoryStore:
+    """SQLite store for observations and their rollups (safe across threads and worker processes)."""
+
+    def __init__(self, path: str = HISTORY_DB_PATH, ewma_alpha: float = HISTORY_EWMA_ALPHA):
+        self.path = path
+        self.ewma_alpha = ewma_alpha
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        for statement in _SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread, and never reuse one inherited across fork()
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def append(self, observations: List[Tuple[str, str, float, Dict[str, Any]]]) -> None:
+        """
+        Store observations and fold them into the rollups in one transaction.
+
+        Args:
+            observations: (city, source, observed_at, result) tuples
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for city, source, observed_at, result in observations:
+                key = normalize_city(city)
+                metrics = extract_metrics(source, result)
+                conn.execute(
+                    "INSERT INTO observations (city, source, observed_at, data) VALUES (?, ?, ?, ?)",
+                    (key, source, observed_at, json.dumps({"city": city, **metrics})),
+                )
+                day = _day(observed_at)
+                for metric, value in metrics.items():
+                    params = {"city": key, "source": source, "metric": metric, "value": value,
+                              "at": observed_at, "day": day, "alpha": self.ewma_alpha}
+                    conn.execute(_UPSERT_ROLLUP, params)
+                    conn.execute(_UPSERT_DAILY, params)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def rollups(self, city: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Running aggregates and trend per source and metric for a city."""
+        rows = self._conn().execute(
+            "SELECT source, metric, count, mean, m2, ewma, last, first_at, last_at FROM rollups WHERE city = ?",
+            (normalize_city(city),),
+        ).fetchall()
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for source, metric, count, mean, m2, ewma, last, first_at, last_at in rows:
+            result.setdefault(source, {})[metric] = trend(count, mean, m2, ewma, last, first_at, last_at)
+        return result
+
+    def daily(self, city: str, days: int = 30) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        """Per-day mean/min/max per source and metric over the last days days."""
+        since = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+        rows = self._conn().execute(
+            "SELECT source, metric, day, count, total, min, max FROM daily"
+            " WHERE city = ? AND day >= ? ORDER BY source, metric, day",
+            (normalize_city(city), since),
+        ).fetchall()
+        result: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        for source, metric, day, count, total, low, high in rows:
+            result.setdefault(source, {}).setdefault(metric, []).append({
+                "day": day, "count": count, "mean": round(total / count, 2), "min": low, "max": high,
+            })
+        return result
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+
+def trend(count: int, mean: float, m2: float, ewma: float, last: float,
+          first_at: float, last_at: float) -> Dict[str, Any]:
+    """
+    Summarize one metric's rollup.
+
+    "direction" compares the moving average with the long-run mean: it is
+    "up" or "down" when they differ by more than half a standard deviation.
+    "z_score" places the latest value within the city's own history.
+    """
+    stddev = math.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+    direction = "steady"
+    if stddev and abs(ewma - mean) > 0.5 * stddev:
+        direction = "up" if ewma > mean else "down"
+    return {
+        "latest": last,
+        "mean": round(mean, 2),
+        "stddev": round(stddev, 2),
+        "moving_average": round(ewma, 2),
+        "z_score": round((last - mean) / stddev, 2) if stddev else 0.0,
+        "direction": direction,
+        "samples": count,
+        "since": first_at,
+        "updated_at": last_at,
+    }
+
+
+class HistoryRecorder:
+    """Queues observations and writes them to a HistoryStore in batches on a background thread."""
+
+    def __init__(self, store: HistoryStore, maxsize: int = HISTORY_QUEUE_SIZE,
+                 flush_interval: float = HISTORY_FLUSH_INTERVAL):
+        self.store = store
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self.recorded = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def record(self, city: str, source: str, result: Dict[str, Any]) -> None:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((city, source, time.time(), result))
+            self.recorded += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self) -> None:
+        # Started lazily so each worker process gets its own writer after fork()
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                    self._thread.start()
+
+    def _drain(self, first) -> List:
+        batch = [first]
+        while len(batch) < 500:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List) -> None:
+        items = [item for item in batch if item is not None]
+        if not items:
+            return
+        try:
+            self.store.append(items)
+        except Exception as e:
+            self.failed += len(items)
+            print(f"[ERROR] Failed to write {len(items)} history observations: {e}")
+
+    def _run(self) -> None:
+        while True:
+            batch = self._drain(self._queue.get())
+            self._write(batch)
+            if None in batch:
+                return
+            # Let a burst accumulate into the next transaction
+            time.sleep(self.flush_interval)
+
+    def close(self, timeout: float = 5) -> None:
+        """Write everything queued so far and stop the writer thread."""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+        self._thread = None
+        self.store.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.store.path,
+            "recorded": self.recorded,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+_recorder: Optional[HistoryRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_history() -> Optional[HistoryRecorder]:
+    """Process-wide recorder, or None when HISTORY_ENABLED is off."""
+    global _recorder
+    if not HISTORY_ENABLED:
+        return None
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = HistoryRecorder(HistoryStore())
+    return _recorder
+
+
+def close_history() -> None:
+    global _recorder
+    with _recorder_lock:
+        if _recorder is not None:
+            _recorder.close()
+        _recorder = None
+
+
+def _record(source: str, city: str, result: Any) -> None:
+    if isinstance(result, dict) and result.get("status") == "success":
+        recorder = get_history()
+        if recorder is not None:
+            recorder.record(city, source, result)
+
+
+def recorded(source: str):
+    """
+    Decorate a sync or async upstream client so each successful result it
+    fetches is appended to the history. Apply it beneath @cached, so only
+    fresh upstream results are recorded, not cache hits.
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(city: str, *args, **kwargs):
+                result = await func(city, *args, **kwargs)
+                _record(source, city, result)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(city: str, *args, **kwargs):
+            result = func(city, *args, **kwargs)
+            _record(source, city, result)
+            return result
+        return wrapper
+
+    return decorator
@@ -0,0 +1,453 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import random
+import threading
+import time
+import io
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.response import HTTPResponse
+from urllib3.util.retry import Retry
+from utils.metrics import UPSTREAM_BUDGET_WAIT_SECONDS, UPSTREAM_IN_FLIGHT, observe_upstream
+from utils.upstream import BudgetExhausted, scheduler
+from utils.upstream_archive import ArchivedResponse, UpstreamArchive, get_archive, replaying
+
+# Connection pools shared by every upstream client
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))  # connections kept per upstream host
+DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "10"))
+
+# Retries for failing (5xx) upstream responses; each one takes its own budget token
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.3"))
+MAX_BACKOFF = float(os.getenv("HTTP_MAX_BACKOFF", "5"))
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
+# A throttled (429) call isn't retried: the provider's budget is paused for
+# its Retry-After (or THROTTLE_PAUSE without one), capped at MAX_THROTTLE_PAUSE
+THROTTLE_PAUSE = float(os.getenv("HTTP_THROTTLE_PAUSE", "1"))
+MAX_THROTTLE_PAUSE = float(os.getenv("HTTP_MAX_THROTTLE_PAUSE", "60"))
+
+# Provider whose budget pays for the sync session's retries of the current call
+_retry_provider: contextvars.ContextVar = contextvars.ContextVar("retry_provider", default=None)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    Seconds to wait before retry number attempt (1-based).
+
+    Exponential backoff with full jitter, so retries from many workers don't
+    land on a struggling upstream in lockstep. A Retry-After header wins.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_BACKOFF)
+        except ValueError:
+            pass
+    return random.uniform(0, min(MAX_BACKOFF, BACKOFF_FACTOR * (2 ** (attempt - 1))))
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def _throttled(provider: Optional[str], status: int, headers: Any) -> None:
+    """Pause provider's budget when it answered 429."""
+    if provider and status == 429:
+        pause = _retry_after_seconds(headers.get("Retry-After"))
+        scheduler.pause(provider, min(THROTTLE_PAUSE if pause is None else pause, MAX_THROTTLE_PAUSE))
+
+
+class _JitterRetry(Retry):
+    """
+    urllib3 Retry whose exponential backoff is jittered, and whose retries
+    each take a token from the current call's provider budget.
+    """
+
+    # urllib3 would otherwise retry any 429 that carries a Retry-After
+    RETRY_AFTER_STATUS_CODES = frozenset(RETRY_STATUSES)
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff else 0
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response=response, error=error, _pool=_pool, _stacktrace=_stacktrace)
+        try:
+            acquire_budget_blocking(_retry_provider.get())
+        except BudgetExhausted as e:
+            # Give up as if out of retries: the caller gets the last response or error
+            raise MaxRetryError(_pool, url, error or ResponseError(str(e))) from e
+        return retry
+
+
+class _TimeoutSession(requests.Session):
+    """requests.Session that applies DEFAULT_TIMEOUT when a call doesn't set one."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def _falls_back(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+class _ArchiveAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that records responses to, or answers them from, the
+    upstream archive (see utils/upstream_archive.py).
+    """
+
+    def __init__(self, archive: UpstreamArchive, **kwargs):
+        self.archive = archive
+        super().__init__(**kwargs)
+
+    def _archived(self, request: requests.PreparedRequest, archived: ArchivedResponse) -> requests.Response:
+        headers = {**archived.headers, "content-length": str(len(archived.body))}
+        raw = HTTPResponse(body=io.BytesIO(archived.body), headers=headers, status=archived.status,
+                           preload_content=False, decode_content=False)
+        return self.build_response(request, raw)
+
+    def _from_archive(self, request: requests.PreparedRequest) -> Optional[requests.Response]:
+        archived = self.archive.lookup(request.url)
+        return self._archived(request, archived) if archived is not None else None
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if self.archive.replaying:
+            response = self._from_archive(request)
+            if response is None:
+                raise requests.ConnectionError(f"{request.path_url} is not in the upstream archive", request=request)
+            return response
+        try:
+            response = super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        except requests.RequestException:
+            if self.archive.mode == "fallback":
+                archived = self._from_archive(request)
+                if archived is not None:
+                    return archived
+            raise
+        if self.archive.mode == "fallback" and _falls_back(response.status_code):
+            archived = self._from_archive(request)
+            if archived is not None:
+                response.close()
+                return archived
+        if self.archive.mode == "record":
+            # Reading the body here keeps iter_content working for the caller
+            self.archive.record(request.url, response.status_code, response.headers, response.content)
+        return response
+
+
+class _ArchiveTransport(httpx.AsyncBaseTransport):
+    """httpx transport counterpart of _ArchiveAdapter."""
+
+    def __init__(self, archive: UpstreamArchive, transport: httpx.AsyncBaseTransport):
+        self.archive = archive
+        self.transport = transport
+
+    def _from_archive(self, request: httpx.Request) -> Optional[httpx.Response]:
+        archived = self.archive.lookup(str(request.url))
+        if archived is None:
+            return None
+        return httpx.Response(archived.status, headers=archived.headers, content=archived.body, request=request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.archive.replaying:
+            response = self._from_archive(request)
+            if response is None:
+                raise httpx.ConnectError(f"{request.url.raw_path.decode()} is not in the upstream archive",
+                                         request=request)
+            return response
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError:
+            if self.archive.mode == "fallback":
+                archived = self._from_archive(request)
+                if archived is not None:
+                    return archived
+            raise
+        if self.archive.mode == "fallback" and _falls_back(response.status_code):
+            archived = self._from_archive(request)
+            if archived is not None:
+                await response.aclose()
+                return archived
+        if self.archive.mode == "record":
+            # aread() decodes the body, as the sync adapter's response.content does
+            content = await response.aread()
+            self.archive.record(str(request.url), response.status_code, response.headers, content)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide keep-alive session used by the sync clients.
+
+    Returns:
+        Shared requests.Session with pooled, retrying adapters
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = _JitterRetry(
+                    total=MAX_RETRIES,
+                    backoff_factor=BACKOFF_FACTOR,
+                    status_forcelist=sorted(RETRY_STATUSES),
+                    allowed_methods=frozenset({"GET"}),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                archive = get_archive()
+                if archive is not None:
+                    adapter = _ArchiveAdapter(archive, pool_connections=8, pool_maxsize=POOL_MAXSIZE,
+                                              max_retries=retry)
+                else:
+                    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+                session = _TimeoutSession()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def acquire_budget_blocking(provider: Optional[str], tokens: int = 1) -> None:
+    """
+    Take tokens from provider's rate budget up front, for a fan-out of calls
+    that are then made with prepaid=True. Raises upstream.BudgetExhausted.
+    """
+    # A replay spends no provider quota
+    if provider and not replaying():
+        start = time.perf_counter()
+        scheduler.acquire_blocking(provider, tokens=tokens)
+        UPSTREAM_BUDGET_WAIT_SECONDS.observe(time.perf_counter() - start, provider)
+
+
+async def acquire_budget(provider: Optional[str], tokens: int = 1) -> None:
+    """Async counterpart of acquire_budget_blocking."""
+    if provider and not replaying():
+        start = time.perf_counter()
+        await scheduler.acquire(provider, tokens=tokens)
+        UPSTREAM_BUDGET_WAIT_SECONDS.observe(time.perf_counter() - start, provider)
+
+
+def get(url: str, *, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None, provider: Optional[str] = None, prepaid: bool = False,
+        **kwargs) -> requests.Response:
+    """
+    GET through the shared sync session (pooled, keep-alive, retried).
+
+    With a provider name the call first takes a token from that provider's
+    rate budget and raises upstream.BudgetExhausted if none is available,
+    unless prepaid says the caller already took it with acquire_budget_blocking.
+    Each retry takes another token (giving up when there is none), and a 429
+    pauses the budget for the response's Retry-After instead of being retried.
+    """
+    if not prepaid:
+        acquire_budget_blocking(provider)
+    label = provider or "other"
+    status, size = "error", None
+    UPSTREAM_IN_FLIGHT.inc(label)
+    start = time.perf_counter()
+    token = _retry_provider.set(provider)
+    try:
+        resp = get_session().get(url, params=params, headers=headers, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+        status = str(resp.status_code)
+        _throttled(provider, resp.status_code, resp.headers)
+        if not kwargs.get("stream"):
+            size = len(resp.content)
+        return resp
+    finally:
+        _retry_provider.reset(token)
+        UPSTREAM_IN_FLIGHT.dec(label)
+        observe_upstream(label, status, time.perf_counter() - start, size)
+
+
+@contextlib.contextmanager
+def stream(url: str, *, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None,
+           timeout: Optional[float] = None, provider: Optional[str] = None,
+           prepaid: bool = False) -> Iterator[requests.Response]:
+    """
+    Like get, but the body is left unread so it can be consumed incrementally
+    (resp.raw / iter_content) inside the block. Timing covers the whole block.
+    """
+    if not prepaid:
+        acquire_budget_blocking(provider)
+    label = provider or "other"
+    status, size = "error", None
+    UPSTREAM_IN_FLIGHT.inc(label)
+    start = time.perf_counter()
+    token = _retry_provider.set(provider)
+    try:
+        try:
+            resp = get_session().get(url, params=params, headers=headers, timeout=timeout or DEFAULT_TIMEOUT,
+                                     stream=True)
+        finally:
+            _retry_provider.reset(token)
+        with resp:
+            status = str(resp.status_code)
+            _throttled(provider, resp.status_code, resp.headers)
+            try:
+                yield resp
+            finally:
+                size = resp.raw.tell()
+    finally:
+        UPSTREAM_IN_FLIGHT.dec(label)
+        observe_upstream(label, status, time.perf_counter() - start, size)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide pooled async HTTP client, creating it on first use.
+
+    Returns:
+        Shared httpx.AsyncClient
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        limits = httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        )
+        archive = get_archive()
+        if archive is not None:
+            transport = _ArchiveTransport(archive, httpx.AsyncHTTPTransport(limits=limits))
+            _async_client = httpx.AsyncClient(transport=transport, timeout=DEFAULT_TIMEOUT)
+        else:
+            _async_client = httpx.AsyncClient(limits=limits, timeout=DEFAULT_TIMEOUT)
+    return _async_client
+
+
+async def _send_with_retries(url: str, params: Optional[Dict[str, Any]], headers: Optional[Dict[str, str]],
+                             timeout: Optional[float], stream: bool, provider: Optional[str]) -> httpx.Response:
+    client = get_async_client()
+    # Retrying a replay can't change its answer
+    max_retries = 0 if replaying() else MAX_RETRIES
+    attempt = 0
+    while True:
+        retry_after = error = response = None
+        request = client.build_request("GET", url, params=params, headers=headers, timeout=timeout or DEFAULT_TIMEOUT)
+        try:
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError as e:
+            if attempt >= max_retries:
+                raise
+            error = e
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt >= max_retries:
+                return response
+            retry_after = response.headers.get("Retry-After")
+        attempt += 1
+        await asyncio.sleep(backoff_delay(attempt, retry_after))
+        try:
+            # A retry is another call against the provider's quota
+            await acquire_budget(provider)
+        except BudgetExhausted:
+            if response is None:
+                raise error
+            return response
+        if response is not None:
+            await response.aclose()
+
+
+async def async_get(url: str, *, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None,
+                    timeout: Optional[float] = None, provider: Optional[str] = None,
+                    prepaid: bool = False) -> httpx.Response:
+    """
+    GET through the shared async client, retrying 5xx responses and
+    connection errors with jittered exponential backoff. A provider name
+    applies that provider's rate budget (unless prepaid), as in get(); each
+    retry takes another token, and a 429 pauses the budget instead.
+    """
+    if not prepaid:
+        await acquire_budget(provider)
+    label = provider or "other"
+    status, size = "error", None
+    UPSTREAM_IN_FLIGHT.inc(label)
+    start = time.perf_counter()
+    try:
+        response = await _send_with_retries(url, params, headers, timeout, stream=False, provider=provider)
+        status, size = str(response.status_code), len(response.content)
+        _throttled(provider, response.status_code, response.headers)
+        return response
+    finally:
+        UPSTREAM_IN_FLIGHT.dec(label)
+        observe_upstream(label, status, time.perf_counter() - start, size)
+
+
+@contextlib.asynccontextmanager
+async def async_stream(url: str, *, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None,
+                       timeout: Optional[float] = None, provider: Optional[str] = None,
+                       prepaid: bool = False) -> AsyncIterator[httpx.Response]:
+    """
+    Like async_get, but the body is left unread so it can be consumed
+    incrementally (response.aiter_bytes/aiter_text) inside the block.
+    """
+    if not prepaid:
+        await acquire_budget(provider)
+    label = provider or "other"
+    status, size = "error", None
+    UPSTREAM_IN_FLIGHT.inc(label)
+    start = time.perf_counter()
+    try:
+        response = await _send_with_retries(url, params, headers, timeout, stream=True, provider=provider)
+        status = str(response.status_code)
+        _throttled(provider, response.status_code, response.headers)
+        try:
+            yield response
+        finally:
+            size = response.num_bytes_downloaded
+            await response.aclose()
+    finally:
+        UPSTREAM_IN_FLIGHT.dec(label)
+        observe_upstream(label, status, time.perf_counter() - start, size)
+
+
+def open_clients() -> None:
+    """Create the shared sync session and async client (app startup)."""
+    get_session()
+    get_async_client()
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Whether the shared clients are open, their limits, and upstream calls in progress."""
+    return {
+        "sync_session_open": _session is not None,
+        "async_client_open": _async_client is not None and not _async_client.is_closed,
+        "max_connections": MAX_CONNECTIONS,
+        "max_keepalive_connections": MAX_KEEPALIVE_CONNECTIONS,
+        "pool_maxsize_per_host": POOL_MAXSIZE,
+        "in_flight": {labels[0]: int(value) for labels, value in UPSTREAM_IN_FLIGHT.values().items() if value},
+    }
+
+
+async def close_async_client() -> None:
+    """Close the shared async client and release its pooled connections."""
+    global _async_client
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
+
+
+async def close_clients() -> None:
+    """Close the shared sync session and async client (app shutdown)."""
+    global _session
+    await close_async_client()
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
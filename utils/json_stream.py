@@ -0,0 +1,82 @@
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator, List, Sequence, Tuple
+
+# Refuse to buffer a single array element larger than this
+MAX_ITEM_CHARS = 1024 * 1024
+
+# Separators skipped between array elements
+_SEPARATORS = " \t\r\n,"
+
+
+class ArrayItemParser:
+    """
+    Push parser that yields the elements of selected top-level JSON arrays.
+
+    Given a document like {"departures": [{...}, ...], "arrivals": [...]},
+    feed() it text chunks as they arrive and it returns (key, element) pairs
+    as soon as each element is complete. Only one element is held in memory
+    at a time, never the whole body.
+    """
+
+    def __init__(self, keys: Sequence[str]):
+        names = "|".join(re.escape(key) for key in keys)
+        self._array_start = re.compile(r'"(%s)"\s*:\s*\[' % names)
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._key = None  # array currently being read, None while seeking
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        self._buffer += text
+        items: List[Tuple[str, Any]] = []
+        buffer = self._buffer
+        pos = 0
+        length = len(buffer)
+
+        while pos < length:
+            if self._key is None:
+                match = self._array_start.search(buffer, pos)
+                if match is None:
+                    # Keep a tail in case an array header is split across chunks
+                    pos = max(pos, length - 64)
+                    break
+                self._key = match.group(1)
+                pos = match.end()
+                continue
+
+            while pos < length and buffer[pos] in _SEPARATORS:
+                pos += 1
+            if pos >= length:
+                break
+            if buffer[pos] == "]":
+                self._key = None
+                pos += 1
+                continue
+            try:
+                item, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely an element cut off at the chunk boundary
+                if length - pos > MAX_ITEM_CHARS:
+                    raise ValueError("JSON array element exceeds the streaming size limit")
+                break
+            items.append((self._key, item))
+            pos = end
+
+        self._buffer = buffer[pos:]
+        return items
+
+    def close(self) -> None:
+        """Signal end of input; raises ValueError if it stopped mid-array."""
+        if self._key is not None:
+            raise ValueError(f"Truncated JSON: array '{self._key}' was not closed")
+
+
+def iter_array_items(chunks: Iterable[bytes], keys: Sequence[str], encoding: str = "utf-8") -> Iterator[Tuple[str, Any]]:
+    """Yield (key, element) pairs from a stream of raw byte chunks."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    parser = ArrayItemParser(keys)
+    for chunk in chunks:
+        yield from parser.feed(decoder.decode(chunk))
+    yield from parser.feed(decoder.decode(b"", final=True))
+    parser.close()
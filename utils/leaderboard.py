@@ -0,0 +1,485 @@
+"""
+Materialized "best places right now" leaderboard.
+
+Every time this process stores a fresh weather, safety or flight result,
+the city is queued. A background thread re-scores it from whatever is
+cached for its other two components, scoring whatever has queued up in
+one vectorized pass (utils/scoring.py), and moves it within sorted indexes:
+one for all destinations, one per country and one per region. The
+indexes are skip lists whose links carry their width, so inserting,
+removing or finding the entry at a given rank is O(log n), and a top-N
+query is O(log n + N). Requests never call an upstream or sort anything.
+
+Only cities with airports in airports.csv are ranked, and only once all
+three components are cached. An entry is as old as its oldest component,
+and entries older than LEADERBOARD_MAX_AGE are dropped. When the scoring model changes, every
+ranked city is queued again and re-scored from its cached components.
+
+Cache writes are only seen by the process that makes them, so with a
+shared cache backend (sqlite, redis) each worker also re-scans every
+airport city from the cache every LEADERBOARD_SCAN_INTERVAL and picks up
+what the other workers stored. With the per-process memory backend and
+several workers there is no single board to serve; see serves_all_workers.
+"""
+
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.airport_index import get_airport_index, normalize_city
+from utils.cache import CACHE_BACKEND, get_cache
+from utils.cache_backends import MISSING
+from utils.safety_api import safety_cache_key
+from utils.scoring import score_results
+from utils.scoring_model import ScoringModel, get_scoring_model, on_reload
+from utils.upstream import UPSTREAM_WORKERS
+
+LEADERBOARD_ENABLED = os.getenv("LEADERBOARD_ENABLED", "true").lower() in ("1", "true", "yes")
+# Seconds an entry stays ranked without any of its components being refreshed
+LEADERBOARD_MAX_AGE = float(os.getenv("LEADERBOARD_MAX_AGE", "86400"))
+LEADERBOARD_QUEUE_SIZE = int(os.getenv("LEADERBOARD_QUEUE_SIZE", "10000"))
+LEADERBOARD_SWEEP_INTERVAL = float(os.getenv("LEADERBOARD_SWEEP_INTERVAL", "60"))
+# Seconds between full scans of a shared cache backend
+LEADERBOARD_SCAN_INTERVAL = float(os.getenv("LEADERBOARD_SCAN_INTERVAL", "60"))
+# Most queued cities scored together in one vectorized pass
+LEADERBOARD_BATCH_SIZE = int(os.getenv("LEADERBOARD_BATCH_SIZE", "256"))
+
+LEADERBOARD_SOURCES = ("weather", "safety", "flights")
+
+REGIONS: Dict[str, Tuple[str, ...]] = {
+    "Africa": (
+        "Algeria", "Angola", "Benin", "Botswana", "Burkina Faso", "Burundi", "Cameroon", "Cape Verde",
+        "Central African Republic", "Chad", "Comoros", "Congo (Brazzaville)", "Congo (Kinshasa)",
+        "Cote d'Ivoire", "Djibouti", "Egypt", "Equatorial Guinea", "Eritrea", "Ethiopia", "Gabon", "Gambia",
+        "Ghana", "Guinea", "Guinea-Bissau", "Kenya", "Lesotho", "Liberia", "Libya", "Madagascar", "Malawi",
+        "Mali", "Mauritania", "Mauritius", "Mayotte", "Morocco", "Mozambique", "Namibia", "Niger", "Nigeria",
+        "Reunion", "Rwanda", "Saint Helena", "Sao Tome and Principe", "Senegal", "Seychelles", "Sierra Leone",
+        "Somalia", "South Africa", "South Sudan", "Sudan", "Swaziland", "Tanzania", "Togo", "Tunisia",
+        "Uganda", "Western Sahara", "Zambia", "Zimbabwe",
+    ),
+    "Asia": (
+        "Afghanistan", "Bangladesh", "Bhutan", "Brunei", "Burma", "Cambodia", "China", "East Timor",
+        "Hong Kong", "India", "Indonesia", "Japan", "Kazakhstan", "Kyrgyzstan", "Laos", "Macau", "Malaysia",
+        "Maldives", "Mongolia", "Myanmar", "Nepal", "North Korea", "Pakistan", "Philippines", "Singapore",
+        "South Korea", "Sri Lanka", "Taiwan", "Tajikistan", "Thailand", "Turkmenistan", "Uzbekistan", "Vietnam",
+    ),
+    "Caribbean": (
+        "Anguilla", "Antigua and Barbuda", "Aruba", "Bahamas", "Barbados", "British Virgin Islands",
+        "Cayman Islands", "Cuba", "Dominica", "Dominican Republic", "Grenada", "Guadeloupe", "Haiti", "Jamaica",
+        "Martinique", "Montserrat", "Netherlands Antilles", "Puerto Rico", "Saint Kitts and Nevis",
+        "Saint Lucia", "Saint Vincent and the Grenadines", "Trinidad and Tobago", "Turks and Caicos Islands",
+        "Virgin Islands",
+    ),
+    "Central America": (
+        "Belize", "Costa Rica", "El Salvador", "Guatemala", "Honduras", "Mexico", "Nicaragua", "Panama",
+    ),
+    "Europe": (
+        "Albania", "Austria", "Belarus", "Belgium", "Bosnia and Herzegovina", "Bulgaria", "Croatia", "Cyprus",
+        "Czech Republic", "Denmark", "Estonia", "Faroe Islands", "Finland", "France", "Germany", "Gibraltar",
+        "Greece", "Guernsey", "Hungary", "Iceland", "Ireland", "Isle of Man", "Italy", "Jersey", "Latvia",
+        "Lithuania", "Luxembourg", "Macedonia", "Malta", "Moldova", "Montenegro", "Netherlands", "Norway",
+        "Poland", "Portugal", "Romania", "Russia", "Serbia", "Slovakia", "Slovenia", "Spain", "Sweden",
+        "Switzerland", "Ukraine", "United Kingdom",
+    ),
+    "Middle East": (
+        "Armenia", "Azerbaijan", "Bahrain", "Georgia", "Iran", "Iraq", "Israel", "Jordan", "Kuwait", "Lebanon",
+        "Oman", "Palestine", "Qatar", "Saudi Arabia", "Syria", "Turkey", "United Arab Emirates", "Yemen",
+    ),
+    "North America": (
+        "Bermuda", "Canada", "Greenland", "Saint Pierre and Miquelon", "United States",
+    ),
+    "Oceania": (
+        "American Samoa", "Australia", "Christmas Island", "Cocos (Keeling) Islands", "Cook Islands", "Fiji",
+        "French Polynesia", "Guam", "Johnston Atoll", "Kiribati", "Marshall Islands", "Micronesia",
+        "Midway Islands", "Nauru", "New Caledonia", "New Zealand", "Niue", "Norfolk Island",
+        "Northern Mariana Islands", "Palau", "Papua New Guinea", "Samoa", "Solomon Islands", "Tonga", "Tuvalu",
+        "Vanuatu", "Wake Island", "Wallis and Futuna",
+    ),
+    "South America": (
+        "Argentina", "Bolivia", "Brazil", "Chile", "Colombia", "Ecuador", "Falkland Islands", "French Guiana",
+        "Guyana", "Paraguay", "Peru", "Suriname", "Uruguay", "Venezuela",
+    ),
+}
+
+_REGION_OF = {country: region for region, countries in REGIONS.items() for country in countries}
+
+def region_for(country: str) -> str:
+    """Region a country is ranked under ("Other" if it isn't listed)."""
+    return _REGION_OF.get(country, "Other")
+
+
+class _Node:
+    __slots__ = ("key", "value", "next", "width")
+
+    def __init__(self, key: Any, value: Any, level: int):
+        self.key = key
+        self.value = value
+        self.next: List[Optional["_Node"]] = [None] * level
+        # Positions each link skips over, so ranks can be found while descending
+        self.width: List[int] = [1] * level
+
+
+class SkipList:
+    """
+    Sorted (key, value) collection with O(log n) insert, remove and
+    lookup by rank (an indexable skip list). Keys must be unique.
+    """
+
+    MAX_LEVEL = 16
+
+    def __init__(self, seed: Optional[int] = None):
+        self._head = _Node(None, None, self.MAX_LEVEL)
+        self._size = 0
+        self._random = random.Random(seed)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _random_level(self) -> int:
+        level = 1
+        # p = 1/4: shorter towers than p = 1/2 for the same O(log n) bound
+        while level < self.MAX_LEVEL and self._random.random() < 0.25:
+            level += 1
+        return level
+
+    def _predecessors(self, key: Any) -> Tuple[List[_Node], List[int]]:
+        """Last node before key on each level, and the rank of each."""
+        update: List[_Node] = [self._head] * self.MAX_LEVEL
+        ranks = [0] * self.MAX_LEVEL
+        node, rank = self._head, 0
+        for level in reversed(range(self.MAX_LEVEL)):
+            nxt = node.next[level]
+            while nxt is not None and nxt.key < key:
+                rank += node.width[level]
+                node, nxt = nxt, nxt.next[level]
+            update[level] = node
+            ranks[level] = rank
+        return update, ranks
+
+    def insert(self, key: Any, value: Any) -> None:
+        update, ranks = self._predecessors(key)
+        level = self._random_level()
+        node = _Node(key, value, level)
+        for i in range(self.MAX_LEVEL):
+            prev = update[i]
+            if i < level:
+                # prev's link is split at the new node's position
+                skipped = ranks[0] - ranks[i]
+                node.next[i] = prev.next[i]
+                node.width[i] = prev.width[i] - skipped
+                prev.next[i] = node
+                prev.width[i] = skipped + 1
+            else:
+                prev.width[i] += 1
+        self._size += 1
+
+    def remove(self, key: Any) -> Any:
+        """Remove key and return its value; KeyError if it isn't present."""
+        update, _ = self._predecessors(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for i in range(self.MAX_LEVEL):
+            prev = update[i]
+            if prev.next[i] is node:
+                prev.width[i] += node.width[i] - 1
+                prev.next[i] = node.next[i]
+            else:
+                prev.width[i] -= 1
+        self._size -= 1
+        return node.value
+
+    def rank(self, key: Any) -> int:
+        """Number of keys that sort before key."""
+        return self._predecessors(key)[1][0]
+
+    def iter_from(self, index: int) -> Iterator[Tuple[Any, Any]]:
+        """(key, value) pairs in order, starting at rank index."""
+        node, remaining = self._head, max(0, index)
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        # node is now the one just before rank index (or the head)
+        node = node.next[0]
+        while node is not None:
+            yield node.key, node.value
+            node = node.next[0]
+
+
+def serves_all_workers() -> bool:
+    """Whether every worker process can build the same board (one worker, or a shared cache)."""
+    return UPSTREAM_WORKERS == 1 or CACHE_BACKEND != "memory"
+
+
+class Leaderboard:
+    """
+    Destinations ranked by composite score, overall and per country and
+    region, kept current from cache writes by a background thread.
+    """
+
+    def __init__(self, max_age: float = LEADERBOARD_MAX_AGE, maxsize: int = LEADERBOARD_QUEUE_SIZE,
+                 sweep_interval: float = LEADERBOARD_SWEEP_INTERVAL, scan_interval: Optional[float] = None,
+                 batch_size: int = LEADERBOARD_BATCH_SIZE):
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        # Scanning only finds anything the listeners missed if the cache is shared
+        if scan_interval is None:
+            scan_interval = LEADERBOARD_SCAN_INTERVAL if CACHE_BACKEND != "memory" else 0.0
+        self.scan_interval = scan_interval
+        self.batch_size = max(1, batch_size)
+        self._boards: Dict[Tuple[str, str], SkipList] = {("all", ""): SkipList()}
+        self._entries: Dict[str, Tuple[Tuple[int, str], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue(maxsize)
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self.updates = 0
+        self.dropped = 0
+
+    def attach(self, sources: Tuple[str, ...] = LEADERBOARD_SOURCES) -> None:
+        """Re-score a city whenever one of its components is stored in this process's caches."""
+        for source in sources:
+            get_cache(source).subscribe(self._observe)
+        on_reload(self._rescore_all)
+        if self.scan_interval:
+            # Rank what other workers have cached without waiting for a local write
+            self._ensure_thread()
+
+    def _rescore_all(self, model: ScoringModel) -> None:
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys:
+            self.notify(key)
+
+    def _observe(self, key: str, value: Any) -> None:
+        if isinstance(value, dict) and value.get("status") == "success":
+            self.notify(key.split("|", 1)[0])
+
+    def notify(self, city: str) -> None:
+        """Queue a city to be re-scored from the cache."""
+        key = normalize_city(city)
+        with self._pending_lock:
+            # A city already waiting will read the newest cached values anyway
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(key)
+        except queue.Full:
+            with self._pending_lock:
+                self._pending.discard(key)
+                self.dropped += 1
+
+    def _ensure_thread(self) -> None:
+        # Started lazily so each worker process gets its own updater after fork()
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="leaderboard-updater", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        next_sweep = time.monotonic() + self.sweep_interval
+        next_scan = time.monotonic() if self.scan_interval else float("inf")
+        while True:
+            try:
+                key = self._queue.get(timeout=max(0.0, min(next_sweep, next_scan) - time.monotonic()))
+            except queue.Empty:
+                key = MISSING
+            if key is None:
+                return
+            if key is not MISSING:
+                # Score everything else already waiting along with it
+                keys, stop = [key], False
+                while len(keys) < self.batch_size:
+                    try:
+                        key = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if key is None:
+                        stop = True
+                        break
+                    keys.append(key)
+                with self._pending_lock:
+                    self._pending.difference_update(keys)
+                try:
+                    self.refresh_many(keys)
+                except Exception as e:
+                    print(f"[ERROR] Failed to update leaderboard for {', '.join(keys)}: {e}")
+                if stop:
+                    return
+            if time.monotonic() >= next_scan:
+                self.scan()
+                next_scan = time.monotonic() + self.scan_interval
+            if time.monotonic() >= next_sweep:
+                # Picks up a changed scoring config even when no requests arrive
+                get_scoring_model()
+                self.sweep()
+                next_sweep = time.monotonic() + self.sweep_interval
+
+    def scan(self) -> int:
+        """Re-score every airport city from the cache; returns how many are ranked."""
+        cities = list(get_airport_index().city_to_metro)
+        for i in range(0, len(cities), self.batch_size):
+            try:
+                self.refresh_many(cities[i:i + self.batch_size])
+            except Exception as e:
+                print(f"[ERROR] Failed to update leaderboard scan batch: {e}")
+        with self._lock:
+            return len(self._entries)
+
+    def refresh(self, city: str) -> None:
+        """Re-score one city from the cached weather, safety and flight results."""
+        self.refresh_many([city])
+
+    def refresh_many(self, cities: List[str]) -> int:
+        """
+        Re-score cities from their cached weather, safety and flight
+        results, all in one vectorized pass. Cities without airports or
+        without all three components cached are skipped, and those with a
+        component older than max_age are unranked; returns how many were
+        ranked.
+        """
+        index = get_airport_index()
+        cutoff = time.time() - self.max_age
+        rows = []
+        for city in cities:
+            airports = index.metro_airports(city)
+            if not airports:
+                continue
+            components, stored_at = [], []
+            for read in (lambda: get_cache("weather").get_stale_entry(city),
+                         lambda: get_cache("safety").get_stale_entry(safety_cache_key(city)),
+                         lambda: get_cache("flights").get_stale_entry(city)):
+                # Stop at the first missing component; most cities scanned have none cached
+                at, component = read()
+                if not isinstance(component, dict) or component.get("status") != "success":
+                    break
+                components.append(component)
+                stored_at.append(at)
+            else:
+                if min(stored_at) < cutoff:
+                    # Still in the cache's stale grace, but too old to rank
+                    self.remove(normalize_city(city))
+                else:
+                    rows.append((city, airports, components, min(stored_at)))
+        if not rows:
+            return 0
+
+        model = get_scoring_model()
+        scores = score_results(*zip(*(components for _, _, components, _ in rows)), model)
+        for i, (city, airports, _, updated_at) in enumerate(rows):
+            airport = index.by_iata[airports[0]]
+            self.update(normalize_city(city), {
+                "destination": airport.city,
+                "country": airport.country,
+                "region": region_for(airport.country),
+                "composite_score": int(scores["composite"][i]),
+                "weather_score": int(scores["weather"][i]),
+                "safety_score": int(scores["safety"][i]),
+                "availability_score": int(scores["availability"][i]),
+                "airports": list(airports),
+                "scoring_version": model.version,
+                # As old as its oldest component
+                "updated_at": round(updated_at, 3),
+            })
+        return len(rows)
+
+    def _boards_for(self, entry: Dict[str, Any]) -> List[Tuple[str, str]]:
+        return [("all", ""), ("country", entry["country"].casefold()), ("region", entry["region"].casefold())]
+
+    def update(self, key: str, entry: Dict[str, Any]) -> None:
+        # Highest score first; ties in name order
+        sort_key = (-entry["composite_score"], key)
+        with self._lock:
+            self._remove_locked(key)
+            for board in self._boards_for(entry):
+                self._boards.setdefault(board, SkipList()).insert(sort_key, entry)
+            self._entries[key] = (sort_key, entry)
+            self.updates += 1
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key: str) -> None:
+        current = self._entries.pop(key, None)
+        if current is None:
+            return
+        sort_key, entry = current
+        for board in self._boards_for(entry):
+            self._boards[board].remove(sort_key)
+            if not self._boards[board] and board[0] != "all":
+                del self._boards[board]
+
+    def sweep(self) -> int:
+        """Drop entries with a component that wasn't refreshed within max_age."""
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            expired = [key for key, (_, entry) in self._entries.items() if entry["updated_at"] < cutoff]
+            for key in expired:
+                self._remove_locked(key)
+        return len(expired)
+
+    def top(self, limit: int = 10, offset: int = 0, country: Optional[str] = None,
+            region: Optional[str] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        The best-scoring destinations, optionally within one country or region.
+
+        Args:
+            limit: Maximum entries to return
+            offset: Entries to skip (for paging)
+            country: Country name as in airports.csv (case-insensitive)
+            region: One of REGIONS, or "Other" (case-insensitive)
+
+        Returns:
+            (entries on that board, the requested entries with their rank)
+        """
+        if country:
+            board = ("country", " ".join(country.split()).casefold())
+        elif region:
+            board = ("region", " ".join(region.split()).casefold())
+        else:
+            board = ("all", "")
+        with self._lock:
+            skiplist = self._boards.get(board)
+            if skiplist is None:
+                return 0, []
+            rows = []
+            for _, entry in skiplist.iter_from(offset):
+                if len(rows) >= limit:
+                    break
+                rows.append({"rank": offset + len(rows) + 1, **entry})
+            return len(skiplist), rows
+
+    def rank(self, city: str) -> Optional[int]:
+        """Overall rank of a city (1 = best), or None if it isn't ranked."""
+        with self._lock:
+            current = self._entries.get(normalize_city(city))
+            if current is None:
+                return None
+            return self._boards[("all", "")].rank(current[0]) + 1
+
+    def close(self, timeout: float = 5) -> None:
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "updates": self.updates,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+        }
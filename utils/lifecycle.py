@@ -0,0 +1,117 @@
+"""
+Process lifecycle for readiness checks and graceful shutdown.
+
+A load balancer should stop routing to a process before it closes its
+listening socket. With SHUTDOWN_DRAIN_SECONDS set, SIGTERM first marks the
+process as draining, which makes /ready answer 503, and keeps serving for
+that long. After the delay the server's own graceful shutdown runs: it
+stops accepting connections, waits for in-flight requests, then runs the
+app's shutdown hooks. Under gunicorn, keep the delay plus the longest
+request below GRACEFUL_TIMEOUT.
+"""
+
+import asyncio
+import os
+import signal
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from anyio.to_thread import current_default_thread_limiter
+
+# Seconds between SIGTERM and the start of shutdown (0 = shut down at once)
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "0"))
+# Threads available to sync endpoints (0 keeps the anyio default of 40)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "0"))
+
+
+class Lifecycle:
+    """Startup and draining state of this worker process."""
+
+    def __init__(self):
+        self.started_at: Optional[float] = None
+        self.draining_since: Optional[float] = None
+
+    @property
+    def started(self) -> bool:
+        return self.started_at is not None
+
+    @property
+    def draining(self) -> bool:
+        return self.draining_since is not None
+
+    def mark_started(self) -> None:
+        self.started_at = time.time()
+
+    def begin_shutdown(self) -> None:
+        if self.draining_since is None:
+            self.draining_since = time.time()
+
+    def install_drain_handler(self, delay: float = SHUTDOWN_DRAIN_SECONDS) -> bool:
+        """
+        Delay shutdown on SIGTERM by `delay` seconds, reporting not ready meanwhile.
+
+        Must be called on the running event loop after the server installed
+        its own signal handlers. A second SIGTERM shuts down without waiting.
+
+        Returns:
+            True if the handler was installed
+        """
+        if delay <= 0 or threading.current_thread() is not threading.main_thread():
+            return False
+        loop = asyncio.get_running_loop()
+
+        def handoff() -> None:
+            # The server's SIGINT handler is its normal graceful shutdown
+            os.kill(os.getpid(), signal.SIGINT)
+
+        def on_sigterm() -> None:
+            if self.draining:
+                handoff()
+                return
+            self.begin_shutdown()
+            print(f"[INFO] SIGTERM received, draining for {delay:g}s before shutting down")
+            loop.call_later(delay, handoff)
+
+        try:
+            loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+        except (NotImplementedError, RuntimeError, ValueError):
+            return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "pid": os.getpid(),
+            "started": self.started,
+            "uptime_seconds": round(now - self.started_at, 1) if self.started_at else 0.0,
+            "draining": self.draining,
+            "draining_seconds": round(now - self.draining_since, 1) if self.draining_since else None,
+        }
+
+
+lifecycle = Lifecycle()
+
+
+def configure_threadpool(size: int = THREADPOOL_SIZE) -> int:
+    """
+    Size the threadpool sync endpoints run in. Call on the event loop.
+
+    Returns:
+        The pool size in effect
+    """
+    limiter = current_default_thread_limiter()
+    if size > 0:
+        limiter.total_tokens = size
+    return int(limiter.total_tokens)
+
+
+def threadpool_stats() -> Dict[str, Any]:
+    """Size and occupancy of the sync endpoint threadpool. Call on the event loop."""
+    limiter = current_default_thread_limiter()
+    statistics = limiter.statistics()
+    return {
+        "size": int(limiter.total_tokens),
+        "busy": statistics.borrowed_tokens,
+        "waiting": statistics.tasks_waiting,
+    }
@@ -0,0 +1,263 @@
+"""
+In-process request and upstream metrics, served in the Prometheus text format.
+
+Counters, gauges and histograms are plain objects guarded by a lock, so
+recording a sample costs a dict lookup and a few additions. Values that
+already live elsewhere (cache counters, rate budgets, prewarm queue) are
+read by collector callbacks only when /metrics is scraped.
+
+A per-request timing breakdown is kept in a context variable: code on the
+request path calls record_timing(), and MetricsMiddleware reports the
+result in a Server-Timing header when SERVER_TIMING_ENABLED is set.
+"""
+
+import bisect
+import contextvars
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self._header()
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        """Current value per label tuple."""
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = self._header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Sample]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collect(self, name: str, kind: str, help: str, samples: Callable[[], Iterable[Sample]]) -> None:
+        """Register a metric whose samples are computed at scrape time."""
+        self._collectors.append((name, kind, help, samples))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, kind, help, samples in self._collectors:
+            try:
+                values = list(samples())
+            except Exception as e:
+                print(f"[ERROR] Metrics collector {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to serve API requests", ("endpoint", "method", "status"))
+RESPONSE_BYTES = REGISTRY.histogram(
+    "http_response_size_bytes", "Size of API response bodies", ("endpoint",), SIZE_BUCKETS)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "API requests currently being served", ("endpoint",))
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Time for upstream API calls, including retries", ("provider", "status"))
+UPSTREAM_BYTES = REGISTRY.histogram(
+    "upstream_response_size_bytes", "Size of upstream response bodies", ("provider",), SIZE_BUCKETS)
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    "upstream_requests_in_flight", "Upstream API calls currently in progress", ("provider",))
+UPSTREAM_BUDGET_WAIT_SECONDS = REGISTRY.histogram(
+    "upstream_budget_wait_seconds", "Time spent waiting for an upstream rate-limit token", ("provider",))
+RECOMMEND_PHASE_SECONDS = REGISTRY.histogram(
+    "recommend_phase_duration_seconds", "Time spent in each phase of building a recommendation", ("phase",))
+
+# Timing breakdown of the current request, or None when nobody is collecting it
+_timings: contextvars.ContextVar = contextvars.ContextVar("request_timings", default=None)
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """Add to the current request's Server-Timing breakdown (a no-op outside one)."""
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def observe_upstream(provider: str, status: str, seconds: float, size: Optional[int] = None) -> None:
+    UPSTREAM_SECONDS.observe(seconds, provider, status)
+    if size is not None:
+        UPSTREAM_BYTES.observe(size, provider)
+    record_timing(provider, seconds)
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status, response size and in-flight
+    requests per endpoint. Written against raw ASGI rather than
+    BaseHTTPMiddleware so it adds no extra task or body buffering per request.
+    """
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING_ENABLED):
+        self.app = app
+        self.server_timing = server_timing
+        self._paths: Optional[frozenset] = None
+
+    def _endpoint(self, scope) -> str:
+        if self._paths is None:
+            self._paths = frozenset(getattr(route, "path", None) for route in scope["app"].routes)
+        # Unknown paths share one label so scanners can't blow up cardinality
+        return scope["path"] if scope["path"] in self._paths else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        start = time.perf_counter()
+        status = 500
+        size = 0
+        timings: Optional[Dict[str, float]] = {} if self.server_timing else None
+        token = _timings.set(timings) if timings is not None else None
+
+        async def send_with_metrics(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings is not None:
+                    header = server_timing_header(timings, time.perf_counter() - start)
+                    message = {**message, "headers": list(message.get("headers", [])) +
+                               [(b"server-timing", header.encode("latin-1"))]}
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(endpoint)
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(endpoint)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, scope["method"], str(status))
+            RESPONSE_BYTES.observe(size, endpoint)
+            if token is not None:
+                _timings.reset(token)
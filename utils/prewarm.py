@@ -0,0 +1,258 @@
+"""
+Refresh-ahead scheduler for popular destinations.
+
+Endpoints record which cities are requested; a background task inside the
+app periodically takes the top-K cities per source and re-fetches their
+cache entries shortly before they expire, within a per-upstream rate
+budget, so hot cities never pay upstream latency on the request path.
+
+With several worker processes sharing a cache backend (sqlite, redis) only
+one of them, the holder of a lock file, plans and runs refreshes (from the
+requests it sees itself); if it exits, another worker takes over at its
+next planning pass. With the per-process memory backend every worker
+prewarms its own cache, within its share of the upstream budget.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.cache import CACHE_BACKEND, cache_key, get_cache
+from utils.rate_limit import TokenBucket
+from utils.upstream import BACKGROUND, UPSTREAM_WORKERS, upstream_priority
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() in ("1", "true", "yes")
+PREWARM_TOP_K = int(os.getenv("PREWARM_TOP_K", "20"))
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", "30"))
+# Refresh once less than this fraction of an entry's TTL is left
+PREWARM_REFRESH_AHEAD = float(os.getenv("PREWARM_REFRESH_AHEAD", "0.2"))
+PREWARM_WORKERS = int(os.getenv("PREWARM_WORKERS", "2"))
+# Held by the one worker process that prewarms when there are several
+PREWARM_LOCK_PATH = os.getenv("PREWARM_LOCK_PATH", os.path.join(tempfile.gettempdir(), "travel-prewarm.lock"))
+# Request counts decay with this half-life (seconds) so popularity tracks recent traffic
+PREWARM_HALF_LIFE = float(os.getenv("PREWARM_HALF_LIFE", "3600"))
+# Background refreshes allowed per upstream per minute
+PREWARM_BUDGETS = {
+    "weather": float(os.getenv("PREWARM_WEATHER_PER_MINUTE", "30")),
+    "flights": float(os.getenv("PREWARM_FLIGHTS_PER_MINUTE", "10")),
+    "safety": float(os.getenv("PREWARM_SAFETY_PER_MINUTE", "10")),
+}
+
+Refresher = Callable[[str], Awaitable[Any]]
+
+
+class RequestTracker:
+    """Exponentially decayed request counts per (source, city)."""
+
+    def __init__(self, half_life: float = PREWARM_HALF_LIFE, max_tracked: int = 10000):
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._counts: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self._names: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _decayed(self, count: float, updated: float, now: float) -> float:
+        return count * 0.5 ** ((now - updated) / self.half_life)
+
+    def record(self, city: str, sources: Iterable[str]) -> None:
+        key = cache_key(city)
+        now = time.time()
+        with self._lock:
+            self._names[key] = city
+            for source in sources:
+                count, updated = self._counts.get((source, key), (0.0, now))
+                self._counts[(source, key)] = (self._decayed(count, updated, now) + 1, now)
+            if len(self._counts) > 2 * self.max_tracked:
+                self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        keep = heapq.nlargest(
+            self.max_tracked, self._counts.items(), key=lambda item: self._decayed(*item[1], now)
+        )
+        self._counts = dict(keep)
+        live = {key for _, key in self._counts}
+        self._names = {key: name for key, name in self._names.items() if key in live}
+
+    def top(self, source: str, k: int) -> List[Tuple[str, str]]:
+        """The k most requested (cache key, city name) pairs for a source."""
+        now = time.time()
+        with self._lock:
+            ranked = heapq.nlargest(
+                k,
+                ((self._decayed(count, updated, now), key)
+                 for (src, key), (count, updated) in self._counts.items() if src == source),
+            )
+            return [(key, self._names[key]) for _, key in ranked]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+request_tracker = RequestTracker()
+
+
+class Prewarmer:
+    """
+    Background refresh-ahead of the top-K cities for each cache source.
+
+    A planner wakes every `interval` seconds and queues a refresh for each
+    popular entry that is missing or inside its refresh-ahead window;
+    workers drain the queue in due-time order, each refresh first taking a
+    token from that upstream's budget.
+    """
+
+    def __init__(self, refreshers: Dict[str, Refresher], tracker: RequestTracker = request_tracker,
+                 top_k: int = PREWARM_TOP_K, interval: float = PREWARM_INTERVAL,
+                 refresh_ahead: float = PREWARM_REFRESH_AHEAD, workers: int = PREWARM_WORKERS,
+                 budgets: Optional[Dict[str, float]] = None, lock_path: str = PREWARM_LOCK_PATH):
+        self.refreshers = refreshers
+        self.tracker = tracker
+        self.top_k = top_k
+        self.interval = interval
+        self.refresh_ahead = refresh_ahead
+        self.workers = workers
+        self.lock_path = lock_path
+        self._lock_fd: Optional[int] = None
+        budgets = PREWARM_BUDGETS if budgets is None else budgets
+        self.buckets = {
+            source: TokenBucket(per_minute / 60, max(1.0, per_minute / 6))
+            for source, per_minute in budgets.items()
+        }
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._pending = set()
+        # Due time of each refresh still in the queue, for the lag gauge
+        self._queued_due: Dict[Tuple[str, str], float] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self.completed = 0
+        self.failed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_plan_at: Optional[float] = None
+
+    def plan(self) -> int:
+        """Queue refreshes for popular entries that are due; returns how many were added."""
+        now = time.time()
+        queued = 0
+        for source in self.refreshers:
+            cache = get_cache(source)
+            window = cache.ttl * self.refresh_ahead
+            # Clients with their own key_func (e.g. per-day safety) expose it on .refresh
+            key_for = getattr(self.refreshers[source], "cache_key", cache_key)
+            for key, city in self.tracker.top(source, self.top_k):
+                if (source, key) in self._pending:
+                    continue
+                remaining = cache.ttl_remaining(key_for(city))
+                if remaining is not None and remaining > window:
+                    continue
+                # Due when the entry entered its refresh window (or now, if missing)
+                due = now if remaining is None else now - (window - remaining)
+                self._pending.add((source, key))
+                self._queued_due[(source, key)] = due
+                self._queue.put_nowait((due, next(self._sequence), source, key, city))
+                queued += 1
+        self.last_plan_at = now
+        return queued
+
+    def owns_prewarming(self) -> bool:
+        """Whether this process does the prewarming, taking the lock file if it is free."""
+        if self._lock_fd is not None or not self._exclusive():
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        print(f"[INFO] Worker {os.getpid()} took over prewarming")
+        return True
+
+    @staticmethod
+    def _exclusive() -> bool:
+        # One prewarmer is enough only if the others read what it writes
+        return UPSTREAM_WORKERS > 1 and CACHE_BACKEND != "memory" and fcntl is not None
+
+    async def _planner(self) -> None:
+        while True:
+            try:
+                if self.owns_prewarming():
+                    self.plan()
+            except Exception as e:
+                print(f"[ERROR] Prewarm planning failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _worker(self) -> None:
+        # Refreshes yield to interactive requests for the upstream budget
+        upstream_priority.set(BACKGROUND)
+        while True:
+            due, _, source, key, city = await self._queue.get()
+            self._queued_due.pop((source, key), None)
+            try:
+                bucket = self.buckets.get(source)
+                if bucket is not None:
+                    await bucket.acquire()
+                lag = max(0.0, time.time() - due)
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                result = await self.refreshers[source](city)
+                if isinstance(result, dict) and result.get("status") == "error":
+                    self.failed += 1
+                else:
+                    self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"[ERROR] Prewarm refresh of {source} for '{city}' failed: {e}")
+            finally:
+                self._pending.discard((source, key))
+                self._queue.task_done()
+
+    def start(self) -> None:
+        """Start the planner and workers on the running event loop."""
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.ensure_future(self._planner())]
+        self._tasks += [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        print(f"[INFO] Prewarmer started (top {self.top_k} cities, every {self.interval:g}s)")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queued_due.clear()
+        if self._lock_fd is not None:
+            # Closing releases the lock for another worker
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        oldest_due = min(self._queued_due.values(), default=None)
+        return {
+            "running": bool(self._tasks),
+            "owner": self._lock_fd is not None or not self._exclusive(),
+            "tracked_cities": len(self.tracker),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            # How far behind schedule the most overdue queued refresh is
+            "queue_lag_seconds": round(max(0.0, now - oldest_due), 3) if oldest_due is not None else 0.0,
+            "last_lag_seconds": round(self.last_lag, 3),
+            "max_lag_seconds": round(self.max_lag, 3),
+            "completed": self.completed,
+            "failed": self.failed,
+            "last_plan_at": self.last_plan_at,
+            "budgets": {source: bucket.stats() for source, bucket in self.buckets.items()},
+        }
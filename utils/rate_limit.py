@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+from typing import Any, Dict
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most `capacity`.
+
+    Works from both threads and the event loop; waiting is done by the
+    caller (acquire for asyncio, acquire_blocking for threads).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0, reserve: float = 0.0) -> float:
+        """
+        Take tokens if at least `reserve` would remain afterwards.
+
+        Returns:
+            0 on success, otherwise the seconds until enough tokens accrue
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens - tokens >= reserve:
+                self._tokens -= tokens
+                return 0.0
+            if self.rate <= 0:
+                return float("inf")
+            return (tokens + reserve - self._tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Take every token and hold off refilling for seconds (e.g. a 429's Retry-After)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            # A negative balance makes try_acquire report the pause as its wait
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    async def acquire(self, tokens: float = 1.0, reserve: float = 0.0) -> None:
+        """Wait on the event loop until tokens are available, then take them."""
+        while True:
+            wait = self.try_acquire(tokens, reserve)
+            if wait == 0:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def acquire_blocking(self, tokens: float = 1.0, reserve: float = 0.0) -> None:
+        """Block the calling thread until tokens are available, then take them."""
+        while True:
+            wait = self.try_acquire(tokens, reserve)
+            if wait == 0:
+                return
+            time.sleep(min(wait, 1.0))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "rate_per_second": self.rate,
+                "capacity": self.capacity,
+                "available": round(self._tokens, 2),
+            }
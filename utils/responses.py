@@ -0,0 +1,178 @@
+"""
+Pre-encoded JSON responses with ETags and cached compression.
+
+A finished recommendation is encoded to bytes once, along with its ETag
+and, on first request, its gzip/brotli variants. Repeat requests for the
+same cached result skip model validation, JSON encoding and compression,
+and clients that send If-None-Match get an empty 304.
+
+orjson and brotli are optional: without them the standard json module
+and gzip are used.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional encoding
+    brotli = None
+
+# "auto" uses orjson when it is installed
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto").lower()
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "512"))
+ENCODED_CACHE_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+_use_orjson = orjson is not None and JSON_ENCODER in ("auto", "orjson")
+
+# Levels for bodies compressed once per response (streams, uncached results);
+# cached bodies are compressed once and reused, so they get the best ratio
+FAST_BROTLI_QUALITY = 5
+FAST_GZIP_LEVEL = 6
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON bytes, as FastAPI's JSONResponse would render them."""
+    if _use_orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def accepted_encoding(request: Request) -> Optional[str]:
+    """Best content encoding the client accepts: br, then gzip, else None."""
+    accept = request.headers.get("accept-encoding", "")
+    offered = {part.split(";")[0].strip().lower() for part in accept.split(",")
+               if not part.strip().endswith(("q=0", "q=0.0"))}
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+
+class EncodedBody:
+    """
+    JSON bytes plus their ETag and lazily built compressed variants.
+
+    Pass reused=False for a body served only once, which is compressed at
+    the faster levels streams use rather than the best ratio.
+    """
+
+    __slots__ = ("body", "etag", "reused", "_compressed")
+
+    def __init__(self, body: bytes, reused: bool = True):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.reused = reused
+        self._compressed: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        data = self._compressed.get(encoding)
+        if data is None:
+            # Built once per cached result, so spend the CPU on the best ratio
+            if encoding == "br":
+                data = brotli.compress(self.body, quality=11 if self.reused else FAST_BROTLI_QUALITY)
+            else:
+                data = gzip.compress(self.body, compresslevel=9 if self.reused else FAST_GZIP_LEVEL, mtime=0)
+            self._compressed[encoding] = data
+        return data
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        # Each representation gets its own strong validator
+        return f'{self.etag[:-1]}-{encoding}"' if encoding else self.etag
+
+
+class EncodedCache:
+    """
+    Encoded form of cached values, reused while the cache keeps returning
+    the same object for a key. Shared backends (SQLite, Redis) decode a new
+    object on every hit; those are simply re-encoded.
+    """
+
+    def __init__(self, maxsize: int = ENCODED_CACHE_ENTRIES):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[Any, EncodedBody]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, value: Any) -> EncodedBody:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is value:
+                self._entries.move_to_end(key)
+                return entry[1]
+        encoded = EncodedBody(dumps(value))
+        with self._lock:
+            self._entries[key] = (value, encoded)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return encoded
+
+
+def _etag_matches(request: Request, payload: EncodedBody) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match; any encoding
+    # of the same body is still current
+    current = {payload.etag_for(encoding) for encoding in (None, "gzip", "br")}
+    return any(tag.strip().removeprefix("W/") in current for tag in header.split(","))
+
+
+def encoded_response(request: Request, payload: EncodedBody, status_code: int = 200) -> Response:
+    """
+    Serve a pre-encoded body: 304 when the client already has it, otherwise
+    the body compressed as the client allows.
+    """
+    encoding = accepted_encoding(request) if len(payload.body) >= COMPRESS_MIN_BYTES else None
+    headers = {
+        "ETag": payload.etag_for(encoding),
+        "Vary": "Accept-Encoding",
+        # Clients may keep it but must revalidate, which is a cheap 304
+        "Cache-Control": "no-cache",
+    }
+    if _etag_matches(request, payload):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(payload.encoded(encoding), status_code=status_code, headers=headers, media_type="application/json")
+
+
+async def compress_stream(chunks: AsyncGenerator[bytes, None], encoding: Optional[str]) -> AsyncIterator[bytes]:
+    """Compress a streamed body chunk by chunk, flushing so each chunk reaches the client promptly."""
+    try:
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=FAST_BROTLI_QUALITY)
+            async for chunk in chunks:
+                yield compressor.process(chunk) + compressor.flush()
+            yield compressor.finish()
+        elif encoding == "gzip":
+            compressor = zlib.compressobj(FAST_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            async for chunk in chunks:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield compressor.flush()
+        else:
+            async for chunk in chunks:
+                yield chunk
+    finally:
+        # Run the source's cleanup now if the client disconnects mid-stream
+        await chunks.aclose()
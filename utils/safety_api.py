@@ -1,41 +1,187 @@
 import os
 import requests
-import math
-from typing import Dict, Any
+import httpx
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Tuple
 from datetime import datetime, timedelta
+from utils.airport_index import normalize_city
+from utils.cache import cache_key, cached
+from utils.history import recorded
+from utils.scoring_model import ScoringModel, get_scoring_model, rescore
+from utils import http_client
+from utils.upstream_archive import upstream_key
+from utils.upstream import BudgetExhausted, budget_exhausted_result
 
+NEWS_API_URL = os.getenv("NEWS_API_URL", "https://newsapi.org/v2/everything")
+NEWS_API_TIMEOUT = float(os.getenv("NEWS_API_TIMEOUT", "10"))
+# Headlines fetched per query and kept per city for "recent_articles"; 0
+# scores from NewsAPI's totalResults alone and fetches a single article
+SAFETY_HEADLINES = int(os.getenv("SAFETY_HEADLINES", "0"))
+SAFETY_HEADLINE_CITIES = int(os.getenv("SAFETY_HEADLINE_CITIES", "1024"))
+
+
+def _safety_params(city: str, api_key: str) -> Dict[str, Any]:
+    today = datetime.utcnow().date()
+    first_day = today - timedelta(days=1)
+    return {
+        "q": f"{city} crime OR theft OR violence",
+        "language": "en",
+        # The score only needs totalResults, not the articles themselves
+        "pageSize": max(1, SAFETY_HEADLINES),
+        "apiKey": api_key,
+        "from": first_day.isoformat(),
+        "to": today.isoformat(),
+        "page": 1
+    }
+
+
+def safety_cache_key(city: str) -> str:
+    # The query covers yesterday and today, so it only changes when the UTC day does
+    return cache_key(city, datetime.utcnow().date().isoformat())
+
+
+class HeadlineBuffer:
+    """
+    Most recent headlines per city, in fixed-size rings.
+
+    Headlines accumulate across refreshes (deduplicated by URL) and are kept
+    as tuples; the least recently updated cities are evicted past max_cities.
+    """
+
+    FIELDS = ("title", "source", "url", "published_at")
+
+    def __init__(self, size: int = SAFETY_HEADLINES, max_cities: int = SAFETY_HEADLINE_CITIES):
+        self.size = size
+        self.max_cities = max_cities
+        self._rings: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, city: str, articles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Push a response's articles (newest first) and return the city's recent headlines."""
+        key = normalize_city(city)
+        entries: List[Tuple[str, str, str, str]] = [
+            (a.get("title") or "", (a.get("source") or {}).get("name") or "", a.get("url") or "",
+             a.get("publishedAt") or "")
+            for a in articles[:self.size]
+        ]
+        with self._lock:
+            ring = self._rings.pop(key, None)
+            if ring is None:
+                ring = deque(maxlen=self.size)
+            seen = {entry[2] for entry in ring}
+            for entry in reversed(entries):
+                if entry[2] not in seen:
+                    ring.append(entry)
+                    seen.add(entry[2])
+            self._rings[key] = ring
+            while len(self._rings) > self.max_cities:
+                self._rings.popitem(last=False)
+            recent = sorted(ring, key=lambda entry: entry[3], reverse=True)
+        return [dict(zip(self.FIELDS, entry)) for entry in recent]
+
+
+headlines = HeadlineBuffer()
+
+
+def calculate_safety_score(article_count: int) -> int:
+    """
+    Convert a count of recent crime-related articles into a safety score.
+
+    Args:
+        article_count: Number of matching news articles
+
+    Returns:
+        Safety score (0-100)
+    """
+    return get_scoring_model().safety_score(article_count)
+
+
+def risk_level(safety_score: int) -> str:
+    return get_scoring_model().risk_level(safety_score)
+
+
+def _safety_scores(model: ScoringModel, article_count: int) -> Dict[str, Any]:
+    score = model.safety_score(article_count)
+    return {"safety_score": score, "risk_level": model.risk_level(score)}
+
+
+def rescore_safety(result: Any) -> Any:
+    """A cached safety result, re-scored if the scoring model changed since."""
+    return rescore(result, lambda model, data: _safety_scores(model, data["articles_count"]))
+
+
+def _parse_safety(city: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    if data.get("status") == "error":
+        raise ValueError(data.get("message") or data.get("code") or "News API returned an error")
+    articles = data.get("articles") or []
+    # totalResults counts every match, not just the page that was returned
+    total_count = data.get("totalResults", len(articles))
+    model = get_scoring_model()
+    return {
+        **_safety_scores(model, total_count),
+        "scoring_version": model.version,
+        "articles": total_count,
+        "articles_count": total_count,
+        "recent_articles": headlines.add(city, articles) if SAFETY_HEADLINES else [],
+        "status": "success"
+    }
+
+
+@cached("safety", key_func=safety_cache_key, rescore=rescore_safety)
+@recorded("safety")
 def get_safety(city: str) -> Dict[str, Any]:
-    api_key = os.getenv("NEWS_API_KEY")
+    api_key = upstream_key("NEWS_API_KEY")
     if not api_key:
         return {
             "error": "News API key not configured",
             "status": "error"
         }
     try:
-        url = "https://newsapi.org/v2/everything"
-        today = datetime.utcnow().date()
-        first_day = today - timedelta(days=1)
-        params = {
-            "q": f"{city} crime OR theft OR violence",
-            "language": "en",
-            "pageSize": 100,
-            "apiKey": api_key,
-            "from": first_day.isoformat(),
-            "to": today.isoformat(),
-            "page": 1
+        resp = http_client.get(
+            NEWS_API_URL, params=_safety_params(city, api_key), timeout=NEWS_API_TIMEOUT, provider="newsapi"
+        )
+        return _parse_safety(city, resp.json())
+    except BudgetExhausted as e:
+        return budget_exhausted_result(e)
+    except requests.exceptions.RequestException as e:
+        return {
+            "error": f"News API request failed: {str(e)}",
+            "status": "error"
         }
-        resp = requests.get(url, params=params)
-        data = resp.json()
-        articles = data.get("articles", [])
-        total_count = len(articles)
-        score = max(0, 100 - 13 * math.log1p(total_count))
-        score = round(score)
+    except Exception as e:
         return {
-            "safety_score": score,
-            "articles": total_count,
-            "status": "success"
+            "error": f"Unexpected error: {str(e)}",
+            "status": "error"
         }
-    except requests.exceptions.RequestException as e:
+
+
+@cached("safety", key_func=safety_cache_key, rescore=rescore_safety)
+@recorded("safety")
+async def get_safety_async(city: str) -> Dict[str, Any]:
+    """
+    Async variant of get_safety using the shared pooled HTTP client.
+
+    Args:
+        city: City name to assess safety for
+
+    Returns:
+        Dict containing the safety assessment or error information
+    """
+    api_key = upstream_key("NEWS_API_KEY")
+    if not api_key:
+        return {
+            "error": "News API key not configured",
+            "status": "error"
+        }
+    try:
+        resp = await http_client.async_get(
+            NEWS_API_URL, params=_safety_params(city, api_key), timeout=NEWS_API_TIMEOUT, provider="newsapi"
+        )
+        return _parse_safety(city, resp.json())
+    except BudgetExhausted as e:
+        return budget_exhausted_result(e)
+    except httpx.HTTPError as e:
         return {
             "error": f"News API request failed: {str(e)}",
             "status": "error"
@@ -44,4 +190,4 @@ def get_safety(city: str) -> Dict[str, Any]:
         return {
             "error": f"Unexpected error: {str(e)}",
             "status": "error"
-        }
\ No newline at end of file
+        }
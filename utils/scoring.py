@@ -0,0 +1,168 @@
+"""
+Vectorized scoring engine for ranking many observations at once.
+
+Mirrors the scalar scoring functions (calculate_weather_score,
+calculate_safety_score, calculate_availability_score and the composite in
+main.calculate_composite_score) on columnar NumPy arrays, producing
+identical integers for identical inputs. Both use the lookup tables of the
+same ScoringModel (see utils/scoring_model.py); every function takes the
+model to use and defaults to the current one. Condition codes are only
+meaningful for the model that encoded them, so resolve the model once when
+encoding and scoring the same batch.
+"""
+
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.scoring_model import ScoringModel, get_scoring_model
+
+UNKNOWN_CONDITION = 0
+
+
+def condition_code(condition_text: str, model: Optional[ScoringModel] = None) -> int:
+    """
+    Map a WeatherAPI condition text to its category code.
+
+    The model keeps a text -> code map, so encoding a column costs one dict
+    hit per row.
+    """
+    return (model or get_scoring_model()).condition_code(condition_text)
+
+
+def encode_conditions(condition_texts: Iterable[Optional[str]], model: Optional[ScoringModel] = None) -> np.ndarray:
+    """Encode condition texts as an int8 array of category codes."""
+    model = model or get_scoring_model()
+    return np.fromiter(
+        (model.condition_code(text or "") for text in condition_texts), dtype=np.int8
+    )
+
+
+def _as_float(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+def weather_scores(temp_f, humidity, condition_codes, model: Optional[ScoringModel] = None) -> np.ndarray:
+    """
+    Weather scores (0-100) for arrays of temperature, humidity and condition codes.
+
+    Rows with a missing (NaN) temperature or humidity get the model's
+    missing score, like the scalar function.
+    """
+    model = model or get_scoring_model()
+    temp_f = _as_float(temp_f)
+    humidity = _as_float(humidity)
+    codes = np.asarray(condition_codes, dtype=np.intp)
+
+    total = np.clip(
+        model.temperature.many(temp_f) + model.condition_points[codes] + model.humidity.many(humidity), 0, 100
+    )
+    return np.where(np.isnan(temp_f) | np.isnan(humidity), model.weather_missing, total)
+
+
+def safety_scores(article_counts, model: Optional[ScoringModel] = None) -> np.ndarray:
+    """Safety scores (0-100) for an array of article counts."""
+    model = model or get_scoring_model()
+    counts = _as_float(article_counts)
+    # np.rint rounds half to even, like Python's round()
+    return np.rint(
+        np.maximum(0, model.safety_max - model.safety_per_log_article * np.log1p(counts))
+    ).astype(np.int64)
+
+
+def availability_scores(flight_counts, airline_counts, model: Optional[ScoringModel] = None) -> np.ndarray:
+    """Availability scores (0-100) for arrays of flight and unique-airline counts."""
+    model = model or get_scoring_model()
+    flights = _as_float(flight_counts)
+    airlines = _as_float(airline_counts)
+    score = (np.minimum(flights, model.flights_cap) / model.flights_cap * model.flights_points
+             + np.minimum(airlines, model.airlines_cap) / model.airlines_cap * model.airlines_points)
+    return score.astype(np.int64)
+
+
+def composite_scores(weather, safety, availability, model: Optional[ScoringModel] = None) -> np.ndarray:
+    """Composite scores using the same weighting as the scalar path."""
+    weather_weight, safety_weight, flight_weight = (model or get_scoring_model()).weights
+    score = ((_as_float(weather) * weather_weight) + (_as_float(safety) * safety_weight)
+             + (_as_float(availability) * flight_weight))
+    return score.astype(np.int64)
+
+
+def recommendations(composite, model: Optional[ScoringModel] = None) -> np.ndarray:
+    """Recommendation labels for an array of composite scores."""
+    return (model or get_scoring_model()).recommendations.many(_as_float(composite))
+
+
+def score_batch(temp_f, humidity, condition_codes, article_counts,
+                flight_counts, airline_counts, model: Optional[ScoringModel] = None) -> Dict[str, np.ndarray]:
+    """
+    Score a batch of observations in one pass.
+
+    Args:
+        temp_f: Temperatures in °F (NaN when unknown)
+        humidity: Relative humidity percentages (NaN when unknown)
+        condition_codes: Category codes from encode_conditions
+        article_counts: Crime-related article counts per city
+        flight_counts: Flights in the availability window per city
+        airline_counts: Unique airlines per city
+        model: Scoring model the condition codes were encoded with (defaults to the current one)
+
+    Returns:
+        Dict of int arrays: weather, safety, availability and composite scores
+    """
+    model = model or get_scoring_model()
+    weather = weather_scores(temp_f, humidity, condition_codes, model)
+    safety = safety_scores(article_counts, model)
+    availability = availability_scores(flight_counts, airline_counts, model)
+    return {
+        "weather": weather,
+        "safety": safety,
+        "availability": availability,
+        "composite": composite_scores(weather, safety, availability, model),
+    }
+
+
+def _current_conditions(weather_result: Dict[str, Any]) -> Tuple[float, float, str]:
+    # Anything the scalar path would fail on scores as missing (a NaN temperature)
+    try:
+        current = weather_result.get("current", {})
+        condition_text = current.get("condition", {}).get("text", "")
+        if not isinstance(condition_text, str):
+            raise TypeError("condition text is not a string")
+        return float(current.get("temp_f", 0)), float(current.get("humidity", 50)), condition_text
+    except (AttributeError, TypeError, ValueError):
+        return float("nan"), 50.0, ""
+
+
+def score_results(weather: Sequence[Dict[str, Any]], safety: Sequence[Dict[str, Any]],
+                  flights: Sequence[Dict[str, Any]], model: Optional[ScoringModel] = None) -> Dict[str, np.ndarray]:
+    """
+    Score destinations from their upstream results in one pass.
+
+    Takes one weather, safety and flights result per destination, as the
+    clients return them, and scores each from its own inputs. A result
+    without a score of its own (an upstream error) counts as the model's
+    composite "missing" value, like main.calculate_composite_score.
+
+    Returns:
+        Dict of arrays: weather, safety, availability and composite scores
+        and the recommendation labels
+    """
+    model = model or get_scoring_model()
+    temp_f, humidity, conditions = zip(*map(_current_conditions, weather)) if weather else ((), (), ())
+    scores = score_batch(
+        temp_f,
+        humidity,
+        encode_conditions(conditions, model),
+        [s.get("articles_count", 0) for s in safety],
+        [f.get("total_flights", 0) for f in flights],
+        [f.get("unique_airlines", 0) for f in flights],
+        model,
+    )
+    for name, results, field in (("weather", weather, "weather_score"), ("safety", safety, "safety_score"),
+                                 ("availability", flights, "availability_score")):
+        scored = np.fromiter((field in r for r in results), dtype=bool, count=len(results))
+        scores[name] = np.where(scored, scores[name], model.composite_missing)
+    scores["composite"] = composite_scores(scores["weather"], scores["safety"], scores["availability"], model)
+    scores["recommendation"] = recommendations(scores["composite"], model)
+    return scores
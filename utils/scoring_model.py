@@ -0,0 +1,378 @@
+"""
+Declarative scoring model, compiled into lookup tables and hot-reloaded.
+
+Every score the API produces (weather, safety, flight availability, the
+composite and its recommendation label) comes from a ScoringModel. The
+model is built from DEFAULT_CONFIG, overridden key by key by the JSON file
+at SCORING_CONFIG_PATH when it exists. Compiling turns the config into:
+
+- band edges for temperature and humidity, searched with bisect (or
+  np.searchsorted for whole columns) instead of chained comparisons
+- a condition text -> points map, precomputed for WeatherAPI's condition
+  texts, so the keyword scan runs once per distinct text, not per call
+- ascending thresholds for risk levels and recommendation labels
+
+The file is stat'ed at most every SCORING_RELOAD_INTERVAL seconds and a
+changed file is recompiled without restarting workers; an invalid file is
+reported and the previous model kept. Each model has a version (its name
+plus a hash of the effective config) that is stamped on every scored
+result, so cached results scored by an older version can be re-scored
+from their cached inputs instead of being fetched again.
+
+Print the effective config and its version with:
+
+    python -m utils.scoring_model
+"""
+
+import bisect
+import copy
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scoring.json")
+SCORING_CONFIG_PATH = os.getenv("SCORING_CONFIG_PATH", DEFAULT_CONFIG_PATH)
+SCORING_RELOAD_INTERVAL = float(os.getenv("SCORING_RELOAD_INTERVAL", "5"))
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "name": "default",
+    "weather": {
+        # Bands are checked in order: "below" is exclusive, "upto" inclusive
+        "temperature_f": {
+            "bands": [
+                {"below": 45, "points": 10},
+                {"below": 55, "points": 20},
+                {"below": 65, "points": 30},
+                {"upto": 80, "points": 40},
+                {"upto": 85, "points": 30},
+                {"upto": 90, "points": 20},
+            ],
+            "otherwise": 10,
+        },
+        "humidity": {
+            "bands": [
+                {"below": 20, "points": 10},
+                {"below": 30, "points": 15},
+                {"upto": 60, "points": 20},
+                {"upto": 70, "points": 15},
+            ],
+            "otherwise": 10,
+        },
+        # The first rule with a keyword in the condition text wins
+        "conditions": {
+            "rules": [
+                {"keywords": ["sunny", "clear"], "points": 40},
+                {"keywords": ["partly cloudy", "cloudy"], "points": 35},
+                {"keywords": ["overcast"], "points": 25},
+                {"keywords": ["rain", "drizzle"], "points": 15},
+                {"keywords": ["snow", "sleet"], "points": 10},
+                {"keywords": ["storm", "thunder"], "points": 5},
+            ],
+            "otherwise": 20,
+        },
+        # Score when the temperature or humidity is missing
+        "missing": 50,
+    },
+    "safety": {
+        # max - points_per_log_article * ln(1 + articles), floored at 0
+        "max": 100,
+        "points_per_log_article": 13,
+        "risk_levels": [{"min": 80, "label": "Low"}, {"min": 60, "label": "Medium"}],
+        "otherwise": "High",
+    },
+    "flights": {
+        "flights_cap": 150,
+        "flights_points": 60,
+        "airlines_cap": 8,
+        "airlines_points": 40,
+    },
+    "composite": {
+        "weights": {"weather": 0.4, "safety": 0.4, "flights": 0.2},
+        # Used for a component whose upstream failed
+        "missing": 50,
+        "recommendations": [
+            {"min": 80, "label": "Excellent destination"},
+            {"min": 70, "label": "Good to visit"},
+            {"min": 60, "label": "Consider visiting"},
+            {"min": 50, "label": "Proceed with caution"},
+        ],
+        "otherwise": "Not recommended",
+    },
+}
+
+# Condition texts WeatherAPI returns, compiled up front
+WEATHERAPI_CONDITIONS = (
+    "Sunny", "Clear", "Partly cloudy", "Partly Cloudy", "Cloudy", "Overcast", "Mist", "Fog", "Freezing fog",
+    "Patchy rain possible", "Patchy rain nearby", "Patchy snow possible", "Patchy snow nearby",
+    "Patchy sleet possible", "Patchy sleet nearby", "Patchy freezing drizzle possible",
+    "Patchy freezing drizzle nearby", "Thundery outbreaks possible", "Thundery outbreaks in nearby",
+    "Blowing snow", "Blizzard", "Patchy light drizzle", "Light drizzle", "Freezing drizzle",
+    "Heavy freezing drizzle", "Patchy light rain", "Light rain", "Moderate rain at times", "Moderate rain",
+    "Heavy rain at times", "Heavy rain", "Light freezing rain", "Moderate or heavy freezing rain", "Light sleet",
+    "Moderate or heavy sleet", "Patchy light snow", "Light snow", "Patchy moderate snow", "Moderate snow",
+    "Patchy heavy snow", "Heavy snow", "Ice pellets", "Light rain shower", "Moderate or heavy rain shower",
+    "Torrential rain shower", "Light sleet showers", "Moderate or heavy sleet showers", "Light snow showers",
+    "Moderate or heavy snow showers", "Light showers of ice pellets",
+    "Moderate or heavy showers of ice pellets", "Patchy light rain with thunder",
+    "Patchy light rain in area with thunder", "Moderate or heavy rain with thunder",
+    "Moderate or heavy rain in area with thunder", "Patchy light snow with thunder",
+    "Patchy light snow in area with thunder", "Moderate or heavy snow with thunder",
+    "Moderate or heavy snow in area with thunder",
+)
+# Unseen condition texts remembered per model, beyond the known ones
+MAX_CONDITION_TEXTS = 4096
+
+
+def _merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class Bands:
+    """
+    Points for a value from ordered bands, compiled to sorted edges.
+
+    An inclusive bound b becomes the edge just above b, so every edge is
+    exclusive and the band for v is bisect_right(edges, v).
+    """
+
+    __slots__ = ("edges", "points", "edge_array", "point_array")
+
+    def __init__(self, spec: Dict[str, Any]):
+        edges: List[float] = []
+        points: List[int] = []
+        for band in spec["bands"]:
+            if ("below" in band) == ("upto" in band):
+                raise ValueError(f"Band {band} needs exactly one of 'below' or 'upto'")
+            bound = float(band["below"]) if "below" in band else math.nextafter(float(band["upto"]), math.inf)
+            if edges and bound <= edges[-1]:
+                raise ValueError(f"Band {band} does not come after the previous band")
+            edges.append(bound)
+            points.append(int(band["points"]))
+        points.append(int(spec["otherwise"]))
+        self.edges = edges
+        self.points = points
+        self.edge_array = np.array(edges, dtype=np.float64)
+        self.point_array = np.array(points, dtype=np.int64)
+
+    def __call__(self, value: float) -> int:
+        return self.points[bisect.bisect_right(self.edges, value)]
+
+    def many(self, values: np.ndarray) -> np.ndarray:
+        return self.point_array[np.searchsorted(self.edge_array, values, side="right")]
+
+
+class Levels:
+    """Label for a score from ascending minimums (the highest minimum reached wins)."""
+
+    __slots__ = ("thresholds", "labels", "threshold_array", "label_array")
+
+    def __init__(self, levels: Sequence[Dict[str, Any]], otherwise: str):
+        ordered = sorted(levels, key=lambda level: level["min"])
+        self.thresholds = [float(level["min"]) for level in ordered]
+        self.labels = [otherwise] + [str(level["label"]) for level in ordered]
+        self.threshold_array = np.array(self.thresholds, dtype=np.float64)
+        self.label_array = np.array(self.labels)
+
+    def __call__(self, score: float) -> str:
+        return self.labels[bisect.bisect_right(self.thresholds, score)]
+
+    def many(self, scores: np.ndarray) -> np.ndarray:
+        return self.label_array[np.searchsorted(self.threshold_array, scores, side="right")]
+
+
+class ScoringModel:
+    """Scoring functions compiled from one config. Immutable once built."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        canonical = json.dumps(config, sort_keys=True, separators=(",", ":"))
+        self.version = f"{config.get('name', 'custom')}-{hashlib.blake2b(canonical.encode(), digest_size=4).hexdigest()}"
+
+        weather = config["weather"]
+        self.temperature = Bands(weather["temperature_f"])
+        self.humidity = Bands(weather["humidity"])
+        self.weather_missing = int(weather["missing"])
+        rules = weather["conditions"]["rules"]
+        self.condition_rules: Tuple[Tuple[Tuple[str, ...], int], ...] = tuple(
+            (tuple(keyword.lower() for keyword in rule["keywords"]), int(rule["points"])) for rule in rules
+        )
+        # condition_points[code] is the score of a condition category; code 0 matches no rule
+        self.condition_points = np.array([int(weather["conditions"]["otherwise"])]
+                                         + [points for _, points in self.condition_rules], dtype=np.int64)
+        self._condition_codes: Dict[str, int] = {}
+        self._condition_lock = threading.Lock()
+        for text in WEATHERAPI_CONDITIONS:
+            self._condition_codes[text.lower()] = self._match_condition(text.lower())
+
+        safety = config["safety"]
+        self.safety_max = float(safety["max"])
+        self.safety_per_log_article = float(safety["points_per_log_article"])
+        self.risk_levels = Levels(safety["risk_levels"], safety["otherwise"])
+
+        flights = config["flights"]
+        self.flights_cap = float(flights["flights_cap"])
+        self.flights_points = float(flights["flights_points"])
+        self.airlines_cap = float(flights["airlines_cap"])
+        self.airlines_points = float(flights["airlines_points"])
+
+        composite = config["composite"]
+        weights = composite["weights"]
+        self.weights = (float(weights["weather"]), float(weights["safety"]), float(weights["flights"]))
+        self.composite_missing = composite["missing"]
+        self.recommendations = Levels(composite["recommendations"], composite["otherwise"])
+
+    def _match_condition(self, text: str) -> int:
+        for code, (keywords, _) in enumerate(self.condition_rules, start=1):
+            if any(keyword in text for keyword in keywords):
+                return code
+        return 0
+
+    def condition_code(self, condition_text: str) -> int:
+        """Category of a condition text (0 = no rule matched); one dict hit for known texts."""
+        text = condition_text.lower()
+        code = self._condition_codes.get(text)
+        if code is None:
+            code = self._match_condition(text)
+            with self._condition_lock:
+                if len(self._condition_codes) < len(WEATHERAPI_CONDITIONS) + MAX_CONDITION_TEXTS:
+                    self._condition_codes[text] = code
+        return code
+
+    def condition_score(self, condition_text: str) -> int:
+        return int(self.condition_points[self.condition_code(condition_text)])
+
+    def weather_score(self, weather_data: Dict[str, Any]) -> int:
+        """Weather score (0-100) of a WeatherAPI response's current conditions."""
+        try:
+            current = weather_data.get("current", {})
+            temp_f = float(current.get("temp_f", 0))
+            humidity = float(current.get("humidity", 50))
+            if math.isnan(temp_f) or math.isnan(humidity):
+                return self.weather_missing
+            condition_text = current.get("condition", {}).get("text", "")
+            total = self.temperature(temp_f) + self.condition_score(condition_text) + self.humidity(humidity)
+            return min(100, max(0, total))
+        except Exception:
+            return self.weather_missing
+
+    def safety_score(self, article_count: int) -> int:
+        return round(max(0, self.safety_max - self.safety_per_log_article * math.log1p(article_count)))
+
+    def risk_level(self, safety_score: int) -> str:
+        return self.risk_levels(safety_score)
+
+    def availability_score(self, total_flights: int, unique_airlines: int) -> int:
+        flight_score = min(total_flights, self.flights_cap) / self.flights_cap * self.flights_points
+        airline_score = min(unique_airlines, self.airlines_cap) / self.airlines_cap * self.airlines_points
+        return int(flight_score + airline_score)
+
+    def composite_score(self, weather_score: float, safety_score: float, flight_score: float) -> int:
+        weather_weight, safety_weight, flight_weight = self.weights
+        return int((weather_score * weather_weight) + (safety_score * safety_weight) + (flight_score * flight_weight))
+
+    def recommendation(self, composite_score: int) -> str:
+        return self.recommendations(composite_score)
+
+
+def load_config(path: str = SCORING_CONFIG_PATH) -> Dict[str, Any]:
+    """DEFAULT_CONFIG with the overrides in path applied (just the defaults if it doesn't exist)."""
+    if not os.path.exists(path):
+        return copy.deepcopy(DEFAULT_CONFIG)
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+    if not isinstance(overrides, dict):
+        raise ValueError(f"{path} must contain a JSON object")
+    return _merge(DEFAULT_CONFIG, overrides)
+
+
+_model: Optional[ScoringModel] = None
+_file_state: Optional[Tuple[float, int]] = None
+_last_checked = 0.0
+_lock = threading.Lock()
+_reload_listeners: List[Callable[[ScoringModel], None]] = []
+
+
+def _stat(path: str) -> Optional[Tuple[float, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def get_scoring_model() -> ScoringModel:
+    """
+    Return the current model, recompiling it if the config file changed.
+
+    The file is stat'ed at most once every SCORING_RELOAD_INTERVAL seconds,
+    so steady-state scoring never touches the filesystem.
+    """
+    global _model, _file_state, _last_checked
+    now = time.monotonic()
+    model = _model
+    if model is not None and now - _last_checked < SCORING_RELOAD_INTERVAL:
+        return model
+
+    with _lock:
+        if _model is not None and now - _last_checked < SCORING_RELOAD_INTERVAL:
+            return _model
+        _last_checked = now
+        state = _stat(SCORING_CONFIG_PATH)
+        if _model is not None and state == _file_state:
+            return _model
+        try:
+            model = ScoringModel(load_config(SCORING_CONFIG_PATH))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if _model is None:
+                raise
+            # Keep scoring with the last good model until the file is fixed
+            print(f"[ERROR] Invalid scoring config {SCORING_CONFIG_PATH}, keeping {_model.version}: {e}")
+            _file_state = state
+            return _model
+        previous, _model, _file_state = _model, model, state
+    if previous is not None and model.version != previous.version:
+        print(f"[INFO] Scoring config changed: {previous.version} -> {model.version}")
+        for listener in list(_reload_listeners):
+            try:
+                listener(model)
+            except Exception as e:
+                print(f"[ERROR] Scoring reload listener failed: {e}")
+    return model
+
+
+def on_reload(listener: Callable[[ScoringModel], None]) -> None:
+    """Call listener(new_model) whenever a changed config is loaded. It must not block."""
+    _reload_listeners.append(listener)
+
+
+def rescore(result: Any, update: Callable[[ScoringModel, Dict[str, Any]], Dict[str, Any]]) -> Any:
+    """
+    Bring a cached result up to the current model.
+
+    Results scored by the current version are returned as is. Older
+    successful results get the fields update(model, result) recomputes from
+    their own inputs; no upstream call is needed.
+    """
+    if not isinstance(result, dict) or result.get("status") not in ("success", "partial"):
+        return result
+    model = get_scoring_model()
+    if result.get("scoring_version") == model.version:
+        return result
+    return {**result, **update(model, result), "scoring_version": model.version}
+
+
+if __name__ == "__main__":
+    current = get_scoring_model()
+    print(json.dumps({"version": current.version, "path": SCORING_CONFIG_PATH, "config": current.config}, indent=2))
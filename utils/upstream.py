@@ -0,0 +1,202 @@
+"""
+Central rate-limit budget for the upstream providers.
+
+Every upstream call takes a token from its provider's bucket before it is
+sent. Interactive requests (the default) are served first: background work
+such as the prewarmer runs at BACKGROUND priority, may not dip into the
+share of the budget reserved for interactive traffic, and yields entirely
+while an interactive request is waiting. When no token can be had within
+the wait limit the call is shed with BudgetExhausted, which the clients
+turn into an error result that the cache answers with stale data.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils.rate_limit import TokenBucket
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Priority of upstream calls made from the current request or task
+upstream_priority: contextvars.ContextVar = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+
+# Requests per minute each provider's plan allows
+UPSTREAM_RATES = {
+    "weatherapi": float(os.getenv("WEATHERAPI_RATE_PER_MINUTE", "120")),
+    "aerodatabox": float(os.getenv("AERODATABOX_RATE_PER_MINUTE", "30")),
+    "newsapi": float(os.getenv("NEWSAPI_RATE_PER_MINUTE", "30")),
+}
+# Worker processes sharing the provider plans. Buckets are per process, so
+# each worker gets an equal share of every rate and they stay within the
+# plan together (gunicorn.conf.py exports this for its worker count)
+UPSTREAM_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+# Burst size, in seconds' worth of the rate
+UPSTREAM_BURST_SECONDS = float(os.getenv("UPSTREAM_BURST_SECONDS", "10"))
+# Longest an interactive request waits for a token before it is shed
+UPSTREAM_MAX_WAIT = float(os.getenv("UPSTREAM_MAX_WAIT", "2"))
+BACKGROUND_MAX_WAIT = float(os.getenv("UPSTREAM_BACKGROUND_MAX_WAIT", "60"))
+# Fraction of each bucket that background work may not use
+BACKGROUND_RESERVE = float(os.getenv("UPSTREAM_BACKGROUND_RESERVE", "0.25"))
+
+# How often a background waiter re-checks while interactive calls are queued
+_BACKGROUND_POLL = 0.05
+
+
+class BudgetExhausted(Exception):
+    """Raised when an upstream call can't get a rate-limit token in time."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} rate budget exhausted, retry in {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class UpstreamScheduler:
+    def __init__(self, rates: Dict[str, float] = UPSTREAM_RATES, burst_seconds: float = UPSTREAM_BURST_SECONDS,
+                 max_wait: float = UPSTREAM_MAX_WAIT, background_max_wait: float = BACKGROUND_MAX_WAIT,
+                 background_reserve: float = BACKGROUND_RESERVE, workers: int = UPSTREAM_WORKERS):
+        self.workers = workers
+        self.buckets = {
+            provider: TokenBucket(per_minute / 60 / workers, max(1.0, per_minute / 60 / workers * burst_seconds))
+            for provider, per_minute in rates.items()
+        }
+        self.max_wait = max_wait
+        self.background_max_wait = background_max_wait
+        self.background_reserve = background_reserve
+        self._lock = threading.Lock()
+        self._interactive_waiting: Dict[str, int] = {provider: 0 for provider in rates}
+        self.granted = {provider: 0 for provider in rates}
+        self.shed = {provider: 0 for provider in rates}
+        self.throttled = {provider: 0 for provider in rates}
+
+    def max_tokens(self, provider: str, priority: Optional[int] = None) -> int:
+        """Most tokens one acquire() at this priority can ever be granted from provider's bucket."""
+        bucket = self.buckets.get(provider)
+        if bucket is None:
+            return 0
+        priority = upstream_priority.get() if priority is None else priority
+        if priority == INTERACTIVE:
+            return int(bucket.capacity)
+        # The largest n whose request still fits above the reserve kept for n
+        return max(1, int(bucket.capacity * (1 - self.background_reserve)))
+
+    def _reserve(self, bucket: TokenBucket, tokens: int) -> float:
+        # Never so large that background work could not be granted at all,
+        # as happens when a worker's share of the burst is a single token
+        return min(bucket.capacity * self.background_reserve, max(0.0, bucket.capacity - tokens))
+
+    def _try(self, provider: str, priority: int, tokens: int) -> float:
+        bucket = self.buckets[provider]
+        if priority == INTERACTIVE:
+            return bucket.try_acquire(tokens)
+        if self._interactive_waiting[provider]:
+            return _BACKGROUND_POLL
+        return bucket.try_acquire(tokens, reserve=self._reserve(bucket, tokens))
+
+    def _deadline(self, priority: int) -> float:
+        return time.monotonic() + (self.max_wait if priority == INTERACTIVE else self.background_max_wait)
+
+    def _waiting(self, provider: str, priority: int, delta: int) -> None:
+        if priority == INTERACTIVE:
+            with self._lock:
+                self._interactive_waiting[provider] += delta
+
+    def _granted(self, provider: str, tokens: int) -> None:
+        with self._lock:
+            self.granted[provider] += tokens
+
+    def _shed(self, provider: str, wait: float) -> BudgetExhausted:
+        with self._lock:
+            self.shed[provider] += 1
+        print(f"[ERROR] Shedding {provider} request: rate budget exhausted")
+        return BudgetExhausted(provider, wait)
+
+    def pause(self, provider: str, seconds: float) -> None:
+        """
+        Grant nothing from provider's bucket for seconds, after the provider
+        answered 429. Calls in the meantime are shed (or wait, if the pause
+        ends within their wait limit) instead of being sent and refused.
+        """
+        bucket = self.buckets.get(provider)
+        if bucket is None:
+            return
+        with self._lock:
+            self.throttled[provider] += 1
+        print(f"[INFO] {provider} is throttling; pausing its budget for {seconds:.1f}s")
+        bucket.pause(seconds)
+
+    async def acquire(self, provider: str, priority: Optional[int] = None, tokens: int = 1) -> None:
+        """
+        Wait for tokens on the event loop; raises BudgetExhausted after the wait limit.
+
+        Several tokens are taken together or not at all, so a fan-out of
+        calls is either fully budgeted or shed before any of them is sent.
+        """
+        if provider not in self.buckets:
+            return
+        priority = upstream_priority.get() if priority is None else priority
+        deadline = self._deadline(priority)
+        self._waiting(provider, priority, 1)
+        try:
+            while True:
+                wait = self._try(provider, priority, tokens)
+                if wait == 0:
+                    self._granted(provider, tokens)
+                    return
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    raise self._shed(provider, wait)
+                await asyncio.sleep(wait)
+        finally:
+            self._waiting(provider, priority, -1)
+
+    def acquire_blocking(self, provider: str, priority: Optional[int] = None, tokens: int = 1) -> None:
+        """Threadpool counterpart of acquire."""
+        if provider not in self.buckets:
+            return
+        priority = upstream_priority.get() if priority is None else priority
+        deadline = self._deadline(priority)
+        self._waiting(provider, priority, 1)
+        try:
+            while True:
+                wait = self._try(provider, priority, tokens)
+                if wait == 0:
+                    self._granted(provider, tokens)
+                    return
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    raise self._shed(provider, wait)
+                time.sleep(wait)
+        finally:
+            self._waiting(provider, priority, -1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                provider: {
+                    **bucket.stats(),
+                    "granted": self.granted[provider],
+                    "shed": self.shed[provider],
+                    "throttled": self.throttled[provider],
+                    "interactive_waiting": self._interactive_waiting[provider],
+                }
+                for provider, bucket in self.buckets.items()
+            }
+
+
+scheduler = UpstreamScheduler()
+
+
+def budget_exhausted_result(e: BudgetExhausted) -> Dict[str, Any]:
+    """Error result returned by a client whose call was shed."""
+    return {
+        "error": str(e),
+        "rate_limited": True,
+        "retry_after": round(e.retry_after, 1),
+        "status": "error"
+    }
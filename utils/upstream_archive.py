@@ -0,0 +1,398 @@
+"""
+Record/replay archive of upstream responses.
+
+Set UPSTREAM_ARCHIVE_MODE to:
+
+- record: call the providers as usual and append every answer to the archive
+- replay: answer every upstream call from the archive; nothing goes on the
+  network and no rate budget is spent. Calls with no recording fail like a
+  connection error, so the usual error and stale-cache handling applies
+- fallback: call the providers as usual, but answer from the archive when a
+  provider is unreachable, throttling (429) or failing (5xx)
+
+The hooks sit under utils/http_client.py (a requests adapter and an httpx
+transport), so every client is covered without changes of its own.
+
+Responses are matched on path and query string, without host or port, so a
+recording made against benchmarks/upstream_sim.py replays against the real
+provider URLs and vice versa. API keys are never part of the key or stored.
+When there is no exact match, the most recent response whose URL differs
+only in its dates (e.g. the flight window or NewsAPI's "from") is used, so
+an archive keeps replaying on later days.
+
+Layout: 8-byte magic, then one record per response: a little-endian
+(status, meta length, body length) header, a JSON meta object and the
+zlib-compressed body. The file is only ever appended to (under a file
+lock, so several workers can record into it) and a later record for the
+same key wins. Opening scans the headers to build an in-memory index;
+bodies are decompressed on first use and then served from memory.
+
+Inspect or compact an archive with:
+
+    python -m utils.upstream_archive upstream.archive [--compact]
+"""
+
+import argparse
+import json
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+ARCHIVE_MODES = ("off", "record", "replay", "fallback")
+DEFAULT_ARCHIVE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "upstream.archive")
+UPSTREAM_ARCHIVE_MODE = os.getenv("UPSTREAM_ARCHIVE_MODE", "off").lower()
+UPSTREAM_ARCHIVE_PATH = os.getenv("UPSTREAM_ARCHIVE_PATH", DEFAULT_ARCHIVE_PATH)
+
+MAGIC = b"STPUPAR1"
+_HEADER = struct.Struct("<HII")
+
+# Query parameters that carry credentials
+SECRET_PARAMS = frozenset({"key", "apikey", "api_key", "access_key", "token"})
+# Response headers worth replaying; the body is stored decoded
+KEPT_HEADERS = ("content-type",)
+# Statuses not recorded: missing credentials and throttling say nothing about the data
+UNRECORDED_STATUSES = frozenset({401, 403, 429})
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}(?:T\d{2}(?::|%3A)\d{2}(?:(?::|%3A)\d{2})?)?")
+
+
+class ArchivedResponse(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+class _Entry(NamedTuple):
+    offset: int
+    length: int
+    status: int
+    headers: Dict[str, str]
+    recorded_at: float
+
+
+def archive_key(url: str) -> str:
+    """Path and sorted query string of url, without host, port or credentials."""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k.lower() not in SECRET_PARAMS)
+    return f"{parts.path}?{urlencode(query)}" if query else parts.path
+
+
+def loose_key(key: str) -> str:
+    """key with every ISO date or date-time masked."""
+    return _DATE.sub("{date}", key)
+
+
+def recordable(status: int) -> bool:
+    return status < 500 and status not in UNRECORDED_STATUSES
+
+
+def _lock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def _unlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def scan(fd: int, start: int, end: int) -> Tuple[List[Tuple[str, _Entry]], int]:
+    """
+    Read the record headers between start and end.
+
+    Returns:
+        ((key, entry) pairs in file order, offset just past the last complete record)
+    """
+    entries = []
+    pos = start
+    while pos + _HEADER.size <= end:
+        status, meta_len, body_len = _HEADER.unpack(os.pread(fd, _HEADER.size, pos))
+        body_offset = pos + _HEADER.size + meta_len
+        if body_offset + body_len > end:
+            break
+        meta = json.loads(os.pread(fd, meta_len, pos + _HEADER.size))
+        entries.append((meta["key"], _Entry(body_offset, body_len, status, meta.get("headers", {}),
+                                            meta.get("recorded_at", 0.0))))
+        pos = body_offset + body_len
+    return entries, pos
+
+
+def encode_record(key: str, status: int, headers: Dict[str, str], body: bytes,
+                  recorded_at: Optional[float] = None) -> bytes:
+    meta = json.dumps({"key": key, "headers": headers,
+                       "recorded_at": round(time.time() if recorded_at is None else recorded_at, 3)},
+                      separators=(",", ":")).encode("utf-8")
+    compressed = zlib.compress(body, 6)
+    return _HEADER.pack(status, len(meta), len(compressed)) + meta + compressed
+
+
+class UpstreamArchive:
+    """Index over one archive file, plus an appender for record mode."""
+
+    def __init__(self, path: str = UPSTREAM_ARCHIVE_PATH, mode: str = UPSTREAM_ARCHIVE_MODE):
+        self.path = path
+        self.mode = mode
+        self._entries: Dict[str, _Entry] = {}
+        self._loose: Dict[str, str] = {}
+        self._bodies: Dict[str, ArchivedResponse] = {}
+        self._read_fd: Optional[int] = None
+        self._write_fd: Optional[int] = None
+        self._pid = os.getpid()
+        self._scanned = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loose_hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _check_fork(self) -> None:
+        # File locks belong to the open file, so each worker needs its own descriptors
+        if self._pid != os.getpid():
+            self._read_fd = self._write_fd = None
+            self._pid = os.getpid()
+
+    def _refresh(self) -> None:
+        """Index records appended since the last scan (by this or another process)."""
+        if self._read_fd is None:
+            try:
+                self._read_fd = os.open(self.path, os.O_RDONLY)
+            except FileNotFoundError:
+                return
+            if os.pread(self._read_fd, len(MAGIC), 0) != MAGIC:
+                print(f"[ERROR] {self.path} is not an upstream archive; ignoring it")
+                os.close(self._read_fd)
+                self._read_fd = None
+                return
+            self._scanned = len(MAGIC)
+        size = os.fstat(self._read_fd).st_size
+        if size <= self._scanned:
+            return
+        entries, self._scanned = scan(self._read_fd, self._scanned, size)
+        for key, entry in entries:
+            self._entries[key] = entry
+            self._loose[loose_key(key)] = key
+            self._bodies.pop(key, None)
+
+    def _load(self, key: str) -> ArchivedResponse:
+        response = self._bodies.get(key)
+        if response is None:
+            entry = self._entries[key]
+            body = zlib.decompress(os.pread(self._read_fd, entry.length, entry.offset))
+            response = self._bodies[key] = ArchivedResponse(entry.status, entry.headers, body)
+        return response
+
+    def lookup(self, url: str) -> Optional[ArchivedResponse]:
+        """The recorded response for url, or None if nothing matches."""
+        key = archive_key(url)
+        with self._lock:
+            self._check_fork()
+            if self._read_fd is None or (key not in self._entries and loose_key(key) not in self._loose):
+                self._refresh()
+            if key in self._entries:
+                self.hits += 1
+                return self._load(key)
+            loose = self._loose.get(loose_key(key))
+            if loose is not None:
+                self.loose_hits += 1
+                return self._load(loose)
+            self.misses += 1
+            return None
+
+    def record(self, url: str, status: int, headers: Dict[str, str], body: bytes) -> bool:
+        """
+        Append a response, unless its status says nothing about the data.
+
+        Returns:
+            True if it was written
+        """
+        if not recordable(status):
+            return False
+        kept = {name: headers[name] for name in KEPT_HEADERS if name in headers}
+        data = encode_record(archive_key(url), status, kept, body)
+        with self._lock:
+            self._check_fork()
+            if self._write_fd is None:
+                self._write_fd = self._open_for_append()
+            _lock(self._write_fd)
+            try:
+                os.write(self._write_fd, data)
+            finally:
+                _unlock(self._write_fd)
+            self.recorded += 1
+        return True
+
+    def _open_for_append(self) -> int:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            _lock(fd)
+            try:
+                size = os.fstat(fd).st_size
+                if size == 0:
+                    os.write(fd, MAGIC)
+                elif os.pread(fd, len(MAGIC), 0) != MAGIC:
+                    raise ValueError(f"{self.path} is not an upstream archive")
+                else:
+                    # A writer killed mid-record leaves a partial one; drop it so new records stay reachable
+                    _, end = scan(fd, len(MAGIC), size)
+                    if end < size:
+                        print(f"[INFO] Dropping {size - end} bytes of incomplete record from {self.path}")
+                        os.ftruncate(fd, end)
+            finally:
+                _unlock(fd)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "entries": entries,
+            "hits": self.hits,
+            "loose_hits": self.loose_hits,
+            "misses": self.misses,
+            "recorded": self.recorded,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            for fd in (self._read_fd, self._write_fd):
+                if fd is not None and self._pid == os.getpid():
+                    os.close(fd)
+            self._read_fd = self._write_fd = None
+            self._entries.clear()
+            self._loose.clear()
+            self._bodies.clear()
+            self._scanned = 0
+
+
+_archive: Optional[UpstreamArchive] = None
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> Optional[UpstreamArchive]:
+    """The process-wide archive, or None when UPSTREAM_ARCHIVE_MODE is off."""
+    global _archive
+    if UPSTREAM_ARCHIVE_MODE == "off":
+        return None
+    if UPSTREAM_ARCHIVE_MODE not in ARCHIVE_MODES:
+        raise ValueError(f"Unknown upstream archive mode '{UPSTREAM_ARCHIVE_MODE}'")
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = UpstreamArchive()
+                print(f"[INFO] Upstream archive in {UPSTREAM_ARCHIVE_MODE} mode: {UPSTREAM_ARCHIVE_PATH}")
+    return _archive
+
+
+def replaying() -> bool:
+    """True when upstream calls are answered from the archive only."""
+    return UPSTREAM_ARCHIVE_MODE == "replay"
+
+
+# Stands in for a missing API key in replay mode, where no provider is called
+REPLAY_API_KEY = "replay"
+
+
+def upstream_key(env_var: str) -> Optional[str]:
+    """
+    A provider's API key from env_var. When replaying, a placeholder if unset,
+    since archive lookups ignore keys.
+    """
+    return os.getenv(env_var) or (REPLAY_API_KEY if replaying() else None)
+
+
+def archive_stats() -> Optional[Dict[str, object]]:
+    archive = get_archive()
+    return archive.stats() if archive is not None else None
+
+
+def iter_latest(path: str) -> Iterator[Tuple[str, _Entry]]:
+    """The newest record of each key in an archive file, in file order."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if os.pread(fd, len(MAGIC), 0) != MAGIC:
+            raise ValueError(f"{path} is not an upstream archive")
+        entries, _ = scan(fd, len(MAGIC), os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
+    latest = {key: index for index, (key, _) in enumerate(entries)}
+    for index, (key, entry) in enumerate(entries):
+        if latest[key] == index:
+            yield key, entry
+
+
+def compact(path: str) -> Tuple[int, int]:
+    """
+    Rewrite an archive keeping only the newest record of each key.
+
+    Don't run it while a worker is recording into the same file.
+
+    Returns:
+        (bytes before, bytes after)
+    """
+    before = os.path.getsize(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upstream-", suffix=".tmp")
+    src = os.open(path, os.O_RDONLY)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(MAGIC)
+            for key, entry in iter_latest(path):
+                body = zlib.decompress(os.pread(src, entry.length, entry.offset))
+                out.write(encode_record(key, entry.status, entry.headers, body, entry.recorded_at))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    finally:
+        os.close(src)
+    return before, os.path.getsize(path)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Inspect or compact an upstream archive.")
+    parser.add_argument("path", nargs="?", default=UPSTREAM_ARCHIVE_PATH)
+    parser.add_argument("--compact", action="store_true", help="Keep only the newest record of each key")
+    parser.add_argument("--list", action="store_true", help="Print every key")
+    args = parser.parse_args(argv)
+
+    if args.compact:
+        before, after = compact(args.path)
+        print(f"[INFO] Compacted {args.path}: {before} -> {after} bytes")
+    latest = list(iter_latest(args.path))
+    by_path: Dict[str, int] = {}
+    for key, _ in latest:
+        prefix = "/".join(key.split("?", 1)[0].split("/")[:3])
+        by_path[prefix] = by_path.get(prefix, 0) + 1
+    print(f"{args.path}: {len(latest)} responses, {os.path.getsize(args.path)} bytes")
+    for prefix, count in sorted(by_path.items()):
+        print(f"  {prefix}: {count}")
+    if args.list:
+        for key, entry in latest:
+            print(f"{entry.status} {key}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,46 +1,74 @@
 import requests
+import httpx
 import os
 from typing import Dict, Any, Optional
+from utils.cache import cache_key, cached
+from utils.history import recorded
+from utils.scoring_model import get_scoring_model, rescore
+from utils import http_client
+from utils.upstream_archive import upstream_key
+from utils.upstream import BudgetExhausted, budget_exhausted_result
 
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "http://api.weatherapi.com/v1/current.json")
+WEATHER_FORECAST_URL = os.getenv("WEATHER_FORECAST_URL", "http://api.weatherapi.com/v1/forecast.json")
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_API_TIMEOUT", "10"))
+# How far ahead (days, including today) WeatherAPI forecasts on the current plan
+FORECAST_MAX_DAYS = int(os.getenv("FORECAST_MAX_DAYS", "14"))
+
+
+def _weather_params(city: str, api_key: str) -> Dict[str, str]:
+    return {
+        "key": api_key,
+        "q": city,
+        "aqi": "no"
+    }
+
+
+def _with_score(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Add weather score calculation
+    model = get_scoring_model()
+    data["weather_score"] = model.weather_score(data)
+    data["scoring_version"] = model.version
+    data["error"] = None
+    data["status"] = "success"
+    return data
+
+
+def rescore_weather(result: Any) -> Any:
+    """A cached weather result, re-scored if the scoring model changed since."""
+    return rescore(result, lambda model, data: {"weather_score": model.weather_score(data)})
+
+
+@cached("weather", rescore=rescore_weather)
+@recorded("weather")
 def get_weather(city: str) -> Dict[str, Any]:
     """
     Get current weather data for a city using WeatherAPI.
-    
+
     Args:
         city (str): City name to get weather for
-        
+
     Returns:
         Dict containing weather data or error information
     """
-    api_key = os.getenv("WEATHER_API_KEY")
-    
+    api_key = upstream_key("WEATHER_API_KEY")
+
     if not api_key:
         return {
             "error": "Weather API key not configured",
             "status": "error"
         }
-    
+
     try:
-        url = f"http://api.weatherapi.com/v1/current.json"
-        params = {
-            "key": api_key,
-            "q": city,
-            "aqi": "no"
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get(
+            WEATHER_API_URL, params=_weather_params(city, api_key), timeout=WEATHER_TIMEOUT, provider="weatherapi"
+        )
         response.raise_for_status()
-        
-        data = response.json()
-        
-        # Add weather score calculation
-        weather_score = calculate_weather_score(data)
-        data["weather_score"] = weather_score
-        data["error"] = None
-        data["status"] = "success"
-        
-        return data
-        
+
+        return _with_score(response.json())
+
+    except BudgetExhausted as e:
+        return budget_exhausted_result(e)
     except requests.exceptions.RequestException as e:
         return {
             "error": f"Weather API request failed: {str(e)}",
@@ -52,59 +80,157 @@ def get_weather(city: str) -> Dict[str, Any]:
             "status": "error"
         }
 
+
+@cached("weather", rescore=rescore_weather)
+@recorded("weather")
+async def get_weather_async(city: str) -> Dict[str, Any]:
+    """
+    Async variant of get_weather using the shared pooled HTTP client.
+
+    Args:
+        city (str): City name to get weather for
+
+    Returns:
+        Dict containing weather data or error information
+    """
+    api_key = upstream_key("WEATHER_API_KEY")
+
+    if not api_key:
+        return {
+            "error": "Weather API key not configured",
+            "status": "error"
+        }
+
+    try:
+        response = await http_client.async_get(
+            WEATHER_API_URL, params=_weather_params(city, api_key), timeout=WEATHER_TIMEOUT, provider="weatherapi"
+        )
+        response.raise_for_status()
+
+        return _with_score(response.json())
+
+    except BudgetExhausted as e:
+        return budget_exhausted_result(e)
+    except httpx.HTTPError as e:
+        return {
+            "error": f"Weather API request failed: {str(e)}",
+            "status": "error"
+        }
+    except Exception as e:
+        return {
+            "error": f"Unexpected error: {str(e)}",
+            "status": "error"
+        }
+
+
+def forecast_cache_key(city: str, day: str) -> str:
+    return cache_key(city, day)
+
+
+def _forecast_params(city: str, day: str, api_key: str) -> Dict[str, str]:
+    return {
+        "key": api_key,
+        "q": city,
+        # One day per call: forecast.json can only be narrowed to a single date
+        "dt": day,
+        "aqi": "no",
+        "alerts": "no"
+    }
+
+
+def _day_conditions(summary: Dict[str, Any]) -> Dict[str, Any]:
+    # Score the day's averages the same way as current conditions
+    return {"current": {
+        "temp_f": summary.get("avgtemp_f", 0),
+        "condition": summary.get("condition", {}),
+        "humidity": summary.get("avghumidity", 50),
+        "wind_mph": summary.get("maxwind_mph", 0)
+    }}
+
+
+def _forecast_day(data: Dict[str, Any], day: str) -> Dict[str, Any]:
+    forecast_day = next(
+        (d for d in data.get("forecast", {}).get("forecastday", []) if d.get("date") == day), None
+    )
+    if forecast_day is None:
+        return {
+            "error": f"No forecast available for {day}",
+            "status": "error"
+        }
+    summary = forecast_day.get("day", {})
+    model = get_scoring_model()
+    return {
+        "location": data.get("location"),
+        "date": day,
+        "day": summary,
+        "weather_score": model.weather_score(_day_conditions(summary)),
+        "scoring_version": model.version,
+        "error": None,
+        "status": "success"
+    }
+
+
+def rescore_forecast(result: Any) -> Any:
+    """A cached day forecast, re-scored if the scoring model changed since."""
+    return rescore(result, lambda model, data: {"weather_score": model.weather_score(_day_conditions(data["day"]))})
+
+
+@cached("forecast", key_func=forecast_cache_key, rescore=rescore_forecast)
+async def get_forecast_async(city: str, day: str) -> Dict[str, Any]:
+    """
+    Get the forecast for one day using WeatherAPI.
+
+    Cached per (city, day), so overlapping trip windows share their days.
+
+    Args:
+        city (str): City name to get the forecast for
+        day (str): ISO date, between today and FORECAST_MAX_DAYS ahead
+
+    Returns:
+        Dict containing the day's summary and weather score, or error information
+    """
+    api_key = upstream_key("WEATHER_API_KEY")
+
+    if not api_key:
+        return {
+            "error": "Weather API key not configured",
+            "status": "error"
+        }
+
+    try:
+        response = await http_client.async_get(
+            WEATHER_FORECAST_URL, params=_forecast_params(city, day, api_key), timeout=WEATHER_TIMEOUT,
+            provider="weatherapi"
+        )
+        response.raise_for_status()
+
+        return _forecast_day(response.json(), day)
+
+    except BudgetExhausted as e:
+        return budget_exhausted_result(e)
+    except httpx.HTTPError as e:
+        return {
+            "error": f"Weather API request failed: {str(e)}",
+            "status": "error"
+        }
+    except Exception as e:
+        return {
+            "error": f"Unexpected error: {str(e)}",
+            "status": "error"
+        }
+
+
 def calculate_weather_score(weather_data: Dict[str, Any]) -> int:
     """
     Calculate a weather score based on temperature, conditions, and humidity.
-    
+
+    The bands and points come from the current scoring model (see
+    utils/scoring_model.py).
+
     Args:
         weather_data: Weather data from API
-        
+
     Returns:
         Weather score (0-100)
     """
-    try:
-        current = weather_data.get("current", {})
-        temp_f = current.get("temp_f", 0)
-        condition_text = current.get("condition", {}).get("text", "").lower()
-        humidity = current.get("humidity", 50)
-        wind_mph = current.get("wind_mph", 0)
-        
-        # Temperature scoring (0-40 points)
-        if 65 <= temp_f <= 80:
-            temp_score = 40  # Perfect temperature
-        elif 55 <= temp_f < 65 or 80 < temp_f <= 85:
-            temp_score = 30  # Good temperature
-        elif 45 <= temp_f < 55 or 85 < temp_f <= 90:
-            temp_score = 20  # Acceptable temperature
-        else:
-            temp_score = 10  # Poor temperature
-        
-        # Condition scoring (0-40 points)
-        if "sunny" in condition_text or "clear" in condition_text:
-            condition_score = 40
-        elif "partly cloudy" in condition_text or "cloudy" in condition_text:
-            condition_score = 35
-        elif "overcast" in condition_text:
-            condition_score = 25
-        elif "rain" in condition_text or "drizzle" in condition_text:
-            condition_score = 15
-        elif "snow" in condition_text or "sleet" in condition_text:
-            condition_score = 10
-        elif "storm" in condition_text or "thunder" in condition_text:
-            condition_score = 5
-        else:
-            condition_score = 20  # Default for unknown conditions
-        
-        # Humidity scoring (0-20 points)
-        if 30 <= humidity <= 60:
-            humidity_score = 20  # Comfortable humidity
-        elif 20 <= humidity < 30 or 60 < humidity <= 70:
-            humidity_score = 15  # Acceptable humidity
-        else:
-            humidity_score = 10  # Poor humidity
-        
-        total_score = temp_score + condition_score + humidity_score
-        return min(100, max(0, total_score))
-        
-    except Exception:
-        return 50  # Default score if calculation fails
\ No newline at end of file
+    return get_scoring_model().weather_score(weather_data)